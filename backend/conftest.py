@@ -0,0 +1,28 @@
+# conftest.py
+"""
+Shared pytest configuration for the backend tests.
+Run with: python -m pytest -q
+"""
+import inspect
+import pytest
+
+# Manual scripts that need a running server, a live MongoDB, SMTP credentials or an LLM key
+collect_ignore = ["test_api.py", "test_email.py", "test_llm.py", "database/test_db.py"]
+
+def _ignore_sort(add):
+    """Drop the sort argument pymongo 4.9+ passes to bulk updates, which mongomock 4.3 predates"""
+    def add_without_sort(self, *args, sort=None, **kwargs):
+        return add(self, *args, **kwargs)
+    return add_without_sort
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh mongomock database, with the local indexes kept under tmp_path"""
+    mongomock = pytest.importorskip("mongomock")
+    from mongomock.collection import BulkOperationBuilder
+    for name in ("add_update", "add_replace"):
+        add = getattr(BulkOperationBuilder, name)
+        if "sort" not in inspect.signature(add).parameters:
+            monkeypatch.setattr(BulkOperationBuilder, name, _ignore_sort(add))
+    monkeypatch.setattr("rag.local_index.LOCAL_INDEX_DIR", str(tmp_path))
+    return mongomock.MongoClient().db
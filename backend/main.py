@@ -1,5 +1,7 @@
 import os
+import hashlib
 import logging
+import threading
 import flask
 from flask import Flask, jsonify, request
 from flask_cors import CORS 
@@ -9,6 +11,7 @@ from dotenv import load_dotenv
 from datetime import datetime
 from bson import ObjectId
 from openai import OpenAI
+from rag.prompt_builder import build_messages
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -166,15 +169,60 @@ IMPORTANT: Keep your response concise and under 600 tokens (approximately 450 wo
 Use **bold** for sections, *italics* for key words, and space for readability.
 """
 
+# Cached answers are only reused while the prompt and model stay the same
+PROMPT_VERSION = os.getenv('PROMPT_VERSION') or hashlib.sha1(
+    f"{ASTROLOGY_SYSTEM_PROMPT}\x00{os.getenv('OPENAI_MODEL', 'gpt-4o-mini')}".encode('utf-8')
+).hexdigest()[:12]
+
 # Import vector_store
 try:
-    from vector_store import search_similar_pdfs
+    from vector_store import (
+        search_reranked, get_embedding_cache_stats,
+        warmup_embedding_model, get_embedding_model_stats,
+        get_reranker, get_reranker_stats, RERANK_ENABLED,
+        get_retrieval_cache_stats, init_search_backend, get_search_backend_stats,
+        answer_cache, get_answer_cache_stats, is_cacheable_query, ANSWER_CACHE_ENABLED,
+        normalize_filters
+    )
     logger.info("Successfully imported vector_store module")
     HAS_VECTOR_STORE = True
 except ImportError:
     logger.warning("Could not import vector_store module, will use fallback responses")
     HAS_VECTOR_STORE = False
 
+# Collection the chat endpoints retrieve context from
+VECTOR_DB_NAME = os.getenv('VECTOR_DB_NAME', 'vector_db')
+VECTOR_COLLECTION_NAME = os.getenv('VECTOR_COLLECTION_NAME', 'Vectors')
+
+_warmed_up = False
+_warm_up_lock = threading.Lock()
+
+def warm_up():
+    """
+    Load the embedding model (and reranker) and pick the vector search backend
+    once per process, so chat requests pay for neither. Called at server startup
+    rather than on import, so tests and scripts importing this module don't load models.
+    """
+    global _warmed_up
+    with _warm_up_lock:
+        if _warmed_up:
+            return
+        if HAS_VECTOR_STORE:
+            if os.getenv('EMBEDDING_WARMUP', 'True').lower() == 'true':
+                warmup_embedding_model()
+                if RERANK_ENABLED:
+                    get_reranker().warmup()
+            # Probe MongoDB and pick the vector search backend
+            init_search_backend(VECTOR_DB_NAME, VECTOR_COLLECTION_NAME)
+        # Requests arriving meanwhile wait on the lock instead of racing ahead
+        _warmed_up = True
+
+# Under a WSGI server (which never runs __main__) warm up before serving the first request
+@app.before_request
+def ensure_warmed_up():
+    if not _warmed_up:
+        warm_up()
+
 def handle_auth_optional_request():
     """Handle both authenticated and unauthenticated requests"""
     try:
@@ -185,66 +233,49 @@ def handle_auth_optional_request():
     
     return current_user_id
 
-def generate_response_with_rag(user_message, conversation_history=None, birth_details=None, topic=None):
-    """Generate a response using RAG approach"""
+def generate_response_with_rag(user_message, conversation_history=None, birth_details=None, topic=None, cache_answer=False,
+                               filters=None):
+    """
+    Generate a response using RAG approach, optionally storing it in the answer cache
+
+    filters ({field: value or values} over filename, pdf_id and topic) restricts
+    the knowledge base searched for context.
+    """
     try:
         # Get relevant documents from vector store if available
-        context = ""
+        context_chunks = []
+        empty_context = None
         if HAS_VECTOR_STORE:
             try:
-                # Get vector database name from environment variables
-                vector_db_name = os.getenv('VECTOR_DB_NAME', 'vector_db')
-                vector_collection_name = os.getenv('VECTOR_COLLECTION_NAME', 'Vectors')
-                
-                relevant_documents = search_similar_pdfs(
+                relevant_documents = search_reranked(
                     user_message, 
                     top_k=5,
-                    db_name=vector_db_name,
-                    collection_name=vector_collection_name
+                    db_name=VECTOR_DB_NAME,
+                    collection_name=VECTOR_COLLECTION_NAME,
+                    filters=filters
                 )
                 
                 if relevant_documents and len(relevant_documents) > 0:
                     logger.info(f"Found {len(relevant_documents)} relevant documents")
-                    context_list = []
-                    for doc in relevant_documents:
-                        if 'text' in doc:
-                            context_list.append(doc['text'])
-                    context = " ".join(context_list)
+                    context_chunks = [hit.text for hit in relevant_documents if hit.text]
                 else:
                     logger.warning("No relevant documents found for the query")
-                    context = "No specific information found in the knowledge base for this query."
+                    empty_context = "No specific information found in the knowledge base for this query."
             except Exception as e:
                 logger.error(f"Error searching vector store: {str(e)}")
-                context = "Error accessing knowledge base."
-        
-        # Build messages array for OpenAI
-        messages = [{"role": "system", "content": ASTROLOGY_SYSTEM_PROMPT}]
-        
-        # Add birth details if available
-        if birth_details:
-            birth_context = f"""
-            The user has provided these birth details:
-            Date: {birth_details.get('date', 'Not provided')}
-            Time: {birth_details.get('time', 'Not provided')}
-            Place: {birth_details.get('place', 'Not provided')}
-            
-            Use these details in your analysis when relevant.
-            """
-            messages.append({"role": "system", "content": birth_context})
+                empty_context = "Error accessing knowledge base."
         
-        # Add context from RAG if available
-        if context:
-            messages.append({"role": "system", "content": f"Use the following context from Vedic astrology texts to inform your answer: {context}"})
-        
-        # Add conversation history
-        if conversation_history:
-            for msg in conversation_history[-5:]:  # Last 5 messages
-                messages.append({"role": msg["role"], "content": msg["content"]})
-        
-        # Add the user message
-        messages.append({"role": "user", "content": user_message})
+        # Build messages array for OpenAI within the input token budget
+        messages, token_report = build_messages(
+            ASTROLOGY_SYSTEM_PROMPT,
+            user_message,
+            birth_details=birth_details,
+            context_chunks=context_chunks,
+            conversation_history=conversation_history,
+            empty_context=empty_context
+        )
         
-        logger.info(f"Sending request to OpenAI with {len(messages)} messages")
+        logger.info(f"Sending request to OpenAI with {len(messages)} messages ({token_report['total']} tokens)")
         
         # Get response from OpenAI with max_tokens set to 600
         response = openai_client.chat.completions.create(
@@ -256,6 +287,12 @@ def generate_response_with_rag(user_message, conversation_history=None, birth_de
         
         response_text = response.choices[0].message.content
         logger.info(f"Received response from OpenAI: {response_text[:50]}...")
+        
+        if cache_answer:
+            try:
+                answer_cache.put(user_message, response_text, topic, PROMPT_VERSION)
+            except Exception as e:
+                logger.error(f"Error caching answer: {str(e)}")
         return response_text
     
     except Exception as e:
@@ -342,6 +379,17 @@ def direct_chat_query():
         birth_details = data.get('birth_details', {})
         conversation_history = data.get('conversation_history', [])
         topic = data.get('topic')  # Get topic if provided
+        filters = data.get('filters')  # Restrict retrieval to some files/topics
+        if filters is not None and HAS_VECTOR_STORE:
+            try:
+                if not isinstance(filters, dict):
+                    raise ValueError("filters must be an object of field: value(s)")
+                filters = normalize_filters(filters)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
         
         logger.info(f"Processing message: {user_message[:30]}...")
         if topic:
@@ -350,9 +398,34 @@ def direct_chat_query():
         # Check for authentication
         current_user_id = handle_auth_optional_request()
         
+        # Generic questions without birth details can be answered from the cache,
+        # unless the client asks to bypass it
+        bypass_cache = bool(data.get('bypass_cache')) or 'no-cache' in request.headers.get('Cache-Control', '')
+        use_answer_cache = (
+            HAS_VECTOR_STORE and ANSWER_CACHE_ENABLED and not bypass_cache and not filters
+            and is_cacheable_query(user_message, birth_details, conversation_history)
+        )
+        if use_answer_cache:
+            try:
+                cached = answer_cache.get(user_message, topic, PROMPT_VERSION)
+            except Exception as e:
+                logger.error(f"Error reading answer cache: {str(e)}")
+                cached = None
+            if cached:
+                logger.info(f"Answer cache hit (similarity {cached['similarity']:.3f})")
+                return jsonify({
+                    'success': True,
+                    'response': cached['answer'],
+                    'cached': True,
+                    'conversation_id': conversation_id or f'direct-{datetime.utcnow().timestamp()}'
+                }), 200
+        
         # For unauthenticated users or fallback
         logger.info("Using RAG for direct query flow")
-        response_text = generate_response_with_rag(user_message, conversation_history, birth_details, topic)
+        response_text = generate_response_with_rag(
+            user_message, conversation_history, birth_details, topic, cache_answer=use_answer_cache,
+            filters=filters
+        )
         
         return jsonify({
             'success': True,
@@ -422,6 +495,22 @@ def health_check():
         'version': flask.__version__
     }), 200
 
+@app.route('/api/rag/stats')
+def rag_stats():
+    """Cache and retrieval counters for the RAG pipeline"""
+    if not HAS_VECTOR_STORE:
+        return jsonify({'success': False, 'error': 'Vector store not available'}), 503
+    
+    return jsonify({
+        'success': True,
+        'embedding_cache': get_embedding_cache_stats(),
+        'embedding_models': get_embedding_model_stats(),
+        'search_backend': get_search_backend_stats(VECTOR_DB_NAME, VECTOR_COLLECTION_NAME),
+        'reranker': get_reranker_stats(),
+        'retrieval_cache': get_retrieval_cache_stats(),
+        'answer_cache': get_answer_cache_stats()
+    }), 200
+
 # Simple contact form submission endpoint
 @app.route('/api/contact/direct-submit', methods=['POST'])
 def direct_submit_contact():
@@ -483,5 +572,8 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('DEBUG', 'True').lower() == 'true'
     
+    # With the debug reloader, only the process serving requests warms up
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
     logger.info(f"Starting server on {host}:{port}")
     app.run(host=host, port=port, debug=debug)
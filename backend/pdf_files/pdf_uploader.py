@@ -5,15 +5,31 @@ This approach bypasses file system issues by storing PDFs directly in the databa
 """
 import os
 import sys
+import shutil
 import logging
+import tempfile
+from contextlib import contextmanager
 from pymongo import MongoClient
-from gridfs import GridFS
+from gridfs import GridFS, DEFAULT_CHUNK_SIZE
 from bson.objectid import ObjectId
-from PyPDF2 import PdfReader
-from io import BytesIO
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+
+# Make the backend's rag package importable when run from pdf_files/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.local_index import LocalIndexWriter, reset_local_index
+from rag.search_backends import get_backend
+from rag.incremental import IncrementalIngestion, file_sha256, INGESTION_STATE_COLLECTION
+from rag.ingestion import (
+    iter_embedded_batches, iter_text_chunks, iter_resumable_chunks, prefetch, EMBEDDING_BATCH_SIZE
+)
+from rag.ingestion_jobs import IngestionJob
+from rag.pdf_extraction import iter_pdf_pages, count_pages, PdfPageExtractor, PDF_WORKERS
+from rag.bulk_writer import BulkWriter
+from rag.embedding_codec import encode_embedding, migrate_embeddings, STORAGE_FIELDS
+from rag.embedding_cache import EmbeddingCache
+from rag.retrieval_cache import index_versions
+from rag.embedding_models import get_embedding_model, model_key
+from rag.chunking import get_text_splitter
 
 # Configure logging
 logging.basicConfig(
@@ -25,17 +41,29 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Text splitter for chunking documents
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=200, chunk_overlap=16
-)
+# Size of the GridFS chunks PDFs are stored in; larger chunks mean fewer
+# documents (and round trips) per file, smaller ones less memory per read
+GRIDFS_CHUNK_SIZE_BYTES = int(os.getenv("GRIDFS_CHUNK_SIZE_BYTES", str(DEFAULT_CHUNK_SIZE)))
+# Directory GridFS files are spooled to for extraction (defaults to the system temp dir)
+GRIDFS_SPOOL_DIR = os.getenv("GRIDFS_SPOOL_DIR") or None
+
+# Text splitter for chunking documents (configured by the CHUNK_* settings)
+text_splitter = get_text_splitter()
 
-# Initialize embedding model
-embedding_model = HuggingFaceEmbeddings(model_name='thenlper/gte-large')
+# Cache of query embeddings, keyed by normalized query text
+embedding_cache = EmbeddingCache(model_key())
 
 def generate_embedding(text):
     """Generate embedding vector for text"""
-    return embedding_model.embed_query(text)
+    return get_embedding_model().embed_query(text)
+
+def generate_query_embedding(query):
+    """Generate embedding vector for a search query, reusing cached results"""
+    embedding = embedding_cache.get(query)
+    if embedding is None:
+        embedding = generate_embedding(query)
+        embedding_cache.put(query, embedding)
+    return embedding
 
 def connect_to_mongodb():
     """Connect to MongoDB and return client, db, GridFS, and collections"""
@@ -67,8 +95,8 @@ def connect_to_mongodb():
         logger.error(f"MongoDB connection error: {str(e)}")
         raise
 
-def upload_pdf(file_path):
-    """Upload a PDF file to MongoDB GridFS"""
+def upload_pdf(file_path, topic=None):
+    """Upload a PDF file to MongoDB GridFS, optionally tagged with a topic searches can filter on"""
     try:
         # Validate file
         if not os.path.exists(file_path):
@@ -82,20 +110,30 @@ def upload_pdf(file_path):
         # Connect to MongoDB
         client, db, fs, pdf_collection, _ = connect_to_mongodb()
         
-        # Check if file already exists (by name)
+        # Check if file already exists (by name and content)
         filename = os.path.basename(file_path)
+        sha256 = file_sha256(file_path)
         existing_file = pdf_collection.find_one({"filename": filename})
         if existing_file:
-            logger.info(f"File '{filename}' already exists with ID: {existing_file['_id']}")
-            return str(existing_file['_id'])
+            existing_sha256 = (existing_file.get("metadata") or {}).get("sha256")
+            if existing_sha256 is None:
+                existing_sha256 = file_sha256(fs.get(existing_file['_id']))
+            if existing_sha256 == sha256:
+                logger.info(f"File '{filename}' already exists with ID: {existing_file['_id']}")
+                return str(existing_file['_id'])
+            
+            # Replace the old version so the corrected file gets ingested
+            logger.info(f"File '{filename}' changed, replacing ID: {existing_file['_id']}")
+            fs.delete(existing_file['_id'])
             
-        # Read file and upload to GridFS
+        # Stream the file to GridFS one chunk at a time
         with open(file_path, 'rb') as f:
-            file_data = f.read()
             file_id = fs.put(
-                file_data, 
+                f, 
                 filename=filename,
-                content_type="application/pdf"
+                content_type="application/pdf",
+                chunk_size=GRIDFS_CHUNK_SIZE_BYTES,
+                metadata={"sha256": sha256, **({"topic": topic} if topic else {})}
             )
             
         logger.info(f"Uploaded file '{filename}' with ID: {file_id}")
@@ -107,7 +145,35 @@ def upload_pdf(file_path):
         logger.error(traceback.format_exc())
         return None
         
-def process_pdf_from_gridfs(file_id):
+@contextmanager
+def spool_gridfs_file(fs, file_id):
+    """
+    Copy a PDF stored in GridFS to a temporary file, removed on exit
+
+    GridFS chunks are fetched and written one at a time, so the file is never
+    held in memory; extraction then memory-maps the copy (and worker
+    processes can read page ranges of it in parallel).
+    """
+    grid_file = fs.get(file_id)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", dir=GRIDFS_SPOOL_DIR, delete=False) as tmp_file:
+        shutil.copyfileobj(grid_file, tmp_file, grid_file.chunk_size)
+    try:
+        yield tmp_file.name
+    finally:
+        os.remove(tmp_file.name)
+
+def iter_gridfs_chunks(fs, file_id, workers=PDF_WORKERS):
+    """
+    Stream the text chunks of a PDF stored in GridFS
+
+    Pages are chunked as they arrive and the temporary copy of the file is
+    removed once the generator finishes.
+    """
+    with spool_gridfs_file(fs, file_id) as pdf_path:
+        pages = (page_text for _, page_text in iter_pdf_pages([pdf_path], workers=workers))
+        yield from iter_text_chunks(pages, text_splitter)
+
+def process_pdf_from_gridfs(file_id, workers=PDF_WORKERS):
     """Process a PDF from GridFS and extract text chunks"""
     try:
         # Connect to MongoDB
@@ -121,22 +187,8 @@ def process_pdf_from_gridfs(file_id):
             logger.error(f"File with ID {file_id} not found in GridFS")
             return []
             
-        # Get file data
-        grid_file = fs.get(file_id)
-        pdf_data = grid_file.read()
-        
-        # Extract text from PDF
-        pdf_file = BytesIO(pdf_data)
-        reader = PdfReader(pdf_file)
-        
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text
-                
-        # Split text into chunks
-        chunks = text_splitter.split_text(text)
+        # Extract and split text into chunks
+        chunks = list(iter_gridfs_chunks(fs, file_id, workers=workers))
         
         logger.info(f"Extracted {len(chunks)} text chunks from PDF with ID: {file_id}")
         return chunks
@@ -147,59 +199,161 @@ def process_pdf_from_gridfs(file_id):
         logger.error(traceback.format_exc())
         return []
 
-def process_and_embed_all_pdfs():
-    """Process all PDFs in GridFS and create vector embeddings"""
+def start_ingestion_job(db, fs, pdf_collection, ingestion):
+    """
+    Start a job over the PDFs changed since the last ingestion
+
+    Returns:
+        IngestionJob: The job, or None if there are no PDFs
+    """
+    pdf_files = list(pdf_collection.find())
+    if not pdf_files:
+        logger.error("No PDF files found in GridFS")
+        return None
+
+    logger.info(f"Found {len(pdf_files)} PDF files in GridFS")
+    files = []
+    for pdf_file in pdf_files:
+        file_id = pdf_file['_id']
+        filename = pdf_file['filename']
+        sha256 = (pdf_file.get("metadata") or {}).get("sha256") or file_sha256(fs.get(file_id))
+        if not ingestion.file_changed(filename, sha256):
+            logger.info(f"Skipping unchanged PDF: {filename}")
+            continue
+        files.append({
+            "pdf_id": str(file_id),
+            "filename": filename,
+            "sha256": sha256,
+            "length": pdf_file.get("length", 0),
+            "topic": (pdf_file.get("metadata") or {}).get("topic"),
+        })
+    return IngestionJob.create(db, files)
+
+def process_and_embed_all_pdfs(batch_size=EMBEDDING_BATCH_SIZE, resume=False):
+    """
+    Process all PDFs in GridFS and create vector embeddings
+
+    Runs as a checkpointed ingestion job; with resume=True the latest
+    unfinished job continues from its checkpoint instead of starting over.
+
+    Returns:
+        int: Number of new chunks written (0 when nothing changed), or None
+            if ingestion failed or chunks couldn't be embedded
+    """
+    job = None
     try:
         # Connect to MongoDB
         client, db, fs, pdf_collection, vector_collection = connect_to_mongodb()
+        index_writer = LocalIndexWriter(vector_collection)
         
-        # Get all PDF files in GridFS
-        pdf_files = list(pdf_collection.find())
-        if not pdf_files:
-            logger.error("No PDF files found in GridFS")
-            return 0
-            
-        logger.info(f"Found {len(pdf_files)} PDF files in GridFS")
+        if resume:
+            job = IngestionJob.latest_unfinished(db)
+            if job is None:
+                logger.info("No unfinished ingestion job to resume")
+                return 0
+            # Only chunks not already stored are embedded
+            ingestion = IncrementalIngestion(
+                db, vector_collection, job_id=job.job_id, resume_from=job.resume_from(), source="gridfs"
+            )
+            for entry in job.files:
+                ingestion.track_file(entry["filename"], entry["sha256"])
+        else:
+            # Only files changed since the last run are extracted, and only
+            # chunks not already stored are embedded
+            ingestion = IncrementalIngestion(db, vector_collection, source="gridfs")
+            job = start_ingestion_job(db, fs, pdf_collection, ingestion)
+            if job is None:
+                # Nothing left in GridFS: forget whatever was ingested from it
+                if ingestion.commit(current_files=[])["files_removed"]:
+                    index_versions.bump(db, vector_collection.name)
+                return None
+            ingestion.job_id = job.job_id
+        job.on_checkpoint = ingestion.flush_updates
         
-        # Process each PDF and create vector embeddings
-        total_chunks = 0
-        for pdf_file in pdf_files:
-            file_id = pdf_file['_id']
-            filename = pdf_file['filename']
-            
-            logger.info(f"Processing PDF: {filename}")
-            
-            # Extract text chunks from PDF
-            chunks = process_pdf_from_gridfs(file_id)
-            if not chunks:
-                logger.warning(f"No text chunks extracted from {filename}")
-                continue
-                
-            # Create vector embeddings for chunks
-            documents = []
-            for i, chunk in enumerate(chunks):
-                embedding = generate_embedding(chunk)
-                documents.append({
-                    "text": chunk,
-                    "embedding": embedding,
-                    "pdf_id": str(file_id),
-                    "filename": filename,
-                    "chunk_index": i
-                })
-                
-            # Insert into vector collection
-            if documents:
-                vector_collection.insert_many(documents)
-                total_chunks += len(documents)
+        def iter_chunks():
+            """Chunks of the job's PDFs from its checkpoint on, extracted one file at a time"""
+            checkpoint = job.checkpoint
+            # One extraction pool for the whole run rather than one per file
+            with PdfPageExtractor(workers=PDF_WORKERS) as extractor:
+                for file_index in range(checkpoint["file"], len(job.files)):
+                    entry = job.files[file_index]
+                    filename = entry["filename"]
+                    start_page, carry, first_chunk = 0, "", 0
+                    if file_index == checkpoint["file"]:
+                        start_page, carry, first_chunk = checkpoint["page"], checkpoint["carry"], checkpoint["chunk_index"]
+                    
+                    logger.info(f"Processing PDF: {filename}" + (f" from page {start_page}" if start_page else ""))
+                    chunk_count = 0
+                    with spool_gridfs_file(fs, ObjectId(entry["pdf_id"])) as pdf_path:
+                        job.start_file(file_index, count_pages(pdf_path))
+                        pages = (
+                            page_text for _, page_text
+                            in extractor.iter_pages([pdf_path], start_page=start_page)
+                        )
+                        chunks = iter_resumable_chunks(pages, text_splitter, start_page=start_page, carry=carry)
+                        for chunk_index, (chunk, resume_point) in enumerate(chunks, first_chunk):
+                            chunk_count += 1
+                            job.register(file_index, chunk_index, resume_point)
+                            chunk_doc = {
+                                "text": chunk,
+                                "pdf_id": entry["pdf_id"],
+                                "filename": filename,
+                                "chunk_index": chunk_index
+                            }
+                            if entry.get("topic"):
+                                chunk_doc["topic"] = entry["topic"]
+                            yield chunk_doc
+                    job.finish_file(file_index)
+                    if not chunk_count and not first_chunk:
+                        logger.warning(f"No text chunks extracted from {filename}")
+                    else:
+                        logger.info(f"Extracted {chunk_count} chunks from {filename}")
+        
+        def iter_new_chunks():
+            """Chunks that need embedding, reporting the ones kept to the job"""
+            for chunk in ingestion.iter_new_chunks(iter_chunks()):
+                job.passed(chunk)
+                yield chunk
+            job.skipped_rest()
+        
+        def on_written(documents):
+            index_writer.add(documents)
+            job.written(documents)
+        
+        # Extraction runs ahead on a background thread and embedded chunks are
+        # inserted in unordered batches by writer threads (then added to the
+        # local indexes), so the three stages overlap
+        writer = BulkWriter(vector_collection, on_written=on_written)
+        batches = iter_embedded_batches(
+            prefetch(iter_new_chunks()), get_embedding_model().embed_documents, batch_size,
+            on_failed=ingestion.chunk_failed
+        )
+        for batch in batches:
+            writer.put([{**item, **encode_embedding(embedding)} for _, item, embedding in batch])
+        total_chunks = writer.close()
                 
-        logger.info(f"Created vector embeddings for {total_chunks} text chunks")
+        index_writer.close()
+        
+        # Remove chunks that disappeared (and files deleted from GridFS) and
+        # record the new file hashes
+        current_files = [pdf_file["filename"] for pdf_file in pdf_collection.find({}, {"filename": 1})]
+        stats = ingestion.commit(current_files=current_files)
+        index_versions.bump(db, vector_collection.name)
+        if stats["chunks_failed"]:
+            # The job stays resumable from before the first failed chunk
+            job.fail(f"{stats['chunks_failed']} chunks failed to embed")
+            return None
+        job.complete(stats)
+        logger.info(f"Created vector embeddings for {total_chunks} new text chunks")
         return total_chunks
         
     except Exception as e:
         logger.error(f"Error processing PDFs: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        return 0
+        if job is not None:
+            job.fail(e)
+        return None
 
 def list_uploaded_pdfs():
     """List all PDFs uploaded to GridFS"""
@@ -230,44 +384,43 @@ def list_uploaded_pdfs():
     except Exception as e:
         logger.error(f"Error listing PDFs: {str(e)}")
 
-def search_similar_text(query, top_k=3):
-    """Search for similar text chunks based on a query"""
+def search_similar_text(query, top_k=3, filters=None):
+    """Search for similar text chunks based on a query, optionally filtered by filename, pdf_id or topic"""
     try:
         # Connect to MongoDB
         client, db, _, _, vector_collection = connect_to_mongodb()
         
         # Generate query embedding
-        query_embedding = generate_embedding(query)
-        
-        # Perform vector search
-        results = vector_collection.aggregate([
-            {
-                "$search": {
-                    "index": os.getenv("VECTOR_INDEX_NAME", "vectorSearchIndex"),
-                    "knnBeta": {
-                        "vector": query_embedding,
-                        "path": "embedding",
-                        "k": top_k
-                    }
-                }
-            },
-            {
-                "$project": {
-                    "text": 1,
-                    "pdf_id": 1,
-                    "filename": 1,
-                    "chunk_index": 1,
-                    "score": { "$meta": "searchScore" }
-                }
-            }
-        ])
-        
-        return list(results)
+        query_embedding = generate_query_embedding(query)
+        
+        # Search through the backend selected for the collection
+        return get_backend(vector_collection).search(query_embedding, top_k, filters=filters)
         
     except Exception as e:
         logger.error(f"Error searching similar text: {str(e)}")
         return []
 
+def migrate_vector_store(storage):
+    """
+    Re-encode the stored embeddings in another EMBEDDING_STORAGE format
+
+    Returns:
+        dict: Counts of migrated and skipped documents, or None on error
+    """
+    try:
+        # Connect to MongoDB
+        client, db, _, _, vector_collection = connect_to_mongodb()
+        
+        counts = migrate_embeddings(vector_collection, storage)
+        
+        # Local indexes keep their float32 vectors; let cached results refresh
+        index_versions.bump(db, vector_collection.name)
+        return counts
+        
+    except Exception as e:
+        logger.error(f"Error migrating embeddings: {str(e)}")
+        return None
+
 def clear_vector_store():
     """Clear all vector embeddings but keep PDF files"""
     try:
@@ -279,6 +432,11 @@ def clear_vector_store():
         
         # Delete all documents
         result = vector_collection.delete_many({})
+        reset_local_index(vector_collection)
+        
+        # Forget ingested file hashes so every PDF is embedded again next time
+        db[INGESTION_STATE_COLLECTION].delete_many({})
+        index_versions.bump(db, vector_collection.name)
         
         logger.info(f"Deleted {result.deleted_count}/{count_before} vector embeddings")
         return result.deleted_count
@@ -294,10 +452,12 @@ if __name__ == "__main__":
     
     if len(sys.argv) < 2:
         print("\nUsage:")
-        print("  python pdf_uploader.py upload <pdf_file1> [pdf_file2 ...]")
+        print("  python pdf_uploader.py upload [--topic <topic>] <pdf_file1> [pdf_file2 ...]")
         print("  python pdf_uploader.py process")
+        print("  python pdf_uploader.py resume")
         print("  python pdf_uploader.py list")
         print("  python pdf_uploader.py search \"<query>\"")
+        print(f"  python pdf_uploader.py migrate <{'|'.join(STORAGE_FIELDS)}>")
         print("  python pdf_uploader.py clear")
         sys.exit(1)
         
@@ -309,8 +469,11 @@ if __name__ == "__main__":
             sys.exit(1)
             
         files = sys.argv[2:]
+        topic = None
+        if files[0] == "--topic" and len(files) > 2:
+            topic, files = files[1], files[2:]
         for file_path in files:
-            file_id = upload_pdf(file_path)
+            file_id = upload_pdf(file_path, topic)
             if file_id:
                 print(f"✅ Uploaded {os.path.basename(file_path)} (ID: {file_id})")
             else:
@@ -319,10 +482,22 @@ if __name__ == "__main__":
     elif command == "process":
         print("\nProcessing PDFs and creating vector embeddings...")
         chunk_count = process_and_embed_all_pdfs()
-        if chunk_count > 0:
+        if chunk_count is None:
+            print("❌ Failed to process PDFs")
+        elif chunk_count > 0:
             print(f"✅ Successfully processed {chunk_count} text chunks")
         else:
-            print("❌ Failed to process PDFs")
+            print("✅ No new or changed PDFs to process")
+            
+    elif command == "resume":
+        print("\nResuming the last unfinished ingestion job...")
+        chunk_count = process_and_embed_all_pdfs(resume=True)
+        if chunk_count is None:
+            print("❌ Failed to process PDFs (see the log for the job's state)")
+        elif chunk_count > 0:
+            print(f"✅ Successfully processed {chunk_count} text chunks")
+        else:
+            print("✅ Nothing left to process")
             
     elif command == "list":
         list_uploaded_pdfs()
@@ -349,6 +524,20 @@ if __name__ == "__main__":
                 print(f"Score: {result.get('score', 0):.4f}")
                 print("-" * 80)
                 
+    elif command == "migrate":
+        if len(sys.argv) < 3 or sys.argv[2].lower() not in STORAGE_FIELDS:
+            print(f"Error: Please specify the embedding storage ({', '.join(STORAGE_FIELDS)})")
+            sys.exit(1)
+            
+        storage = sys.argv[2].lower()
+        print(f"\nMigrating embeddings to {storage}...")
+        counts = migrate_vector_store(storage)
+        if counts is not None:
+            print(f"✅ Migrated {counts['migrated']} embeddings ({counts['skipped']} already {storage})")
+            print(f"Set EMBEDDING_STORAGE={storage} so new embeddings are written the same way")
+        else:
+            print("❌ Failed to migrate embeddings")
+            
     elif command == "clear":
         confirm = input("Are you sure you want to clear all vector embeddings? (yes/no): ")
         if confirm.lower() == "yes":
@@ -359,4 +548,4 @@ if __name__ == "__main__":
             
     else:
         print(f"Unknown command: {command}")
-        print("Available commands: upload, process, list, search, clear")
\ No newline at end of file
+        print("Available commands: upload, process, resume, list, search, migrate, clear")
\ No newline at end of file
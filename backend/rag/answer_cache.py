@@ -0,0 +1,175 @@
+# rag/answer_cache.py
+"""
+Semantic cache of chat answers.
+Generic questions ("what are the nine grahas") make up much of the traffic,
+and each costs a full LLM round trip. Answers to impersonal questions are
+stored with the question's embedding, topic and prompt version; a later
+question is answered from the cache when its embedding is similar enough to
+a stored one with the same topic and prompt version.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds, 0 = never expire
+# Minimum cosine similarity between two questions to reuse an answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Questions that mention a birth, a date or a time are about someone's chart
+_PERSONAL = re.compile(
+    r"\b(born|birth|dob|my (chart|kundli|horoscope|ascendant|lagna|moon|sun|dasha?))\b"
+    r"|\b\d{1,2}[/.:-]\d{1,2}([/.-]\d{2,4})?\b",
+    re.IGNORECASE
+)
+
+def has_birth_details(birth_details):
+    """Whether a request carries any birth detail"""
+    if not birth_details:
+        return False
+    if isinstance(birth_details, dict):
+        return any(str(value).strip() for value in birth_details.values() if value is not None)
+    return True
+
+def is_cacheable_query(query, birth_details=None, conversation_history=None):
+    """
+    Only standalone, impersonal questions may be answered from the cache: no
+    birth details, no earlier turns the answer could depend on, and no dates
+    or birth mentions in the question itself
+    """
+    if has_birth_details(birth_details) or conversation_history:
+        return False
+    return not _PERSONAL.search(query or "")
+
+class SemanticAnswerCache:
+    """
+    Bounded LRU of answers, searched by cosine similarity of question
+    embeddings held in one preallocated matrix
+    """
+
+    def __init__(self, embed, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.embed = embed
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._vectors = None
+        self._entries = OrderedDict()  # slot -> entry, least recently used first
+        self._free = list(range(max_size - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _query_vector(self, query):
+        vector = np.asarray(self.embed(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(self, query, topic=None, prompt_version=None):
+        """
+        Find a cached answer for a similar question
+
+        Returns:
+            dict: {"answer", "query", "similarity", "hits"}, or None
+        """
+        if self.max_size <= 0:
+            return None
+        vector = self._query_vector(query)
+        now = time.time()
+
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            slots = np.fromiter(self._entries.keys(), dtype=np.intp, count=len(self._entries))
+            similarities = self._vectors[slots] @ vector
+            for position in np.argsort(-similarities):
+                similarity = float(similarities[position])
+                if similarity < self.threshold:
+                    break
+                slot = int(slots[position])
+                entry = self._entries[slot]
+                if entry["topic"] != topic or entry["prompt_version"] != prompt_version:
+                    continue
+                if self.ttl > 0 and now - entry["created_at"] > self.ttl:
+                    self._remove(slot)
+                    self.expired += 1
+                    continue
+
+                entry["hits"] += 1
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                return {
+                    "answer": entry["answer"],
+                    "query": entry["query"],
+                    "similarity": similarity,
+                    "hits": entry["hits"],
+                }
+
+            self.misses += 1
+            return None
+
+    def put(self, query, answer, topic=None, prompt_version=None):
+        """Store the answer to a question"""
+        if self.max_size <= 0 or not answer:
+            return
+        vector = self._query_vector(query)
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+            if not self._free:
+                slot = next(iter(self._entries))
+                self._remove(slot)
+                self.evictions += 1
+
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = {
+                "query": query,
+                "answer": answer,
+                "topic": topic,
+                "prompt_version": prompt_version,
+                "created_at": time.time(),
+                "hits": 0,
+            }
+
+    def _remove(self, slot):
+        del self._entries[slot]
+        self._free.append(slot)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._free = list(range(self.max_size - 1, -1, -1))
+
+    def stats(self, top=10):
+        """Counters for monitoring the cache, with the most reused entries"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            popular = sorted(self._entries.values(), key=lambda entry: entry["hits"], reverse=True)[:top]
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "top_entries": [
+                    {"query": entry["query"], "topic": entry["topic"], "hits": entry["hits"]}
+                    for entry in popular
+                ],
+            }
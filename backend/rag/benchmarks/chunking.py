@@ -0,0 +1,128 @@
+# rag/benchmarks/chunking.py
+"""
+Chunk-size benchmark.
+Chunks the bundled books with each configuration, embeds the chunks into a
+temporary local index and reports, as JSON, the number of chunks, index size
+on disk, ingest time (chunking, embedding and indexing), query latency
+(query embedding plus search) and the hit rate over the labelled queries.
+Runs offline, without MongoDB:
+    python -m rag.benchmarks.chunking [unit:size/overlap:boundary ...]
+e.g.
+    python -m rag.benchmarks.chunking chars:200/16:recursive tokens:256/32:sentence
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import numpy as np
+from rag.chunking import get_text_splitter, get_token_counter, describe_splitter
+from rag.embedding_models import get_embedding_model, model_key
+from rag.local_index import LocalVectorIndex
+from rag.benchmarks.fixture import (
+    load_queries, bundled_pdf_paths, extract_documents, chunk_documents, embed_into_index,
+    first_relevant_rank, percentiles, directory_bytes
+)
+
+logger = logging.getLogger(__name__)
+
+# The legacy splitter first, then token-sized chunks up to the model's window
+DEFAULT_CONFIGS = (
+    "chars:200/16:recursive",
+    "tokens:128/16:sentence",
+    "tokens:256/32:sentence",
+    "tokens:384/48:sentence",
+    "tokens:500/50:paragraph",
+)
+BENCHMARK_TOP_K = int(os.getenv("BENCHMARK_TOP_K", "5"))
+
+def parse_config(label):
+    """Parse "unit:size/overlap:boundary" into get_text_splitter arguments"""
+    try:
+        unit, sizes, boundary = label.split(":")
+        chunk_size, chunk_overlap = (int(value) for value in sizes.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid chunking configuration {label!r}, expected unit:size/overlap:boundary")
+    return {"unit": unit, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "boundary": boundary}
+
+def benchmark_chunking(config, documents, queries, embeddings, top_k=BENCHMARK_TOP_K):
+    """
+    Ingest the documents with one chunking configuration and measure it
+
+    Args:
+        config (dict): get_text_splitter arguments
+        documents (list): (filename, [page texts]) tuples
+        queries (list): Labelled queries from load_queries()
+        embeddings: Model with embed_documents and embed_query
+        top_k (int): Results retrieved per query
+
+    Returns:
+        dict: Measurements of the configuration
+    """
+    text_splitter = get_text_splitter(**config)
+    index_dir = tempfile.mkdtemp(prefix="chunking-benchmark-")
+    try:
+        started = time.perf_counter()
+        chunks = chunk_documents(documents, text_splitter)
+        chunk_seconds = time.perf_counter() - started
+
+        index = LocalVectorIndex(index_dir, quantization="none")
+        embed_into_index(chunks, embeddings, index)
+        ingest_seconds = time.perf_counter() - started
+        index.save()
+        index_bytes = directory_bytes(index_dir)
+
+        latencies_ms = []
+        hits = 0
+        for entry in queries:
+            started = time.perf_counter()
+            results = index.search(embeddings.embed_query(entry["query"]), top_k)
+            latencies_ms.append((time.perf_counter() - started) * 1000)
+            if first_relevant_rank(results, entry["answer_phrases"]) is not None:
+                hits += 1
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    count_tokens = get_token_counter()
+    token_counts = np.asarray([count_tokens(chunk["text"]) for chunk in chunks] or [0])
+    return {
+        "config": describe_splitter(**config),
+        "chunks": len(chunks),
+        "mean_chunk_tokens": round(float(token_counts.mean()), 1),
+        "max_chunk_tokens": int(token_counts.max()),
+        "index_bytes": index_bytes,
+        "chunk_seconds": round(chunk_seconds, 3),
+        "ingest_seconds": round(ingest_seconds, 3),
+        "query_latency_ms": percentiles(latencies_ms, (50, 95)),
+        "top_k": top_k,
+        f"hit_rate@{top_k}": hits / len(queries) if queries else 0.0,
+    }
+
+def run(labels=DEFAULT_CONFIGS, pdf_paths=None, embeddings=None, top_k=BENCHMARK_TOP_K):
+    """Benchmark every chunking configuration over the same extracted text"""
+    pdf_paths = pdf_paths or bundled_pdf_paths()
+    embeddings = embeddings or get_embedding_model()
+    queries = load_queries()
+    configs = [parse_config(label) for label in labels]
+
+    started = time.perf_counter()
+    documents = extract_documents(pdf_paths)
+    extract_seconds = time.perf_counter() - started
+
+    results = []
+    for config in configs:
+        logger.info(f"Benchmarking chunking {describe_splitter(**config)}")
+        results.append(benchmark_chunking(config, documents, queries, embeddings, top_k))
+    return {
+        "model": model_key(),
+        "pdfs": [os.path.basename(path) for path in pdf_paths],
+        "queries": len(queries),
+        "extract_seconds": round(extract_seconds, 3),
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run(sys.argv[1:] or DEFAULT_CONFIGS), indent=2))
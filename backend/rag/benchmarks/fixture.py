@@ -0,0 +1,101 @@
+# rag/benchmarks/fixture.py
+"""
+Labelled retrieval queries over the bundled books, and the helpers the
+benchmarks share.
+A query is answered by any chunk containing one of its answer phrases
+(distinctive passages of the books, compared case- and whitespace-insensitively),
+so the labels stay valid whatever the chunking.
+"""
+import os
+import re
+import json
+import glob
+from itertools import groupby
+from operator import itemgetter
+import numpy as np
+from rag.ingestion import iter_text_chunks, iter_embedded_batches, EMBEDDING_BATCH_SIZE
+from rag.pdf_extraction import iter_pdf_pages, PDF_WORKERS
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERIES_PATH = os.path.join(BENCHMARK_DIR, "queries.json")
+PDF_FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(BENCHMARK_DIR)), "pdf_files")
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize(text):
+    """Casefolded text with runs of whitespace collapsed"""
+    return _WHITESPACE.sub(" ", text or "").strip().casefold()
+
+def load_queries(path=QUERIES_PATH):
+    """Labelled queries: [{"query", "answer_phrases"}]"""
+    with open(path, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    for entry in queries:
+        entry["answer_phrases"] = [normalize(phrase) for phrase in entry["answer_phrases"]]
+    return queries
+
+def bundled_pdf_paths():
+    """The PDFs shipped in pdf_files/"""
+    return sorted(glob.glob(os.path.join(PDF_FILES_DIR, "*.pdf")))
+
+def is_relevant(text, answer_phrases):
+    """Whether a chunk text answers a query"""
+    text = normalize(text)
+    return any(phrase in text for phrase in answer_phrases)
+
+def first_relevant_rank(results, answer_phrases):
+    """1-based rank of the first relevant result, or None"""
+    for rank, result in enumerate(results, 1):
+        if is_relevant(result.get("text", ""), answer_phrases):
+            return rank
+    return None
+
+def percentiles(samples_ms, points=(50, 95, 99)):
+    """Latency percentiles in milliseconds, e.g. {"p50": 1.2, "p95": 3.4}"""
+    if not samples_ms:
+        return {f"p{point}": None for point in points}
+    values = np.percentile(np.asarray(samples_ms, dtype=np.float64), points)
+    return {f"p{point}": round(float(value), 3) for point, value in zip(points, values)}
+
+def directory_bytes(path):
+    """Total size of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+def extract_documents(pdf_paths, workers=PDF_WORKERS):
+    """
+    Page texts of each PDF, extracted once and shared by every configuration
+
+    Returns:
+        list: (filename, [page texts]) tuples
+    """
+    pages = iter_pdf_pages(pdf_paths, workers=workers)
+    return [
+        (os.path.basename(pdf_path), [page_text for _, page_text in document_pages])
+        for pdf_path, document_pages in groupby(pages, key=itemgetter(0))
+    ]
+
+def chunk_documents(documents, text_splitter):
+    """Chunk documents the way ingestion does: [{"text", "filename", "chunk_index"}]"""
+    chunks = []
+    for filename, pages in documents:
+        for chunk_index, chunk in enumerate(iter_text_chunks(pages, text_splitter)):
+            chunks.append({"text": chunk, "filename": filename, "chunk_index": chunk_index})
+    return chunks
+
+def embed_into_index(chunks, embeddings, index, batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Embed chunks and add them to a local index; each chunk gets a stable
+    "_id" (its position) so retrievers can be fused
+
+    Returns:
+        int: Number of chunks indexed
+    """
+    added = 0
+    for batch in iter_embedded_batches(chunks, embeddings.embed_documents, batch_size):
+        added += index.add_documents([
+            {**chunk, "_id": str(i), "embedding": embedding} for i, chunk, embedding in batch
+        ])
+    return added
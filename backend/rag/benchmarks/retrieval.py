@@ -0,0 +1,297 @@
+# rag/benchmarks/retrieval.py
+"""
+Offline retrieval evaluation.
+The bundled books are chunked with the configured splitter and embedded once;
+every retrieval configuration (local index backend, hybrid BM25 fusion,
+cross-encoder reranking, k) then answers the labelled queries, and the report
+gives recall@k, hit rate, MRR and p50/p95/p99 retrieval latency as JSON, plus
+the throughput of batched (search_many) against one-by-one vector search and
+the memory held by the results of a search.
+Nothing touches MongoDB, so the suite can gate regressions:
+    python -m rag.benchmarks.retrieval run [report.json]
+    python -m rag.benchmarks.retrieval check baseline.json
+check exits with status 1 when quality drops or latency grows past the
+BENCHMARK_* tolerances compared to a saved report.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+import tracemalloc
+from rag.chunking import get_text_splitter, describe_splitter
+from rag.embedding_models import get_embedding_model, model_key
+from rag.local_index import LocalVectorIndex, IVFVectorIndex
+from rag.bm25_index import (
+    BM25Index, reciprocal_rank_fusion, HYBRID_VECTOR_WEIGHT, HYBRID_BM25_WEIGHT, HYBRID_FETCH_FACTOR
+)
+from rag.reranker import get_reranker, RERANK_CANDIDATES
+from rag.benchmarks.fixture import (
+    load_queries, bundled_pdf_paths, extract_documents, chunk_documents, embed_into_index,
+    first_relevant_rank, is_relevant, percentiles
+)
+
+logger = logging.getLogger(__name__)
+
+# Local index backends: index class and constructor arguments
+BACKENDS = {
+    "local": (LocalVectorIndex, {"quantization": "none"}),
+    "local-int8": (LocalVectorIndex, {"quantization": "int8"}),
+    "local-pq": (LocalVectorIndex, {"quantization": "pq"}),
+    "ivf": (IVFVectorIndex, {"quantization": "none"}),
+}
+BENCHMARK_BACKENDS = os.getenv("BENCHMARK_BACKENDS", "local,local-int8,ivf").split(",")
+BENCHMARK_KS = [int(k) for k in os.getenv("BENCHMARK_KS", "1,3,5,10").split(",")]
+# Rerank configurations are only run if the cross-encoder can be loaded
+BENCHMARK_RERANK = os.getenv("BENCHMARK_RERANK", "True").lower() == "true"
+# The benchmark measures the reranker itself, so its budget is out of the way
+BENCHMARK_RERANK_BUDGET_MS = float(os.getenv("BENCHMARK_RERANK_BUDGET_MS", "60000"))
+# Largest drop of recall/MRR and growth factor of p95 latency tolerated by check
+BENCHMARK_QUALITY_TOLERANCE = float(os.getenv("BENCHMARK_QUALITY_TOLERANCE", "0.02"))
+BENCHMARK_LATENCY_FACTOR = float(os.getenv("BENCHMARK_LATENCY_FACTOR", "1.5"))
+# Queries per search_many call in the throughput comparison (the labelled queries, repeated)
+BENCHMARK_BATCH_SIZE = int(os.getenv("BENCHMARK_BATCH_SIZE", "256"))
+
+def build_index(kind, embedded_documents, index_dir):
+    """A local index of the given backend over already embedded documents"""
+    index_class, kwargs = BACKENDS[kind]
+    index = index_class(os.path.join(index_dir, kind), **kwargs)
+    index.add_documents(embedded_documents)
+    if isinstance(index, IVFVectorIndex):
+        index.train()
+    index.quantize()
+    return index
+
+def retrieve(query, query_embedding, index, bm25_index, top_k, hybrid=False, reranker=None):
+    """
+    Retrieve like search_reranked does online, but from in-process indexes only
+
+    Returns:
+        list: SearchHits, best first
+    """
+    started = time.perf_counter()
+    fetch = max(top_k, RERANK_CANDIDATES) if reranker is not None else top_k
+    if hybrid:
+        candidates = fetch * max(1, HYBRID_FETCH_FACTOR)
+        results = reciprocal_rank_fusion([
+            ("vector", index.search(query_embedding, candidates), HYBRID_VECTOR_WEIGHT),
+            ("bm25", bm25_index.search(query, candidates), HYBRID_BM25_WEIGHT),
+        ], fetch)
+    else:
+        results = index.search(query_embedding, fetch)
+    if reranker is not None:
+        results = reranker.rerank(query, results, top_k, started=started, budget_ms=BENCHMARK_RERANK_BUDGET_MS)
+    return results[:top_k]
+
+def evaluate(queries, query_embeddings, index, bm25_index, top_k, hybrid=False, reranker=None):
+    """
+    Run the labelled queries through one configuration
+
+    recall@k is the share of a query's answer phrases found in its top k
+    results, hit rate the share of queries with at least one relevant result,
+    and MRR the mean reciprocal rank of the first relevant result.
+    """
+    latencies_ms = []
+    recall = 0.0
+    hits = 0
+    reciprocal_ranks = 0.0
+    for entry, query_embedding in zip(queries, query_embeddings):
+        started = time.perf_counter()
+        results = retrieve(entry["query"], query_embedding, index, bm25_index, top_k, hybrid, reranker)
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+
+        phrases = entry["answer_phrases"]
+        found = sum(
+            1 for phrase in phrases
+            if any(is_relevant(result.get("text", ""), [phrase]) for result in results)
+        )
+        recall += found / len(phrases)
+        rank = first_relevant_rank(results, phrases)
+        if rank is not None:
+            hits += 1
+            reciprocal_ranks += 1 / rank
+
+    count = max(1, len(queries))
+    return {
+        "recall": round(recall / count, 4),
+        "hit_rate": round(hits / count, 4),
+        "mrr": round(reciprocal_ranks / count, 4),
+        "latency_ms": percentiles(latencies_ms),
+    }
+
+def benchmark_batch(index, query_embeddings, top_k, batch_size=BENCHMARK_BATCH_SIZE):
+    """
+    Queries per second of one search_many call against a search per query
+
+    Returns:
+        dict: Throughputs, speedup and whether both return the same results
+    """
+    batch = [query_embeddings[i % len(query_embeddings)] for i in range(batch_size)]
+
+    started = time.perf_counter()
+    sequential = [index.search(query_embedding, top_k) for query_embedding in batch]
+    sequential_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batched = index.search_many(batch, top_k)
+    batched_seconds = time.perf_counter() - started
+
+    same = all(
+        [result["_id"] for result in one] == [result["_id"] for result in other]
+        for one, other in zip(sequential, batched)
+    )
+    return {
+        "queries": batch_size,
+        "k": top_k,
+        "sequential_qps": round(batch_size / sequential_seconds, 1),
+        "batched_qps": round(batch_size / batched_seconds, 1),
+        "speedup": round(sequential_seconds / batched_seconds, 2),
+        "same_results": same,
+    }
+
+def result_bytes(index, query_embeddings, top_k):
+    """Bytes allocated by (and held in) the result lists of one search per query, per query"""
+    # Warm up first, so lazily built index state isn't counted
+    index.search(query_embeddings[0], top_k)
+    tracemalloc.start()
+    try:
+        results = [index.search(query_embedding, top_k) for query_embedding in query_embeddings]
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(held / max(1, len(results)))
+
+def config_name(backend, top_k, hybrid, rerank):
+    """Identifier of a configuration in reports, e.g. "ivf/hybrid/rerank/k=5" """
+    return "/".join([backend, "hybrid" if hybrid else "vector"] + (["rerank"] if rerank else []) + [f"k={top_k}"])
+
+def load_reranker():
+    """The cross-encoder, warmed up, or None if it can't be loaded"""
+    if not BENCHMARK_RERANK:
+        return None
+    reranker = get_reranker()
+    return reranker if reranker.warmup() else None
+
+def run(pdf_paths=None, embeddings=None, backends=BENCHMARK_BACKENDS, ks=BENCHMARK_KS, reranker=None):
+    """
+    Evaluate every retrieval configuration
+
+    Args:
+        pdf_paths (list): PDFs to index (defaults to the bundled books)
+        embeddings: Model with embed_documents and embed_query (defaults to the shared model)
+        backends (list): Names from BACKENDS
+        ks (list): Result counts to evaluate
+        reranker: Reranker to evaluate (defaults to the configured cross-encoder, if it loads)
+
+    Returns:
+        dict: The report
+    """
+    pdf_paths = pdf_paths or bundled_pdf_paths()
+    embeddings = embeddings or get_embedding_model()
+    reranker = reranker or load_reranker()
+    queries = load_queries()
+
+    started = time.perf_counter()
+    chunks = chunk_documents(extract_documents(pdf_paths), get_text_splitter())
+    index_dir = tempfile.mkdtemp(prefix="retrieval-benchmark-")
+    try:
+        exact = LocalVectorIndex(os.path.join(index_dir, "embedded"), quantization="none")
+        embed_into_index(chunks, embeddings, exact)
+        ingest_seconds = time.perf_counter() - started
+        embedded_documents = [
+            {**doc, "embedding": vector} for doc, vector in zip(exact.documents, exact.matrix)
+        ]
+        bm25_index = BM25Index()
+        bm25_index.add_documents(exact.documents)
+
+        query_embeddings = []
+        embedding_ms = []
+        for entry in queries:
+            started = time.perf_counter()
+            query_embeddings.append(embeddings.embed_query(entry["query"]))
+            embedding_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        embeddings.embed_documents([entry["query"] for entry in queries])
+        batch_embedding_ms = (time.perf_counter() - started) * 1000
+
+        results = {}
+        batch = {}
+        for backend in backends:
+            index = exact if backend == "local" else build_index(backend, embedded_documents, index_dir)
+            batch[backend] = benchmark_batch(index, query_embeddings, max(ks))
+            batch[backend]["result_bytes_per_query"] = result_bytes(index, query_embeddings, max(ks))
+            for hybrid in (False, True):
+                for rerank in (False, True) if reranker is not None else (False,):
+                    for top_k in ks:
+                        name = config_name(backend, top_k, hybrid, rerank)
+                        logger.info(f"Evaluating {name}")
+                        metrics = evaluate(
+                            queries, query_embeddings, index, bm25_index, top_k, hybrid,
+                            reranker if rerank else None
+                        )
+                        results[name] = {
+                            "backend": backend, "k": top_k, "hybrid": hybrid, "rerank": rerank, **metrics
+                        }
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    return {
+        "model": model_key(),
+        "chunking": describe_splitter(),
+        "pdfs": [os.path.basename(path) for path in pdf_paths],
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "ingest_seconds": round(ingest_seconds, 3),
+        "query_embedding_ms": percentiles(embedding_ms),
+        "query_embedding_batch_ms": round(batch_embedding_ms, 3),
+        "reranker": reranker.model_name if reranker is not None else None,
+        "results": results,
+        "batch": batch,
+    }
+
+def compare(report, baseline, quality_tolerance=BENCHMARK_QUALITY_TOLERANCE,
+            latency_factor=BENCHMARK_LATENCY_FACTOR):
+    """
+    Regressions of a report against a baseline report
+
+    Returns:
+        list: One message per regressed metric (empty if none)
+    """
+    regressions = []
+    for name, expected in baseline.get("results", {}).items():
+        actual = report["results"].get(name)
+        if actual is None:
+            continue
+        for metric in ("recall", "hit_rate", "mrr"):
+            if actual[metric] < expected[metric] - quality_tolerance:
+                regressions.append(f"{name}: {metric} {actual[metric]:.4f} < baseline {expected[metric]:.4f}")
+        expected_p95 = expected["latency_ms"]["p95"]
+        actual_p95 = actual["latency_ms"]["p95"]
+        if expected_p95 and actual_p95 and actual_p95 > expected_p95 * latency_factor:
+            regressions.append(f"{name}: p95 latency {actual_p95:.2f}ms > {latency_factor}x baseline {expected_p95:.2f}ms")
+    return regressions
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+
+    if command == "run":
+        report = run()
+        output = json.dumps(report, indent=2)
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], "w", encoding="utf-8") as f:
+                f.write(output)
+        print(output)
+    elif command == "check" and len(sys.argv) > 2:
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(run(), baseline)
+        for regression in regressions:
+            print(regression)
+        print(f"{len(regressions)} regressions against {sys.argv[2]}")
+        sys.exit(1 if regressions else 0)
+    else:
+        print("Usage: python -m rag.benchmarks.retrieval [run [report.json] | check baseline.json]")
+        sys.exit(1)
@@ -0,0 +1,271 @@
+# rag/bm25_index.py
+"""
+In-memory BM25 keyword index over the chunk texts, and reciprocal-rank fusion
+of keyword and vector results.
+Dense embeddings handle paraphrases well but rare transliterated terms
+("Gajakesari", "Vimshottari") poorly; an exact-term index covers those without
+a second round trip to MongoDB. The index is built from the collection on
+first use and kept up to date by the local index writers, and rebuilt when
+another process bumps the collection's index version.
+"""
+import os
+import re
+import logging
+import threading
+import unicodedata
+from collections import Counter
+import numpy as np
+from rag.local_index import STORED_FIELDS, index_key, top_k_rows, current_version, is_current
+from rag.search_filters import PostingLists, normalize_filters
+from rag.search_hits import SearchHit, as_hit
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Rank constant of reciprocal-rank fusion; larger values flatten the rank curve
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Hybrid retrieval: reciprocal-rank fusion weights of the vector and BM25
+# keyword results (a weight of 0 disables that retriever)
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_BM25_WEIGHT = float(os.getenv("HYBRID_BM25_WEIGHT", "1.0"))
+# Candidates fetched from each retriever per requested result before fusion
+HYBRID_FETCH_FACTOR = int(os.getenv("HYBRID_FETCH_FACTOR", "4"))
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i in is it its of on or
+she that the their there they this to was were what when which who will with you your
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text):
+    """
+    Lowercased word tokens with diacritics stripped, so "Gajakesarī" and
+    "gajakesari" match
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return [token for token in _TOKEN.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of term -> (row, term frequency) postings"""
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self.doc_terms = []
+        self.doc_lengths = np.empty(0, dtype=np.float32)
+        self.postings = {}
+        self._arrays = {}
+        self._postings = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add_documents(self, documents):
+        """
+        Index chunk documents
+
+        Args:
+            documents (list): Documents with a "text" field (and "_id" once inserted)
+
+        Returns:
+            int: Number of documents added
+        """
+        with self._lock:
+            lengths = []
+            for doc in documents:
+                text = doc.get("text")
+                if not text:
+                    continue
+                terms = Counter(tokenize(text))
+                row = len(self.documents)
+                for term, tf in terms.items():
+                    self.postings.setdefault(term, []).append((row, tf))
+                    self._arrays.pop(term, None)
+
+                entry = {field: doc[field] for field in STORED_FIELDS if field in doc}
+                entry["_id"] = str(doc.get("_id", ""))
+                self.documents.append(entry)
+                self.doc_terms.append(terms)
+                lengths.append(sum(terms.values()))
+
+            if lengths:
+                self.doc_lengths = np.concatenate([self.doc_lengths, np.asarray(lengths, dtype=np.float32)])
+                self._postings = None
+            return len(lengths)
+
+    def remove_documents(self, ids):
+        """
+        Remove documents by Mongo _id, rebuilding the postings of the rest
+
+        Returns:
+            int: Number of documents removed
+        """
+        ids = {str(doc_id) for doc_id in ids}
+        with self._lock:
+            keep = [i for i, doc in enumerate(self.documents) if doc.get("_id") not in ids]
+            removed = len(self.documents) - len(keep)
+            if not removed:
+                return 0
+
+            self.documents = [self.documents[i] for i in keep]
+            self.doc_terms = [self.doc_terms[i] for i in keep]
+            self.doc_lengths = self.doc_lengths[keep]
+            self.postings = {}
+            self._arrays = {}
+            self._postings = None
+            for row, terms in enumerate(self.doc_terms):
+                for term, tf in terms.items():
+                    self.postings.setdefault(term, []).append((row, tf))
+            return removed
+
+    def build_from_collection(self, collection, batch_size=1000):
+        """Index the text of every chunk in a Mongo collection"""
+        self.documents = []
+        self.doc_terms = []
+        self.doc_lengths = np.empty(0, dtype=np.float32)
+        self.postings = {}
+        self._arrays = {}
+        self._postings = None
+
+        projection = {field: 1 for field in STORED_FIELDS}
+        batch = []
+        for doc in collection.find({}, projection).batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self.add_documents(batch)
+                batch = []
+        self.add_documents(batch)
+
+        logger.info(f"Built BM25 index with {len(self)} documents and {len(self.postings)} terms")
+        return len(self)
+
+    def _posting_arrays(self, term):
+        """Postings of a term as (rows, term frequencies) arrays, cached until the term changes"""
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = np.asarray(self.postings[term], dtype=np.float32)
+            arrays = (postings[:, 0].astype(np.intp), postings[:, 1])
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query, top_k=5, filters=None):
+        """
+        Find the top_k chunks for a keyword query
+
+        Args:
+            query (str): Keyword query
+            top_k (int): Number of results to return
+            filters (dict): Metadata filter ({field: value or values})
+
+        Returns:
+            list: SearchHits with a BM25 score, best match first
+        """
+        filters = normalize_filters(filters)
+        with self._lock:
+            n = len(self.documents)
+            if n == 0 or top_k <= 0:
+                return []
+
+            terms = [term for term in set(tokenize(query)) if term in self.postings]
+            if not terms:
+                return []
+
+            # Per-document length normalization, shared by every term
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / self.doc_lengths.mean())
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                rows, tf = self._posting_arrays(term)
+                idf = np.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm[rows])
+
+            if filters is None:
+                matched = np.flatnonzero(scores)
+            else:
+                if self._postings is None:
+                    self._postings = PostingLists(self.documents)
+                allowed = self._postings.rows(filters)
+                matched = allowed[scores[allowed] > 0]
+            ranked = matched[top_k_rows(scores[matched], top_k)]
+            return [
+                SearchHit.from_document(self.documents[row], score)
+                for row, score in zip(ranked.tolist(), scores[ranked].tolist())
+            ]
+
+def result_key(hit):
+    """Identity of a search hit across retrievers"""
+    if hit.id:
+        return hit.id
+    return (hit.filename, hit.chunk_index, hit.text)
+
+def reciprocal_rank_fusion(ranked_lists, top_k=5, k=RRF_K):
+    """
+    Merge ranked result lists by weighted reciprocal rank
+
+    Args:
+        ranked_lists (list): (name, results, weight) tuples, each results list best first
+        top_k (int): Number of fused results to return
+        k (int): Rank constant
+
+    Returns:
+        list: SearchHits with the fused score, plus the score each retriever
+            gave them in hit.scores (read as hit["<name>_score"])
+    """
+    fused = {}
+    for name, results, weight in ranked_lists:
+        if weight <= 0:
+            continue
+        for rank, result in enumerate(results):
+            result = as_hit(result)
+            key = result_key(result)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = [result.copy(), 0.0]
+            entry[1] += weight / (k + rank + 1)
+            entry[0].set_score(name, result.score)
+
+    ranked = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)[:top_k]
+    results = []
+    for hit, score in ranked:
+        hit.score = score
+        results.append(hit)
+    return results
+
+# Loaded BM25 indexes, keyed like the vector indexes, with the index version they were built at
+_indexes = {}
+_versions = {}
+_registry_lock = threading.Lock()
+
+def get_bm25_index(collection):
+    """
+    Get the BM25 index for a Mongo collection, building it on first use and
+    again whenever another process changed the collection
+    """
+    key = index_key(collection.database.name, collection.name)
+    version = current_version(collection)
+    index = _indexes.get(key)
+    if index is not None and is_current(_versions, key, collection, version):
+        return index
+
+    with _registry_lock:
+        index = _indexes.get(key)
+        if index is None or not is_current(_versions, key, collection, version):
+            index = BM25Index()
+            index.build_from_collection(collection)
+            _indexes[key] = index
+            _versions[key] = version
+        return index
+
+def get_cached_bm25_index(db_name, collection_name):
+    """Return the already built BM25 index for a collection, if any"""
+    return _indexes.get(index_key(db_name, collection_name))
+
+def reset_bm25_index(collection):
+    """Forget the BM25 index of a collection; it is rebuilt on next use"""
+    key = index_key(collection.database.name, collection.name)
+    _indexes.pop(key, None)
+    _versions.pop(key, None)
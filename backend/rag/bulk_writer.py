@@ -0,0 +1,164 @@
+# rag/bulk_writer.py
+"""
+Batched, unordered, concurrent inserts of vector documents.
+Embedded documents are regrouped into WRITE_BATCH_SIZE batches and inserted
+with insert_many(ordered=False) by WRITE_WORKERS threads while embedding goes
+on; a bounded queue between the two keeps ingest memory flat. A batch that
+hits a transient error (lost connection, primary step-down) is retried on
+its own with backoff. Documents get their _id before the first attempt, so a
+retry can only produce duplicate-key errors for documents that were already
+written, and those count as written.
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout, PyMongoError, WTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Documents per insert_many
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+# Concurrent insert_many calls
+WRITE_WORKERS = int(os.getenv("WRITE_WORKERS", "2"))
+# Attempts after the first for a batch that failed with a transient error
+WRITE_RETRIES = int(os.getenv("WRITE_RETRIES", "3"))
+# Seconds before the first retry, doubled on every further one
+WRITE_RETRY_BACKOFF = float(os.getenv("WRITE_RETRY_BACKOFF", "0.5"))
+
+DUPLICATE_KEY = 11000
+# Server error codes worth retrying (the ones pymongo retries writes on)
+RETRYABLE_CODES = frozenset({6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436})
+
+def is_transient(error):
+    """Whether a failed write may succeed if tried again"""
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout, WTimeoutError)):
+        return True
+    return isinstance(error, PyMongoError) and error.has_error_label("RetryableWriteError")
+
+class BulkWriter:
+    """
+    Inserts documents into a collection in unordered batches on background
+    threads, calling on_written(batch) once a batch is stored
+    """
+
+    def __init__(self, collection, on_written=None, batch_size=WRITE_BATCH_SIZE,
+                 workers=WRITE_WORKERS, retries=WRITE_RETRIES, backoff=WRITE_RETRY_BACKOFF):
+        self.collection = collection
+        self.on_written = on_written
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.backoff = backoff
+        self._buffer = []
+        self._batches = queue.Queue(maxsize=2 * max(1, workers))
+        self._lock = threading.Lock()
+        self._error = None
+        self._started = None
+        self.written = 0
+        self.batches = 0
+        self.retried = 0
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True, name=f"bulk-writer-{i}")
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, documents):
+        """Queue documents for writing, raising any error from an earlier batch"""
+        if self._error is not None:
+            raise self._error
+        if self._started is None:
+            self._started = time.perf_counter()
+        for document in documents:
+            self._buffer.append(document)
+            if len(self._buffer) >= self.batch_size:
+                self._batches.put(self._buffer)
+                self._buffer = []
+
+    def close(self):
+        """
+        Write what is left and wait for every batch
+
+        Returns:
+            int: Number of documents written
+        """
+        if self._buffer:
+            self._batches.put(self._buffer)
+            self._buffer = []
+        for _ in self._threads:
+            self._batches.put(None)
+        for thread in self._threads:
+            thread.join()
+        stats = self.stats()
+        logger.info(
+            f"Wrote {stats['written']} documents in {stats['batches']} batches "
+            f"({stats['docs_per_sec']:.0f} docs/sec, {stats['retried']} retries)"
+        )
+        if self._error is not None:
+            raise self._error
+        return self.written
+
+    def stats(self):
+        """Running write counters and throughput"""
+        with self._lock:
+            seconds = time.perf_counter() - self._started if self._started is not None else 0.0
+            return {
+                "written": self.written,
+                "batches": self.batches,
+                "retried": self.retried,
+                "seconds": round(seconds, 3),
+                "docs_per_sec": self.written / seconds if seconds > 0 else 0.0,
+            }
+
+    def _run(self):
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._insert(batch)
+                if self.on_written is not None:
+                    # The callback (e.g. a local index writer) need not be thread-safe
+                    with self._lock:
+                        self.on_written(batch)
+                with self._lock:
+                    self.written += len(batch)
+                    self.batches += 1
+                stats = self.stats()
+                logger.info(f"Wrote {stats['written']} documents ({stats['docs_per_sec']:.0f} docs/sec)")
+            except Exception as e:
+                logger.error(f"Error writing a batch of {len(batch)} documents: {str(e)}")
+                self._error = e
+
+    def _insert(self, batch):
+        """insert_many one batch, retrying what failed transiently"""
+        pending = batch
+        for attempt in range(self.retries + 1):
+            try:
+                self.collection.insert_many(pending, ordered=False)
+                return
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                retryable = [error for error in errors if error.get("code") in RETRYABLE_CODES]
+                if any(error.get("code") not in RETRYABLE_CODES | {DUPLICATE_KEY} for error in errors):
+                    raise
+                if not retryable and not e.details.get("writeConcernErrors"):
+                    # Only duplicates of documents written by an earlier attempt
+                    return
+                if attempt == self.retries:
+                    raise
+                if retryable:
+                    pending = [pending[error["index"]] for error in retryable]
+            except Exception as e:
+                if not is_transient(e) or attempt == self.retries:
+                    raise
+
+            delay = self.backoff * 2 ** attempt
+            with self._lock:
+                self.retried += 1
+            logger.warning(f"Retrying {len(pending)} documents in {delay:.1f}s (attempt {attempt + 2})")
+            time.sleep(delay)
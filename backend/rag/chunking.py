@@ -0,0 +1,177 @@
+# rag/chunking.py
+"""
+Configurable text splitting for ingestion.
+The legacy splitter cuts every 200 characters, a fraction of gte-large's
+512-token window, so the corpus is stored and searched as far more vectors
+than needed. Chunks can instead be measured in embedding-model tokens and cut
+on sentence or paragraph boundaries. The defaults keep the legacy splitter,
+so stored chunks and their content hashes don't change until the settings do;
+rag/benchmarks/chunking.py measures the alternatives.
+"""
+import os
+import re
+import logging
+from rag.embedding_models import EMBEDDING_MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+# Unit of CHUNK_SIZE and CHUNK_OVERLAP: "chars" or "tokens" (of the embedding model)
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "chars").lower()
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "200"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "16"))
+# "recursive" (the legacy langchain splitter), "sentence" or "paragraph"
+CHUNK_BOUNDARY = os.getenv("CHUNK_BOUNDARY", "recursive").lower()
+# Longest input the embedding model reads, in tokens (gte-large: 512 with [CLS]/[SEP])
+MODEL_MAX_TOKENS = int(os.getenv("MODEL_MAX_TOKENS", "510"))
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+# Sentence ends: . ! ? and the Devanagari danda, optionally followed by closing quotes
+_SENTENCE = re.compile(r"(?<=[.!?।॥])[\"'”’)\]]*\s+")
+_WHITESPACE = re.compile(r"\s+")
+# Rough stand-in for WordPiece: every word and punctuation mark is one token
+_ROUGH_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+_token_counters = {}
+
+def get_token_counter(model_name=EMBEDDING_MODEL_NAME):
+    """
+    Function counting the tokens of a text with a model's tokenizer, or an
+    estimate if transformers is unavailable
+    """
+    if model_name not in _token_counters:
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+            def count(text):
+                return len(tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+        except Exception as e:
+            logger.warning(f"Tokenizer of {model_name} unavailable ({str(e)}), estimating token counts")
+
+            def count(text):
+                return len(_ROUGH_TOKEN.findall(text))
+        _token_counters[model_name] = count
+    return _token_counters[model_name]
+
+class BoundaryTextSplitter:
+    """
+    Packs whole sentences (or paragraphs) into chunks of at most chunk_size,
+    measured by length_function. A unit longer than chunk_size is cut between
+    words. Consecutive chunks share their trailing units up to chunk_overlap.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, boundary="sentence", length_function=len):
+        if boundary not in ("sentence", "paragraph"):
+            raise ValueError(f"Unknown chunk boundary: {boundary}")
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"Chunk overlap ({chunk_overlap}) must be smaller than chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.boundary = boundary
+        self.length_function = length_function
+        self.separator = "\n\n" if boundary == "paragraph" else " "
+        # Token counts of adjacent units simply add up; character counts also include the separators
+        self._space = 1 if length_function is len else 0
+        self._separator_length = len(self.separator) if length_function is len else 0
+
+    def _units(self, text):
+        """Whitespace-normalized sentences or paragraphs of a text"""
+        if self.boundary == "paragraph":
+            parts = _PARAGRAPH.split(text)
+        else:
+            parts = _SENTENCE.split(text)
+        for part in parts:
+            part = _WHITESPACE.sub(" ", part).strip()
+            if part:
+                yield part
+
+    def _split_long(self, unit):
+        """Cut a unit longer than chunk_size between words"""
+        pieces = []
+        current = []
+        length = 0
+        for word in unit.split(" "):
+            word_length = self.length_function(word) + (self._space if current else 0)
+            if current and length + word_length > self.chunk_size:
+                pieces.append(" ".join(current))
+                current = []
+                length = self.length_function(word)
+            else:
+                length += word_length
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+    def split_text(self, text):
+        """
+        Split a text into chunks
+
+        Returns:
+            list: Chunk texts, in order
+        """
+        units = []
+        for unit in self._units(text):
+            length = self.length_function(unit)
+            if length > self.chunk_size:
+                units.extend((piece, self.length_function(piece)) for piece in self._split_long(unit))
+            else:
+                units.append((unit, length))
+
+        chunks = []
+        current = []
+        for unit in units:
+            if current and self._length(current + [unit]) > self.chunk_size:
+                chunks.append(self.separator.join(part for part, _ in current))
+                # Carry the trailing units that fit in the overlap, but never the whole chunk
+                carried = []
+                for previous in reversed(current[1:]):
+                    if self._length([previous] + carried) > self.chunk_overlap:
+                        break
+                    carried.insert(0, previous)
+                current = carried if self._length(carried + [unit]) <= self.chunk_size else []
+            current.append(unit)
+        if current:
+            chunks.append(self.separator.join(part for part, _ in current))
+        return chunks
+
+    def _length(self, units):
+        """Length of (text, length) units joined by the separator"""
+        if not units:
+            return 0
+        return sum(length for _, length in units) + self._separator_length * (len(units) - 1)
+
+def get_text_splitter(unit=CHUNK_UNIT, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                      boundary=CHUNK_BOUNDARY, model_name=EMBEDDING_MODEL_NAME):
+    """
+    Text splitter for the given settings (the CHUNK_* environment by default)
+
+    Args:
+        unit (str): "chars" or "tokens"
+        chunk_size (int): Largest chunk, in units
+        chunk_overlap (int): Text shared by consecutive chunks, in units
+        boundary (str): "recursive", "sentence" or "paragraph"
+        model_name (str): Model whose tokenizer measures "tokens"
+
+    Returns:
+        Splitter with a split_text(text) method
+    """
+    if unit == "tokens":
+        if chunk_size > MODEL_MAX_TOKENS:
+            logger.warning(f"Chunks of {chunk_size} tokens exceed the model's {MODEL_MAX_TOKENS} and will be truncated")
+        length_function = get_token_counter(model_name)
+    elif unit == "chars":
+        length_function = len
+    else:
+        raise ValueError(f"Unknown chunk unit: {unit}")
+
+    if boundary == "recursive":
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=length_function
+        )
+    return BoundaryTextSplitter(chunk_size, chunk_overlap, boundary, length_function)
+
+def describe_splitter(unit=CHUNK_UNIT, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, boundary=CHUNK_BOUNDARY):
+    """Short label of a chunking configuration, e.g. "tokens:256/32:sentence" """
+    return f"{unit}:{chunk_size}/{chunk_overlap}:{boundary}"
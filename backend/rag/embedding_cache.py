@@ -0,0 +1,154 @@
+# rag/embedding_cache.py
+"""
+Memoizing cache for query embeddings.
+Users ask the same questions over and over, and every query embedding is a
+full gte-large forward pass, so embeddings are kept in a bounded LRU keyed by
+the normalized query text, with an optional SQLite tier that survives restarts.
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))  # seconds, 0 = never expire
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")  # empty = memory only
+
+def normalize_text(text):
+    """Normalize a query so trivially different phrasings share a cache entry"""
+    text = re.sub(r"\s+", " ", text.casefold()).strip()
+    return text.strip("?!.,;: ")
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embeddings with a TTL, hit/miss/eviction counters
+    and an optional on-disk tier
+    """
+
+    def __init__(self, model_name, max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL, disk_path=EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_path:
+            try:
+                directory = os.path.dirname(os.path.abspath(disk_path))
+                os.makedirs(directory, exist_ok=True)
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings "
+                    "(key TEXT PRIMARY KEY, vector BLOB, created_at REAL)"
+                )
+                self._disk.commit()
+            except Exception as e:
+                logger.error(f"Could not open embedding cache at {disk_path}: {str(e)}")
+                self._disk = None
+
+    def _key(self, text):
+        normalized = normalize_text(text)
+        return hashlib.sha1(f"{self.model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def get(self, text):
+        """Return the cached embedding for a query, or None"""
+        key = self._key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                embedding, created_at = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(embedding)
+                del self._entries[key]
+
+            embedding = self._disk_get(key)
+            if embedding is not None:
+                self.disk_hits += 1
+                self._store(key, embedding, time.time())
+                return list(embedding)
+
+            self.misses += 1
+            return None
+
+    def put(self, text, embedding):
+        """Cache the embedding for a query"""
+        key = self._key(text)
+        embedding = list(embedding)
+        with self._lock:
+            self._store(key, embedding, time.time())
+            self._disk_put(key, embedding)
+
+    def _store(self, key, embedding, created_at):
+        self._entries[key] = (embedding, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key):
+        if self._disk is None:
+            return None
+        try:
+            row = self._disk.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Error reading embedding cache: {str(e)}")
+            return None
+        if row is None or self._expired(row[1]):
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def _disk_put(self, key, embedding):
+        if self._disk is None:
+            return
+        try:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, np.asarray(embedding, dtype=np.float32).tobytes(), time.time())
+            )
+            self._disk.commit()
+        except Exception as e:
+            logger.error(f"Error writing embedding cache: {str(e)}")
+
+    def clear(self):
+        """Drop every cached embedding, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM embeddings")
+                self._disk.commit()
+
+    def stats(self):
+        """Counters for monitoring the cache"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_enabled": self._disk is not None,
+            }
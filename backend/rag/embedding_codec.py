@@ -0,0 +1,143 @@
+# rag/embedding_codec.py
+"""
+Encoding of chunk embeddings inside MongoDB vector documents.
+By default embeddings are stored as a plain array of floats, which is what the
+Atlas $search index expects. The other formats pack the vector into one BSON
+binary field, little-endian, which numpy reads back without a per-element
+decode; documents stored that way can only be searched through the local
+indexes:
+    float32  4 bytes per dimension (about 3x smaller than the array), exact
+    float16  2 bytes per dimension (about 6x smaller), ~1e-3 relative error
+    int8     1 byte per dimension plus one float scale (about 9x smaller)
+Existing documents are converted with migrate_embeddings (the pdf_uploader
+"migrate" command).
+"""
+import os
+import logging
+import numpy as np
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# "float" (BSON array of doubles), "float32" / "float16" (packed binary) or
+# "int8" (packed codes + per-vector scale)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float").lower()
+
+# Fields each storage format writes
+STORAGE_FIELDS = {
+    "float": ("embedding",),
+    "float32": ("embedding_f32",),
+    "float16": ("embedding_f16",),
+    "int8": ("embedding_int8", "embedding_scale"),
+}
+
+# Packed little-endian dtype of the binary float formats
+BINARY_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+# Every field an encoded embedding may occupy, for projections
+EMBEDDING_FIELDS = tuple(field for fields in STORAGE_FIELDS.values() for field in fields)
+
+# Query matching documents that carry an embedding in any format
+HAS_EMBEDDING = {"$or": [
+    {fields[0]: {"$exists": True}} for fields in STORAGE_FIELDS.values()
+]}
+
+def quantize_int8(vector):
+    """
+    Scalar-quantize a vector to int8 with a single per-vector scale
+
+    Returns:
+        tuple: (int8 ndarray of codes, float scale) so that vector ~= codes * scale
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    peak = float(np.abs(vector).max()) if vector.size else 0.0
+    scale = peak / 127.0 if peak > 0 else 1.0
+    codes = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+def encode_embedding(embedding, storage=None):
+    """
+    Build the document fields that store an embedding
+
+    Args:
+        embedding (list): Vector from the embedding model
+        storage (str): A STORAGE_FIELDS format, defaults to EMBEDDING_STORAGE
+
+    Returns:
+        dict: Fields to merge into the vector document
+    """
+    storage = storage or EMBEDDING_STORAGE
+    if storage == "int8":
+        codes, scale = quantize_int8(embedding)
+        return {"embedding_int8": Binary(codes.tobytes()), "embedding_scale": scale}
+    if storage in BINARY_DTYPES:
+        packed = np.asarray(embedding, dtype=BINARY_DTYPES[storage])
+        return {STORAGE_FIELDS[storage][0]: Binary(packed.tobytes())}
+    if storage != "float":
+        raise ValueError(f"Unknown embedding storage: {storage}")
+    return {"embedding": np.asarray(embedding, dtype=np.float64).tolist()}
+
+def storage_of(document):
+    """Format a document's embedding is stored in, or None if it has none"""
+    for storage, fields in STORAGE_FIELDS.items():
+        if document.get(fields[0]) is not None:
+            return storage
+    return None
+
+def decode_embedding(document):
+    """Return a document's embedding as a float32 array, or None if it has none"""
+    if document.get("embedding_f32") is not None:
+        # Zero-copy view of the BSON bytes (read-only)
+        return np.frombuffer(document["embedding_f32"], dtype=BINARY_DTYPES["float32"])
+    if document.get("embedding_f16") is not None:
+        return np.frombuffer(document["embedding_f16"], dtype=BINARY_DTYPES["float16"]).astype(np.float32)
+    if document.get("embedding") is not None:
+        return np.asarray(document["embedding"], dtype=np.float32)
+    if document.get("embedding_int8") is not None:
+        codes = np.frombuffer(document["embedding_int8"], dtype=np.int8)
+        return codes.astype(np.float32) * np.float32(document.get("embedding_scale", 1.0))
+    return None
+
+def migrate_embeddings(collection, storage, batch_size=1000):
+    """
+    Re-encode every stored embedding of a collection in another format
+
+    Documents already in the target format are skipped, so an interrupted
+    migration can simply be run again. Converting to a smaller format is
+    lossy (float16, int8) and converting back does not restore precision.
+
+    Args:
+        collection: pymongo collection holding vector documents
+        storage (str): Target STORAGE_FIELDS format
+        batch_size (int): Documents updated per bulk_write
+
+    Returns:
+        dict: Counts of "migrated" and "skipped" documents
+    """
+    if storage not in STORAGE_FIELDS:
+        raise ValueError(f"Unknown embedding storage: {storage}")
+    stale_fields = {field: "" for field in EMBEDDING_FIELDS if field not in STORAGE_FIELDS[storage]}
+
+    counts = {"migrated": 0, "skipped": 0}
+    updates = []
+    cursor = collection.find(HAS_EMBEDDING, {field: 1 for field in EMBEDDING_FIELDS}).batch_size(batch_size)
+    for document in cursor:
+        if storage_of(document) == storage:
+            counts["skipped"] += 1
+            continue
+        updates.append(UpdateOne(
+            {"_id": document["_id"]},
+            {"$set": encode_embedding(decode_embedding(document), storage), "$unset": stale_fields}
+        ))
+        if len(updates) >= batch_size:
+            collection.bulk_write(updates, ordered=False)
+            counts["migrated"] += len(updates)
+            logger.info(f"Migrated {counts['migrated']} embeddings to {storage}")
+            updates = []
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+        counts["migrated"] += len(updates)
+
+    logger.info(f"Embedding migration to {storage} done: {counts}")
+    return counts
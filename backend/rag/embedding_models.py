@@ -0,0 +1,137 @@
+# rag/embedding_models.py
+"""
+Process-wide registry of embedding models.
+gte-large takes seconds to load and over a gigabyte of RAM, so every module
+shares one instance per model name. Models load lazily on first use (importing
+this module is cheap); warmup_embedding_model() loads and exercises one ahead
+of time, e.g. at server boot or in a gunicorn --preload master so forked
+workers share its pages.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "thenlper/gte-large")
+# "torch" (sentence-transformers via langchain_huggingface) or "onnx" (ONNX Runtime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if unknown"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return None
+
+def parameter_bytes(model):
+    """Size of the model weights in bytes, if the model exposes them"""
+    if getattr(model, "model_path", None):
+        # ONNX models: size of the (possibly quantized) weights file
+        return os.path.getsize(model.model_path)
+    client = getattr(model, "_client", None) or getattr(model, "client", None)
+    if client is None or not hasattr(client, "parameters"):
+        return None
+    return sum(p.numel() * p.element_size() for p in client.parameters())
+
+def model_key(model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    """
+    Identifier of a model as served by a backend; backends produce slightly
+    different vectors, so caches of embeddings are keyed by this
+    """
+    if backend == "onnx":
+        from rag.onnx_embeddings import ONNX_QUANTIZE
+        return f"{model_name}@onnx{'-int8' if ONNX_QUANTIZE else ''}"
+    return model_name
+
+def load_embedding_model(model_name, backend=EMBEDDING_BACKEND):
+    """Construct an embedding model (slow; use get_embedding_model instead)"""
+    if backend == "onnx":
+        from rag.onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(model_name)
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+def get_embedding_model(model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    """
+    Return the shared embedding model, loading it on first use
+
+    Args:
+        model_name (str): Hugging Face model name
+        backend (str): "torch" or "onnx"
+
+    Returns:
+        Embeddings: Model with embed_query and embed_documents
+    """
+    key = model_key(model_name, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have loaded it while we waited
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        logger.info(f"Loading embedding model {key}")
+        rss_before = current_rss()
+        started = time.perf_counter()
+        model = load_embedding_model(model_name, backend)
+        load_seconds = time.perf_counter() - started
+        rss_after = current_rss()
+
+        _stats[key] = {
+            "load_seconds": round(load_seconds, 3),
+            "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            "parameter_bytes": parameter_bytes(model),
+            "warmup_seconds": None,
+        }
+        _models[key] = model
+        logger.info(f"Loaded embedding model {key} in {load_seconds:.1f}s")
+        return model
+
+def warmup_embedding_model(model_name=EMBEDDING_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    """
+    Load a model and run one embedding through it, so the first real query
+    doesn't pay for lazy initialization
+
+    Returns:
+        bool: True if the model is ready
+    """
+    key = model_key(model_name, backend)
+    try:
+        model = get_embedding_model(model_name, backend)
+        started = time.perf_counter()
+        model.embed_query("warmup")
+        warmup_seconds = time.perf_counter() - started
+        _stats[key]["warmup_seconds"] = round(warmup_seconds, 3)
+        logger.info(f"Warmed up embedding model {key} in {warmup_seconds:.2f}s")
+        return True
+    except Exception as e:
+        logger.error(f"Error warming up embedding model {key}: {str(e)}")
+        return False
+
+def get_embedding_model_stats():
+    """Load time and memory footprint of every loaded model"""
+    return {
+        "loaded": sorted(_models),
+        "models": {name: dict(stats) for name, stats in _stats.items()},
+        "process_rss_bytes": current_rss(),
+    }
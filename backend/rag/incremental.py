@@ -0,0 +1,319 @@
+# rag/incremental.py
+"""
+Incremental ingestion keyed by content hashes.
+Every ingested file is recorded with its SHA-256, so unchanged files are
+skipped outright. Changed files are re-chunked and each chunk is matched to the
+stored vectors by the SHA-256 of its text: matching chunks keep their
+embeddings, only new chunks are embedded, and chunks that disappeared are deleted.
+A changed file that no longer yields any chunks loses all of its chunks, and a
+file that is gone from its source loses its chunks and its record.
+A file with a chunk that failed to embed keeps its old hash, so the next run
+diffs it again and retries the chunk.
+Run as part of an ingestion job (rag/ingestion_jobs.py), every chunk the run
+keeps or adds is tagged with the job, so a resumed run can tell the chunks it
+already stored from the ones it has yet to diff.
+"""
+import os
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+from pymongo import UpdateOne
+from bson.objectid import ObjectId
+from rag.local_index import remove_from_local_indexes
+
+logger = logging.getLogger(__name__)
+
+# Collection recording the SHA-256 of every ingested file
+INGESTION_STATE_COLLECTION = os.getenv("INGESTION_STATE_COLLECTION", "ingested_files")
+
+def file_sha256(source, block_size=1024 * 1024):
+    """
+    SHA-256 of a file, read in blocks
+
+    Args:
+        source: Path of the file, or a readable binary file object (e.g. a GridFS file)
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            for block in iter(lambda: file.read(block_size), b""):
+                digest.update(block)
+    else:
+        for block in iter(lambda: source.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def content_hash(text):
+    """SHA-256 of a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(job_id, filename, chunk_index, digest):
+    """
+    Deterministic _id of a chunk written by an ingestion job, so a chunk
+    written again after a resume is a duplicate instead of a second copy
+    """
+    key = f"{job_id}\0{filename}\0{chunk_index}\0{digest}".encode("utf-8")
+    return ObjectId(hashlib.sha1(key).hexdigest()[:24])
+
+class IncrementalIngestion:
+    """
+    Diffs freshly extracted chunks against the vectors already stored for
+    their files. Inserts go through the normal ingestion pipeline; deletions,
+    chunk position updates and file hashes are applied by commit() once the
+    new chunks are safely written.
+
+    With a job_id, kept and new chunks are tagged with the job and new chunks
+    get deterministic ids; resume_from maps a file to the chunk_index its
+    diff resumes at, chunks the job stored before that are left alone.
+
+    source names where the files come from (e.g. "gridfs" or "pdf_dir"), so
+    files missing from one source don't remove the files of another.
+    """
+
+    def __init__(self, db, vector_collection, job_id=None, resume_from=None, source=None):
+        self.state_collection = db[INGESTION_STATE_COLLECTION]
+        self.vector_collection = vector_collection
+        self.job_id = job_id
+        self.resume_from = resume_from or {}
+        self.source = source
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self._finished = {}
+        self._diffed = False
+        self._updates = []
+        self._stale_ids = []
+        self._failed = {}
+        self.stats = {
+            "files_unchanged": 0,
+            "files_changed": 0,
+            "files_removed": 0,
+            "chunks_unchanged": 0,
+            "chunks_added": 0,
+            "chunks_removed": 0,
+            "chunks_failed": 0,
+        }
+
+    def file_changed(self, filename, sha256):
+        """
+        Whether a file differs from the version last ingested; changed files
+        are remembered so their new hash is recorded by commit()
+        """
+        state = self.state_collection.find_one({"filename": filename}, {"sha256": 1, "source": 1})
+        if state is not None and state.get("sha256") == sha256:
+            if state.get("source") != self.source:
+                # Records written before sources were tracked
+                self.state_collection.update_one({"_id": state["_id"]}, {"$set": {"source": self.source}})
+            self.stats["files_unchanged"] += 1
+            return False
+        self.stats["files_changed"] += 1
+        self.track_file(filename, sha256)
+        return True
+
+    def track_file(self, filename, sha256):
+        """Record the hash of a file known to have changed (e.g. by a resumed job)"""
+        self._hashes[filename] = sha256
+
+    def _existing_chunks(self, filename, fields):
+        """Stored chunks of a file, grouped by content hash"""
+        projection = {"content_hash": 1, "text": 1, **{field: 1 for field in fields}}
+        query = {"filename": filename}
+        if self.job_id is not None:
+            # Chunks this job stored before its checkpoint are already diffed
+            query["$or"] = [
+                {"ingest_job": {"$ne": self.job_id}},
+                {"chunk_index": {"$gte": self.resume_from.get(filename, 0)}},
+            ]
+        existing = {}
+        for doc in self.vector_collection.find(query, projection):
+            # Chunks stored before content hashing get their hash computed here
+            digest = doc.get("content_hash") or content_hash(doc.get("text", ""))
+            existing.setdefault(digest, []).append(doc)
+        return existing
+
+    def iter_new_chunks(self, chunks):
+        """
+        Filter a chunk stream down to the chunks that need embedding
+
+        Args:
+            chunks (iterable): Chunk dicts with "text" and "filename" (plus any
+                other stored fields, e.g. "chunk_index"), grouped by file
+
+        Yields:
+            dict: New chunks, with their "content_hash" added
+        """
+        for filename, file_chunks in groupby(chunks, key=itemgetter("filename")):
+            existing = None
+            unchanged = added = chunk_count = 0
+            for chunk in file_chunks:
+                if existing is None:
+                    fields = [field for field in chunk if field != "text"]
+                    existing = self._existing_chunks(filename, fields)
+
+                chunk_count += 1
+                digest = content_hash(chunk["text"])
+                matches = existing.get(digest)
+                if matches:
+                    # Keep the stored embedding, only refreshing changed fields
+                    # such as the chunk's position in the file
+                    doc = matches.pop()
+                    changes = {
+                        field: value for field, value in chunk.items()
+                        if field != "text" and doc.get(field) != value
+                    }
+                    if doc.get("content_hash") != digest:
+                        changes["content_hash"] = digest
+                    if self.job_id is not None:
+                        changes["ingest_job"] = self.job_id
+                    if changes:
+                        with self._lock:
+                            self._updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+                    unchanged += 1
+                    continue
+
+                added += 1
+                self.stats["chunks_added"] += 1
+                if self.job_id is None:
+                    yield {**chunk, "content_hash": digest}
+                else:
+                    yield {
+                        **chunk,
+                        "_id": chunk_id(self.job_id, filename, chunk.get("chunk_index"), digest),
+                        "content_hash": digest,
+                        "ingest_job": self.job_id,
+                    }
+
+            # Whatever wasn't matched no longer exists in the file
+            stale = [doc["_id"] for docs in (existing or {}).values() for doc in docs]
+            self._stale_ids.extend(stale)
+            self._finished[filename] = chunk_count
+
+            self.stats["chunks_unchanged"] += unchanged
+            self.stats["chunks_removed"] += len(stale)
+            logger.info(
+                f"{filename}: {unchanged} chunks unchanged, {added} new, {len(stale)} removed"
+            )
+        self._diffed = True
+
+    def chunk_failed(self, chunk):
+        """
+        Report a new chunk that couldn't be embedded (an iter_embedded_batches
+        on_failed callback); its file's hash won't be recorded
+        """
+        with self._lock:
+            self._failed[chunk["filename"]] = self._failed.get(chunk["filename"], 0) + 1
+            self.stats["chunks_failed"] += 1
+
+    @property
+    def failed_files(self):
+        """{filename: number of chunks that failed to embed}"""
+        with self._lock:
+            return dict(self._failed)
+
+    def flush_updates(self):
+        """Apply the position updates (and job tags) of kept chunks queued so far"""
+        with self._lock:
+            updates, self._updates = self._updates, []
+        if updates:
+            self.vector_collection.bulk_write(updates, ordered=False)
+        return len(updates)
+
+    def _queue_chunks_of(self, filenames):
+        """Queue every stored chunk of the given files for deletion, returning how many"""
+        if not filenames:
+            return 0
+        docs = self.vector_collection.find({"filename": {"$in": list(filenames)}}, {"_id": 1})
+        known = set(self._stale_ids)
+        ids = [doc["_id"] for doc in docs if doc["_id"] not in known]
+        self._stale_ids.extend(ids)
+        self.stats["chunks_removed"] += len(ids)
+        return len(ids)
+
+    def _missing_files(self, current_files):
+        """Recorded files of this source that are no longer among current_files"""
+        current = set(current_files) | set(self._hashes)
+        recorded = self.state_collection.find({"source": self.source}, {"filename": 1})
+        return sorted({doc["filename"] for doc in recorded} - current)
+
+    def commit(self, current_files=None):
+        """
+        Delete removed chunks, apply position updates and record the hashes of
+        every file whose chunks were fully diffed and embedded
+
+        For a job, every chunk of the job's files not tagged with it is
+        removed, including those of files finished before a resume, and the
+        hashes of all tracked files are recorded. Outside a job, changed files
+        that yielded no chunks at all lose the chunks they had.
+
+        Args:
+            current_files (list): Every filename the source holds now; recorded
+                files of this source not among them are forgotten and their
+                chunks deleted. None skips the check.
+
+        Returns:
+            dict: Counters of unchanged/changed/removed files and chunks
+        """
+        self.flush_updates()
+        if self.job_id is None and self._diffed:
+            # Changed files without a single chunk never reach the diff
+            empty = [filename for filename in self._hashes if filename not in self._finished]
+            if self._queue_chunks_of(empty):
+                logger.info(f"Removed the chunks of {len(empty)} files that no longer yield any text")
+            for filename in empty:
+                self._finished[filename] = 0
+        missing = self._missing_files(current_files) if current_files is not None else []
+        if missing:
+            removed = self._queue_chunks_of(missing)
+            self.stats["files_removed"] += len(missing)
+            logger.info(f"{len(missing)} files are gone from the {self.source or 'source'}, removing their {removed} chunks")
+        if self.job_id is not None and self._hashes:
+            leftovers = self.vector_collection.find(
+                {"filename": {"$in": list(self._hashes)}, "ingest_job": {"$ne": self.job_id}}, {"_id": 1}
+            )
+            known = set(self._stale_ids)
+            extra = [doc["_id"] for doc in leftovers if doc["_id"] not in known]
+            self._stale_ids.extend(extra)
+            self.stats["chunks_removed"] += len(extra)
+            for filename in self._hashes:
+                self._finished[filename] = None
+        if self._stale_ids:
+            self.vector_collection.delete_many({"_id": {"$in": self._stale_ids}})
+            remove_from_local_indexes(self.vector_collection, self._stale_ids)
+
+        for filename, chunk_count in self._finished.items():
+            if filename not in self._hashes:
+                continue
+            if filename in self._failed:
+                logger.warning(
+                    f"{filename}: {self._failed[filename]} chunks failed to embed, "
+                    "leaving the file to be retried on the next run"
+                )
+                continue
+            if chunk_count is None:
+                chunk_count = self.vector_collection.count_documents({"filename": filename})
+            self.state_collection.update_one(
+                {"filename": filename},
+                {"$set": {
+                    "sha256": self._hashes[filename],
+                    "chunk_count": chunk_count,
+                    "source": self.source,
+                    "updated_at": datetime.utcnow(),
+                }},
+                upsert=True
+            )
+        if missing:
+            # Only once their chunks are gone, so an interrupted run retries
+            self.state_collection.delete_many({"filename": {"$in": missing}, "source": self.source})
+
+        self._updates = []
+        self._stale_ids = []
+        self._finished = {}
+        self._diffed = False
+        self._failed = {}
+        logger.info(f"Incremental ingestion: {self.stats}")
+        return dict(self.stats)
@@ -0,0 +1,178 @@
+# rag/ingestion.py
+"""
+Helpers shared by the ingestion paths (rag/vector_store.create_vector_store and
+pdf_files/pdf_uploader.process_and_embed_all_pdfs).
+"""
+import os
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Number of chunks embedded per forward pass
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Chunks sorted by length together, in batches (bounds memory for long inputs)
+SORT_WINDOW_BATCHES = int(os.getenv("EMBEDDING_SORT_WINDOW_BATCHES", "16"))
+# Capacity of the queues between pipeline stages
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+# Characters of one document buffered before it is split into chunks
+PIPELINE_BUFFER_CHARS = int(os.getenv("PIPELINE_BUFFER_CHARS", "20000"))
+
+def item_text(item):
+    """Text of a pipeline item: either a plain string or a dict with a "text" field"""
+    return item if isinstance(item, str) else item["text"]
+
+def iter_text_chunks(pages, text_splitter, buffer_chars=PIPELINE_BUFFER_CHARS):
+    """
+    Split the pages of a single document into chunks without holding the whole document
+
+    Pages are buffered until buffer_chars is reached and then split; the last
+    chunk of each split may continue on the next page, so it is carried over.
+
+    Args:
+        pages (iterable): Page texts of one document, in order
+        text_splitter: Splitter with a split_text(text) method
+
+    Yields:
+        str: Text chunks
+    """
+    for chunk, _ in iter_resumable_chunks(pages, text_splitter, buffer_chars=buffer_chars):
+        yield chunk
+
+def iter_resumable_chunks(pages, text_splitter, start_page=0, carry="", buffer_chars=PIPELINE_BUFFER_CHARS):
+    """
+    iter_text_chunks, also yielding the points it can be resumed from
+
+    The last chunk of every split is followed by a clean break: resuming with
+    the next page and that split's carried-over text produces exactly the
+    chunks an uninterrupted run would.
+
+    Args:
+        pages (iterable): Page texts of one document, from start_page on
+        text_splitter: Splitter with a split_text(text) method
+        start_page (int): Number of the first page in pages
+        carry (str): Text carried over from before start_page
+
+    Yields:
+        tuple: (chunk, resume), where resume is None or, once the chunk and
+            every earlier one are stored, {"page", "carry", "done"} to
+            continue from ("done" after the document's last chunk)
+    """
+    buffer = carry
+    page_number = start_page
+    for page in pages:
+        buffer += page
+        page_number += 1
+        if len(buffer) >= buffer_chars:
+            chunks = text_splitter.split_text(buffer)
+            buffer = chunks[-1] if chunks else ""
+            for i, chunk in enumerate(chunks[:-1]):
+                last = i == len(chunks) - 2
+                yield chunk, ({"page": page_number, "carry": buffer, "done": False} if last else None)
+    if buffer:
+        chunks = text_splitter.split_text(buffer)
+        for i, chunk in enumerate(chunks):
+            last = i == len(chunks) - 1
+            yield chunk, ({"page": page_number, "carry": "", "done": True} if last else None)
+
+def prefetch(iterable, maxsize=PIPELINE_QUEUE_SIZE * EMBEDDING_BATCH_SIZE):
+    """
+    Run an iterable on a background thread, handing its items over through a
+    bounded queue, so e.g. extraction and chunking overlap with embedding
+
+    Yields:
+        Items of iterable, in order
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+            items.put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        # Unblock and stop the producer if the consumer stopped early
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+def iter_embedded_batches(items, embed_documents, batch_size=EMBEDDING_BATCH_SIZE, on_failed=None):
+    """
+    Embed texts in batches, yielding each batch as soon as it is finished
+
+    Items are read in windows of batch_size * SORT_WINDOW_BATCHES and sorted by
+    text length inside each window, so every batch holds similarly sized chunks
+    and the tokenizer pads as little as possible.
+
+    Args:
+        items (iterable): Text chunks to embed, as strings or dicts with a "text" field
+        embed_documents (callable): Batch embedding function, e.g. HuggingFaceEmbeddings.embed_documents
+        batch_size (int): Number of texts per forward pass
+        on_failed (callable): Called with every item that couldn't be embedded
+            (it is left out of the batches)
+
+    Yields:
+        list: (index, item, embedding) tuples, where index is the item's position in items
+    """
+    window = []
+    window_size = batch_size * max(1, SORT_WINDOW_BATCHES)
+    for item in enumerate(items):
+        window.append(item)
+        if len(window) >= window_size:
+            yield from _embed_window(window, embed_documents, batch_size, on_failed)
+            window = []
+    if window:
+        yield from _embed_window(window, embed_documents, batch_size, on_failed)
+
+def _embed_window(window, embed_documents, batch_size, on_failed=None):
+    window.sort(key=lambda entry: len(item_text(entry[1])))
+    for start in range(0, len(window), batch_size):
+        batch = window[start:start + batch_size]
+        try:
+            embeddings = embed_documents([item_text(item) for _, item in batch])
+            yield [(i, item, embedding) for (i, item), embedding in zip(batch, embeddings)]
+        except Exception as e:
+            # Retry one by one so a single bad chunk doesn't lose the whole batch
+            logger.error(f"Error embedding batch of {len(batch)} documents, retrying individually: {str(e)}")
+            embedded = []
+            for i, item in batch:
+                try:
+                    embedded.append((i, item, embed_documents([item_text(item)])[0]))
+                except Exception as e:
+                    logger.error(f"Error embedding document {i}: {str(e)}")
+                    if on_failed is not None:
+                        on_failed(item)
+            if embedded:
+                yield embedded
@@ -0,0 +1,262 @@
+# rag/ingestion_jobs.py
+"""
+Resumable, checkpointed ingestion jobs.
+A job fixes the list of files it ingests when it starts and keeps a checkpoint
+in MongoDB: the file, the page and the chunk index processing can restart
+from, plus the text carried over from before that page. The checkpoint only
+moves past a chunk once it and every chunk before it are stored (written, or
+kept from an earlier ingestion), so after a crash or restart `resume` redoes
+at most the work since the last checkpoint instead of the whole corpus.
+Chunks written by a job have deterministic ids (rag/incremental.chunk_id), so
+writing one again after a resume is a harmless duplicate.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from bson.objectid import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Collection holding ingestion jobs and their checkpoints
+INGESTION_JOBS_COLLECTION = os.getenv("INGESTION_JOBS_COLLECTION", "ingestion_jobs")
+# Minimum seconds between two checkpoint writes
+CHECKPOINT_INTERVAL = float(os.getenv("INGESTION_CHECKPOINT_INTERVAL", "5"))
+
+UNFINISHED = ("running", "failed")
+
+def format_duration(seconds):
+    """Seconds as e.g. "1h02m", "4m10s" or "12s" """
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+class IngestionJob:
+    """
+    One ingestion run over a fixed list of files, resumable from its checkpoint
+
+    The pipeline reports every chunk it produces with register(), the chunks
+    coming out of the incremental filter with passed() (the ones in between
+    need no write) and stored chunks with written(); the checkpoint advances
+    over the contiguous prefix of finished chunks.
+    """
+
+    def __init__(self, collection, doc, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.collection = collection
+        self.job_id = str(doc["_id"])
+        self.files = doc["files"]
+        self.checkpoint = doc.get("checkpoint") or {"file": 0, "page": 0, "carry": "", "chunk_index": 0}
+        self.checkpoint_interval = checkpoint_interval
+        self.on_checkpoint = None
+        self._doc_id = doc["_id"]
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._sequence = {}
+        self._finished = set()
+        self._next_seq = 0
+        self._last_yielded = -1
+        self._page_counts = {}
+        self._saved_at = 0.0
+        self._started = time.perf_counter()
+        self._start_progress = self.progress()
+
+    @classmethod
+    def create(cls, db, files):
+        """
+        Start a job, superseding any unfinished one
+
+        Args:
+            db: MongoDB database
+            files (list): {"pdf_id", "filename", "sha256", "length"} of the files to ingest
+
+        Returns:
+            IngestionJob: The new job
+        """
+        collection = db[INGESTION_JOBS_COLLECTION]
+        collection.update_many({"status": {"$in": list(UNFINISHED)}}, {"$set": {"status": "superseded"}})
+        now = datetime.utcnow()
+        doc = {
+            "_id": ObjectId(),
+            "status": "running",
+            "files": files,
+            "checkpoint": {"file": 0, "page": 0, "carry": "", "chunk_index": 0},
+            "progress": 0.0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        collection.insert_one(doc)
+        logger.info(f"Started ingestion job {doc['_id']} over {len(files)} files")
+        return cls(collection, doc)
+
+    @classmethod
+    def latest_unfinished(cls, db):
+        """The most recent job that didn't complete, or None"""
+        collection = db[INGESTION_JOBS_COLLECTION]
+        doc = collection.find_one({"status": {"$in": list(UNFINISHED)}}, sort=[("created_at", -1)])
+        if doc is None:
+            return None
+        collection.update_one({"_id": doc["_id"]}, {"$set": {"status": "running", "updated_at": datetime.utcnow()}})
+        job = cls(collection, doc)
+        logger.info(f"Resuming ingestion job {job.job_id} at {job.describe_checkpoint()}")
+        return job
+
+    def resume_from(self):
+        """{filename: chunk_index} for the file the checkpoint is in"""
+        if self.checkpoint["file"] >= len(self.files):
+            return {}
+        return {self.files[self.checkpoint["file"]]["filename"]: self.checkpoint["chunk_index"]}
+
+    def start_file(self, file_index, page_count):
+        """Record the page count of a file as its processing starts (for progress)"""
+        with self._lock:
+            self._page_counts[file_index] = page_count
+
+    def register(self, file_index, chunk_index, resume):
+        """
+        Report a chunk produced by the pipeline, in order
+
+        Args:
+            file_index (int): Position of the chunk's file in the job
+            chunk_index (int): Position of the chunk in its file
+            resume (dict): Resume point after the chunk, from iter_resumable_chunks, or None
+        """
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending.append((seq, file_index, chunk_index, resume))
+            self._sequence[(self.files[file_index]["filename"], chunk_index)] = seq
+
+    def passed(self, chunk):
+        """
+        Report a chunk that came out of the incremental filter; every chunk
+        registered before it that didn't needs no write
+        """
+        with self._lock:
+            seq = self._sequence[(chunk["filename"], chunk["chunk_index"])]
+            self._finished.update(range(self._last_yielded + 1, seq))
+            self._last_yielded = seq
+        self._advance()
+
+    def skipped_rest(self):
+        """Report that no further chunk will come out of the incremental filter"""
+        with self._lock:
+            self._finished.update(range(self._last_yielded + 1, self._next_seq))
+            self._last_yielded = self._next_seq - 1
+        self._advance(force=True)
+
+    def written(self, documents):
+        """Report stored chunks (a BulkWriter on_written callback)"""
+        with self._lock:
+            for document in documents:
+                self._finished.add(self._sequence[(document["filename"], document["chunk_index"])])
+        self._advance()
+
+    def _advance(self, force=False):
+        """Move the checkpoint over finished chunks and save it if due"""
+        with self._lock:
+            moved = False
+            while self._pending and self._pending[0][0] in self._finished:
+                seq, file_index, chunk_index, resume = self._pending.popleft()
+                self._finished.discard(seq)
+                self._sequence.pop((self.files[file_index]["filename"], chunk_index), None)
+                if resume is None:
+                    continue
+                if resume["done"]:
+                    self.checkpoint = {"file": file_index + 1, "page": 0, "carry": "", "chunk_index": 0}
+                else:
+                    self.checkpoint = {
+                        "file": file_index, "page": resume["page"], "carry": resume["carry"],
+                        "chunk_index": chunk_index + 1, "pages": self._page_counts.get(file_index),
+                    }
+                moved = True
+            due = time.perf_counter() - self._saved_at >= self.checkpoint_interval
+            if moved and (force or due):
+                self._save()
+
+    def finish_file(self, file_index):
+        """
+        Report the end of a file's chunks, so the checkpoint can move past a
+        file whose last chunk carried no resume point (e.g. one without text)
+        """
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending.append((seq, file_index, None, {"done": True}))
+            self._finished.add(seq)
+        self._advance()
+
+    def _save(self):
+        # Kept chunks must carry the job's tag before the checkpoint passes them
+        if self.on_checkpoint is not None:
+            self.on_checkpoint()
+        progress = self.progress()
+        self.collection.update_one({"_id": self._doc_id}, {"$set": {
+            "checkpoint": self.checkpoint,
+            "progress": progress,
+            "updated_at": datetime.utcnow(),
+        }})
+        self._saved_at = time.perf_counter()
+        eta = self.eta_seconds(progress)
+        logger.info(
+            f"Ingestion job {self.job_id}: {progress * 100:.1f}% at {self.describe_checkpoint()}"
+            + (f", ETA {format_duration(eta)}" if eta is not None else "")
+        )
+
+    def progress(self):
+        """
+        Share of the job covered by the checkpoint, weighing files by size and
+        the current file by the share of its pages done
+        """
+        sizes = [max(1, entry.get("length") or 0) for entry in self.files]
+        total = sum(sizes) or 1
+        file_index = self.checkpoint["file"]
+        done = sum(sizes[:file_index])
+        page_count = self._page_counts.get(file_index) or self.checkpoint.get("pages")
+        if file_index < len(self.files) and page_count:
+            done += sizes[file_index] * min(1.0, self.checkpoint["page"] / page_count)
+        return min(1.0, done / total)
+
+    def eta_seconds(self, progress=None):
+        """Estimated seconds left, from the rate of progress since this run started"""
+        progress = self.progress() if progress is None else progress
+        gained = progress - self._start_progress
+        if gained <= 0:
+            return None
+        return (time.perf_counter() - self._started) / gained * (1.0 - progress)
+
+    def describe_checkpoint(self):
+        """e.g. "book1.pdf page 120, chunk 860 (file 1/3)" """
+        file_index = self.checkpoint["file"]
+        if file_index >= len(self.files):
+            return "the end"
+        return (
+            f"{self.files[file_index]['filename']} page {self.checkpoint['page']}, "
+            f"chunk {self.checkpoint['chunk_index']} (file {file_index + 1}/{len(self.files)})"
+        )
+
+    def complete(self, stats=None):
+        """Mark the job done"""
+        self.collection.update_one({"_id": self._doc_id}, {"$set": {
+            "status": "completed",
+            "checkpoint": {"file": len(self.files), "page": 0, "carry": "", "chunk_index": 0},
+            "progress": 1.0,
+            "stats": stats or {},
+            "updated_at": datetime.utcnow(),
+            "completed_at": datetime.utcnow(),
+        }})
+        logger.info(f"Ingestion job {self.job_id} completed in {format_duration(time.perf_counter() - self._started)}")
+
+    def fail(self, error):
+        """Mark the job failed, keeping its checkpoint so it can be resumed"""
+        with self._lock:
+            self.collection.update_one({"_id": self._doc_id}, {"$set": {
+                "status": "failed",
+                "error": str(error),
+                "updated_at": datetime.utcnow(),
+            }})
+        logger.error(f"Ingestion job {self.job_id} failed at {self.describe_checkpoint()}: {error}")
@@ -0,0 +1,875 @@
+# rag/local_index.py
+"""
+In-process vector index for the RAG model.
+All chunk embeddings from the vector collection are loaded once into a single
+pre-normalized float32 matrix, so a query is one matrix-vector product plus an
+argpartition instead of a round trip to MongoDB Atlas. Several queries are
+scored together with one matrix-matrix product (search_many). Searches
+filtered on metadata (rag/search_filters.py) only score the rows the filter
+selects.
+Loaded indexes are tagged with the collection's index version
+(rag/retrieval_cache.IndexVersions); when another process (e.g. the
+pdf_uploader CLI) bumps it, the index is reloaded from disk, or rebuilt from
+the collection if the saved copy doesn't match it either.
+"""
+import os
+import json
+import logging
+import threading
+import numpy as np
+from rag.embedding_codec import EMBEDDING_FIELDS, HAS_EMBEDDING, decode_embedding
+from rag.quantization import get_quantizer
+from rag.search_filters import PostingLists, normalize_filters
+from rag.search_hits import SearchHit
+from rag.retrieval_cache import index_versions
+
+logger = logging.getLogger(__name__)
+
+# Directory where local indexes are persisted between restarts
+LOCAL_INDEX_DIR = os.getenv(
+    "LOCAL_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "index")
+)
+
+# Approximate (IVF) index tuning
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = 4 * sqrt(number of vectors)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_MIN_TRAIN_SIZE = int(os.getenv("IVF_MIN_TRAIN_SIZE", "2000"))
+IVF_RETRAIN_FACTOR = float(os.getenv("IVF_RETRAIN_FACTOR", "4"))
+
+# Compressed scan: "none", "int8" (4x smaller) or "pq" (32x smaller with 128 sub-vectors)
+LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "none").lower()
+# Re-score the best top_k * RESCORE_FACTOR quantized candidates exactly (0 = off)
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+
+# Fields kept next to each vector so search results don't need a Mongo lookup
+STORED_FIELDS = ("text", "pdf_id", "filename", "chunk_index", "topic", "metadata")
+
+def normalize_rows(vectors):
+    """Return vectors as a contiguous float32 matrix with unit-length rows"""
+    matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k_rows(scores, top_k):
+    """Return the positions of the top_k highest scores, best first"""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.arange(0)
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates])]
+
+class LocalVectorIndex:
+    """
+    Exact cosine-similarity index held in memory and memory-mapped from disk.
+    With quantization enabled the scan runs over compact in-memory codes and only
+    the best candidates are re-scored against the memory-mapped float32 matrix.
+    """
+
+    def __init__(self, index_dir, quantization=LOCAL_INDEX_QUANTIZATION, rescore_factor=RESCORE_FACTOR):
+        self.index_dir = index_dir
+        self.matrix = None
+        self.documents = []
+        self.quantizer = get_quantizer(quantization)
+        self.codes = None
+        self.rescore_factor = rescore_factor
+        self._postings = None
+        # Over-allocated buffer the matrix is a view of, so appends are amortized
+        self._rows = None
+
+    @property
+    def matrix_path(self):
+        return os.path.join(self.index_dir, "embeddings.npy")
+
+    @property
+    def documents_path(self):
+        return os.path.join(self.index_dir, "documents.json")
+
+    def quantized_path(self, name):
+        return os.path.join(self.index_dir, f"{self.quantizer.name}_{name}.npy")
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add_documents(self, documents):
+        """
+        Add Mongo vector documents to the index
+
+        Args:
+            documents (list): Documents with an "embedding" field (and "_id" once inserted)
+
+        Returns:
+            int: Number of documents added
+        """
+        vectors, entries = self._prepare(documents)
+        if not entries:
+            return 0
+        self._append_rows(vectors)
+
+        # Encode the new vectors with the existing codebooks
+        if self.codes is not None:
+            new_codes = self.quantizer.encode(vectors)
+            self.codes = {
+                name: np.concatenate([self.codes[name], new_codes[name]])
+                for name in self.codes
+            }
+        elif self.quantizer is not None and self.quantizer.trained:
+            self.quantize()
+
+        self.documents.extend(entries)
+        self._postings = None
+
+        return len(entries)
+
+    def _prepare(self, documents):
+        """Normalized vectors and stored fields of the documents that have an embedding"""
+        embeddings = [decode_embedding(doc) for doc in documents]
+        documents = [doc for doc, embedding in zip(documents, embeddings) if embedding is not None]
+        if not documents:
+            return None, []
+
+        vectors = normalize_rows([embedding for embedding in embeddings if embedding is not None])
+        entries = []
+        for doc in documents:
+            entry = {field: doc[field] for field in STORED_FIELDS if field in doc}
+            entry["_id"] = str(doc.get("_id", ""))
+            entries.append(entry)
+        return vectors, entries
+
+    def _append_rows(self, vectors):
+        """
+        Append vectors to the matrix, growing its buffer by half when it is
+        full so a stream of small batches copies the matrix O(log n) times
+        """
+        count = 0 if self.matrix is None else len(self.matrix)
+        if count == 0:
+            self.matrix, self._rows = vectors, None
+            return
+        needed = count + len(vectors)
+        if self._rows is None or len(self._rows) < needed:
+            rows = np.empty((max(needed, count + count // 2), self.matrix.shape[1]), dtype=np.float32)
+            rows[:count] = self.matrix
+            self._rows = rows
+        self._rows[count:needed] = vectors
+        self.matrix = self._rows[:needed]
+
+    def remove_documents(self, ids):
+        """
+        Remove documents from the index by Mongo _id
+
+        Returns:
+            int: Number of documents removed
+        """
+        ids = {str(doc_id) for doc_id in ids}
+        keep = np.array([doc.get("_id") not in ids for doc in self.documents], dtype=bool)
+        removed = int(len(keep) - keep.sum())
+        if removed:
+            self._keep_rows(keep)
+        return removed
+
+    def _keep_rows(self, keep):
+        """Drop every row whose keep flag is False"""
+        self.matrix = np.asarray(self.matrix[keep])
+        self._rows = None
+        self.documents = [doc for doc, kept in zip(self.documents, keep) if kept]
+        self._postings = None
+        if self.codes is not None:
+            self.codes = {name: array[keep] for name, array in self.codes.items()}
+
+    def build_from_collection(self, collection, batch_size=1000):
+        """Load every embedding from a Mongo collection into the index"""
+        self.matrix = None
+        self.documents = []
+        self.codes = None
+        self._postings = None
+        self._rows = None
+
+        projection = {field: 1 for field in STORED_FIELDS + EMBEDDING_FIELDS}
+
+        # Decode batch by batch but copy into the matrix only once
+        blocks = []
+        batch = []
+        for doc in collection.find({}, projection).batch_size(batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                blocks.append(self._prepare(batch))
+                batch = []
+        blocks.append(self._prepare(batch))
+
+        vectors = [block for block, _ in blocks if block is not None]
+        if vectors:
+            self.matrix = np.concatenate(vectors)
+        for _, entries in blocks:
+            self.documents.extend(entries)
+
+        logger.info(f"Built local vector index with {len(self)} documents")
+        self.quantize()
+        return len(self)
+
+    def quantize(self):
+        """Train the quantizer if needed and encode every vector in the index"""
+        if self.quantizer is None or self.matrix is None:
+            return False
+        if not self.quantizer.trained and not self.quantizer.train(self.matrix):
+            self.codes = None
+            return False
+
+        self.codes = self.quantizer.encode(self.matrix)
+        size = sum(array.nbytes for array in self.codes.values())
+        logger.info(f"Quantized {len(self)} vectors with {self.quantizer.name} ({size / 1024 / 1024:.1f} MB of codes)")
+        return True
+
+    def posting_lists(self):
+        """Rows by filter field value, rebuilt lazily after the documents change"""
+        if self._postings is None:
+            self._postings = PostingLists(self.documents)
+        return self._postings
+
+    def filtered_rows(self, filters):
+        """Sorted rows matching a filter, or None for no filter"""
+        filters = normalize_filters(filters)
+        if filters is None:
+            return None
+        return self.posting_lists().rows(filters)
+
+    def search(self, query_embedding, top_k=5, filters=None):
+        """
+        Find the top_k documents most similar to a query embedding
+
+        Args:
+            query_embedding (list): Query vector from the embedding model
+            top_k (int): Number of results to return
+            filters (dict): Metadata filter ({field: value or values}); only
+                matching rows are scored
+
+        Returns:
+            list: SearchHits with a cosine score, best match first
+        """
+        if self.matrix is None or len(self) == 0 or top_k <= 0:
+            return []
+
+        query = normalize_rows(query_embedding)[0]
+        rows = self.filtered_rows(filters)
+        if rows is None:
+            return self._rank(query, np.arange(len(self)), self._score(query), top_k)
+        if len(rows) == 0:
+            return []
+        return self._rank(query, rows, self._score(query, rows), top_k)
+
+    def search_many(self, query_embeddings, top_k=5, filters=None):
+        """
+        search() for several queries at once, scoring them all with one
+        matrix-matrix product
+
+        Args:
+            query_embeddings (list): Query vectors
+            top_k (int): Number of results per query
+            filters (dict): Metadata filter applied to every query
+
+        Returns:
+            list: One result list per query, in order
+        """
+        if len(query_embeddings) == 0:
+            return []
+        if self.matrix is None or len(self) == 0 or top_k <= 0:
+            return [[] for _ in query_embeddings]
+
+        queries = normalize_rows(query_embeddings)
+        rows = self.filtered_rows(filters)
+        if rows is None:
+            rows = np.arange(len(self))
+            scores = self._score_many(queries)
+        elif len(rows) == 0:
+            return [[] for _ in query_embeddings]
+        else:
+            scores = self._score_many(queries, rows)
+        return [self._rank(query, rows, query_scores, top_k) for query, query_scores in zip(queries, scores)]
+
+    def _score(self, query, rows=None):
+        """Score the query against all rows, or a subset, using codes when available"""
+        if self.codes is not None:
+            return self.quantizer.scores(self.codes, query, rows)
+        if rows is None:
+            return self.matrix @ query
+        return self.matrix[rows] @ query
+
+    def _score_many(self, queries, rows=None):
+        """Score several queries against all rows, or a subset, as a (queries, rows) matrix"""
+        if self.codes is not None:
+            return self.quantizer.scores_many(self.codes, queries, rows)
+        if rows is None:
+            return queries @ self.matrix.T
+        return queries @ self.matrix[rows].T
+
+    def _rank(self, query, rows, scores, top_k):
+        """Pick the top_k of the scored rows, re-scoring quantized candidates exactly"""
+        if self.codes is not None and self.rescore_factor > 0:
+            # Sorted rows keep reads from the memory-mapped matrix sequential
+            rows = np.sort(rows[top_k_rows(scores, top_k * self.rescore_factor)])
+            scores = self.matrix[rows] @ query
+
+        ranked = top_k_rows(scores, top_k)
+        return self._results(rows[ranked], scores[ranked])
+
+    def _results(self, rows, scores):
+        """Build search hits for matrix rows and their scores"""
+        documents = self.documents
+        return [SearchHit.from_document(documents[row], score) for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def _array_files(self):
+        """Arrays persisted as .npy files, keyed by path"""
+        files = {self.matrix_path: self.matrix}
+        if self.codes is not None:
+            for name, array in {**self.codes, **self.quantizer.state()}.items():
+                files[self.quantized_path(name)] = array
+        return files
+
+    def save(self):
+        """Persist the index to disk, replacing any previous copy atomically"""
+        if self.matrix is None:
+            return False
+
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        # Write everything to temporary files first, then swap them in
+        written = []
+        for path, array in self._array_files().items():
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            written.append(path)
+        with open(self.documents_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.documents, f)
+        written.append(self.documents_path)
+
+        for path in written:
+            os.replace(path + ".tmp", path)
+        logger.info(f"Saved local vector index ({len(self)} documents) to {self.index_dir}")
+        return True
+
+    def load(self):
+        """Memory-map a previously saved index from disk"""
+        if not os.path.exists(self.matrix_path) or not os.path.exists(self.documents_path):
+            return False
+
+        try:
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+            with open(self.documents_path, "r", encoding="utf-8") as f:
+                documents = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading local vector index from {self.index_dir}: {str(e)}")
+            return False
+
+        if len(matrix) != len(documents):
+            logger.warning(f"Local vector index in {self.index_dir} is inconsistent, ignoring it")
+            return False
+
+        self.matrix = matrix
+        self._rows = None
+        self.documents = documents
+        self.codes = None
+        self._postings = None
+        if self.quantizer is not None:
+            self._load_codes()
+        logger.info(f"Loaded local vector index with {len(self)} documents from {self.index_dir}")
+        return True
+
+    def _load_codes(self):
+        """Load saved quantizer state and codes into memory, if present"""
+        names = self.quantizer.code_fields + self.quantizer.state_fields
+        paths = {name: self.quantized_path(name) for name in names}
+        if not all(os.path.exists(path) for path in paths.values()):
+            return False
+
+        arrays = {name: np.load(path) for name, path in paths.items()}
+        state = {name: arrays.pop(name) for name in self.quantizer.state_fields}
+        if not self.quantizer.load_state(state) or len(arrays["codes"]) != len(self):
+            return False
+        self.codes = arrays
+        return True
+
+    def clear(self):
+        """Drop the in-memory index and its files on disk"""
+        paths = list(self._array_files()) + [self.documents_path]
+        self.matrix = None
+        self._rows = None
+        self.documents = []
+        self.codes = None
+        self._postings = None
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+def nearest_centroids(vectors, centroids, batch_size=8192):
+    """Assign each unit vector to the centroid with the highest cosine similarity"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        assignments[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+def train_centroids(vectors, nlist, iterations=10, sample_size=65536, seed=0):
+    """
+    Train coarse centroids with spherical k-means on a sample of unit vectors
+
+    Args:
+        vectors (ndarray): Unit-length rows to cluster
+        nlist (int): Number of centroids (inverted lists)
+        iterations (int): Number of k-means iterations
+        sample_size (int): Maximum number of rows used for training
+
+    Returns:
+        ndarray: (nlist, dim) float32 matrix of unit-length centroids
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        rows = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+        sample = np.asarray(vectors[rows], dtype=np.float32)
+    else:
+        sample = np.asarray(vectors, dtype=np.float32)
+
+    nlist = max(1, min(nlist, len(sample)))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+
+        # Re-seed empty lists with random sample rows
+        empty = np.bincount(assignments, minlength=nlist) == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+class IVFVectorIndex(LocalVectorIndex):
+    """
+    Approximate index using an inverted file over coarse k-means centroids.
+    A query is scored against the centroids first and then only against the
+    vectors in the nprobe closest lists, so larger nprobe trades latency for recall.
+    Indexes smaller than IVF_MIN_TRAIN_SIZE are searched exactly.
+    """
+
+    def __init__(self, index_dir, nlist=IVF_NLIST, nprobe=IVF_NPROBE, **kwargs):
+        super().__init__(index_dir, **kwargs)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+
+    @property
+    def centroids_path(self):
+        return os.path.join(self.index_dir, "centroids.npy")
+
+    @property
+    def assignments_path(self):
+        return os.path.join(self.index_dir, "assignments.npy")
+
+    @property
+    def ivf_path(self):
+        return os.path.join(self.index_dir, "ivf.json")
+
+    def train(self):
+        """(Re)train the centroids and assign every vector to a list"""
+        if len(self) < IVF_MIN_TRAIN_SIZE:
+            self.centroids = None
+            self.assignments = np.empty(0, dtype=np.int32)
+            self.trained_size = 0
+            self._lists = None
+            return False
+
+        nlist = self.nlist or int(4 * np.sqrt(len(self)))
+        self.centroids = train_centroids(self.matrix, nlist)
+        self.assignments = nearest_centroids(self.matrix, self.centroids)
+        self.trained_size = len(self)
+        self._lists = None
+        logger.info(f"Trained IVF index with {len(self.centroids)} lists over {len(self)} vectors")
+        return True
+
+    def needs_training(self):
+        """Whether the index has outgrown (or never had) its centroids"""
+        if len(self) < IVF_MIN_TRAIN_SIZE:
+            return False
+        return self.centroids is None or len(self) > IVF_RETRAIN_FACTOR * self.trained_size
+
+    def add_documents(self, documents):
+        """Add documents, assigning new vectors to their nearest existing list"""
+        start = len(self)
+        added = super().add_documents(documents)
+        if added and self.centroids is not None:
+            new_assignments = nearest_centroids(self.matrix[start:], self.centroids)
+            self.assignments = np.concatenate([self.assignments, new_assignments])
+            self._lists = None
+        return added
+
+    def _keep_rows(self, keep):
+        super()._keep_rows(keep)
+        if self.centroids is not None:
+            self.assignments = self.assignments[keep]
+            self._lists = None
+
+    def build_from_collection(self, collection, batch_size=1000):
+        """Load every embedding from a Mongo collection and train the centroids"""
+        count = super().build_from_collection(collection, batch_size)
+        self.train()
+        return count
+
+    def inverted_lists(self):
+        """Row numbers grouped by list, rebuilt lazily after inserts"""
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+        return self._lists
+
+    def search(self, query_embedding, top_k=5, nprobe=None, filters=None):
+        """
+        Find approximately the top_k documents most similar to a query embedding
+
+        With a filter, the probed lists are intersected with the filtered
+        rows; when that leaves fewer than top_k rows, or the filter alone
+        selects fewer rows than the probes, the filtered rows are scanned
+        exactly instead.
+
+        Args:
+            query_embedding (list): Query vector from the embedding model
+            top_k (int): Number of results to return
+            nprobe (int): Number of inverted lists to scan (defaults to IVF_NPROBE)
+            filters (dict): Metadata filter ({field: value or values})
+
+        Returns:
+            list: SearchHits with a cosine score, best match first
+        """
+        if self.centroids is None:
+            return super().search(query_embedding, top_k, filters=filters)
+        if len(self) == 0 or top_k <= 0:
+            return []
+
+        query = normalize_rows(query_embedding)[0]
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        rows = self._probe_rows(self.centroids @ query, nprobe, top_k, self.filtered_rows(filters))
+        if len(rows) == 0:
+            return []
+        return self._rank(query, rows, self._score(query, rows), top_k)
+
+    def search_many(self, query_embeddings, top_k=5, nprobe=None, filters=None):
+        """
+        search() for several queries at once
+
+        Centroids are scored for every query with one matrix-matrix product,
+        then the union of the probed rows is scored with another; each query
+        is ranked over its own probed rows only, so results match search().
+
+        Returns:
+            list: One result list per query, in order
+        """
+        if self.centroids is None:
+            return super().search_many(query_embeddings, top_k, filters=filters)
+        if len(query_embeddings) == 0:
+            return []
+        if len(self) == 0 or top_k <= 0:
+            return [[] for _ in query_embeddings]
+
+        queries = normalize_rows(query_embeddings)
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        filtered = self.filtered_rows(filters)
+        centroid_scores = queries @ self.centroids.T
+        query_rows = [self._probe_rows(scores, nprobe, top_k, filtered) for scores in centroid_scores]
+
+        union = np.unique(np.concatenate(query_rows))
+        if len(union) == 0:
+            return [[] for _ in query_embeddings]
+        scores = self._score_many(queries, union)
+        results = []
+        for query, query_scores, rows in zip(queries, scores, query_rows):
+            if len(rows) == 0:
+                results.append([])
+                continue
+            positions = np.searchsorted(union, rows)
+            results.append(self._rank(query, rows, query_scores[positions], top_k))
+        return results
+
+    def _probe_rows(self, centroid_scores, nprobe, top_k, filtered=None):
+        """
+        Sorted rows in the nprobe lists closest to a query; with a filter,
+        those of them it selects, or all filtered rows when that is smaller
+        or leaves fewer than top_k
+        """
+        lists = self.inverted_lists()
+        probes = top_k_rows(centroid_scores, nprobe)
+        rows = np.concatenate([lists[c] for c in probes])
+        rows.sort()
+        if filtered is not None:
+            probed = np.intersect1d(rows, filtered, assume_unique=True)
+            rows = filtered if len(filtered) <= len(rows) or len(probed) < top_k else probed
+        return rows
+
+    def _array_files(self):
+        files = super()._array_files()
+        if self.centroids is not None:
+            files[self.centroids_path] = self.centroids
+            files[self.assignments_path] = self.assignments
+        return files
+
+    def save(self):
+        """Persist the vectors, centroids and list assignments"""
+        if not super().save():
+            return False
+        with open(self.ivf_path, "w", encoding="utf-8") as f:
+            json.dump({"trained_size": self.trained_size, "nlist": self.nlist}, f)
+        if self.centroids is None:
+            for path in (self.centroids_path, self.assignments_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        return True
+
+    def load(self):
+        """Memory-map a previously saved index and its centroids from disk"""
+        if not super().load():
+            return False
+
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+        if not os.path.exists(self.centroids_path) or not os.path.exists(self.assignments_path):
+            return True
+
+        try:
+            centroids = np.load(self.centroids_path)
+            assignments = np.load(self.assignments_path)
+            with open(self.ivf_path, "r", encoding="utf-8") as f:
+                trained_size = json.load(f).get("trained_size", len(self))
+        except Exception as e:
+            logger.error(f"Error loading IVF lists from {self.index_dir}: {str(e)}")
+            return True
+
+        if len(assignments) == len(self):
+            self.centroids = centroids
+            self.assignments = assignments
+            self.trained_size = trained_size
+        return True
+
+    def clear(self):
+        super().clear()
+        for path in (self.centroids_path, self.assignments_path, self.ivf_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+
+# Index implementations by search backend name
+INDEX_TYPES = {
+    "local": LocalVectorIndex,
+    "ivf": IVFVectorIndex,
+}
+
+# One index per (backend, database, collection), with the index version it was loaded at
+_indexes = {}
+_versions = {}
+_load_lock = threading.Lock()
+
+def index_key(db_name, collection_name, kind="local"):
+    """Name of an index, also used as its directory under LOCAL_INDEX_DIR"""
+    key = f"{db_name}.{collection_name}"
+    return key if kind == "local" else f"{key}.{kind}"
+
+def needs_refresh(index):
+    """Whether an index is missing its IVF lists or quantized codes"""
+    if isinstance(index, IVFVectorIndex) and index.needs_training():
+        return True
+    return index.quantizer is not None and index.codes is None and len(index) > 0
+
+def refresh(index):
+    """Retrain IVF lists and quantized codes where they are missing or stale"""
+    if isinstance(index, IVFVectorIndex) and index.needs_training():
+        index.train()
+    if index.quantizer is not None and index.codes is None:
+        index.quantize()
+
+def current_version(collection):
+    """Index version of a collection, or None if it can't be read"""
+    try:
+        return index_versions.get(collection.database, collection.name)
+    except Exception as e:
+        logger.error(f"Error reading index version of {collection.name}: {str(e)}")
+        return None
+
+def is_current(versions, key, collection, version):
+    """
+    Whether the loaded index under key reflects every change up to version
+
+    Args:
+        versions (dict): Index version each loaded index was loaded at, by key
+        key (str): Key of the loaded index
+        collection: pymongo collection the index covers
+        version (int): Current index version of the collection (None if unknown)
+    """
+    if version is None:
+        # Keep serving what is loaded while MongoDB can't be reached
+        return True
+    loaded = versions.get(key)
+    if not index_versions.changed_elsewhere(collection.database, collection.name, loaded, version):
+        versions[key] = version
+        return True
+    logger.info(f"Index {key} changed in another process (version {loaded} -> {version}), reloading")
+    return False
+
+def get_local_index(collection, kind="local"):
+    """
+    Get the local index for a Mongo collection, loading it from disk or
+    building it from the collection on first use, and again whenever
+    another process changed the collection
+
+    Args:
+        collection: pymongo collection holding the chunk embeddings
+        kind (str): "local" for the exact index or "ivf" for the approximate one
+
+    Returns:
+        LocalVectorIndex: Index ready for search
+    """
+    key = index_key(collection.database.name, collection.name, kind)
+    version = current_version(collection)
+    index = _indexes.get(key)
+    if index is not None and is_current(_versions, key, collection, version):
+        return index
+
+    with _load_lock:
+        index = _indexes.get(key)
+        if index is not None and is_current(_versions, key, collection, version):
+            return index
+
+        index = INDEX_TYPES[kind](os.path.join(LOCAL_INDEX_DIR, key))
+        loaded = index.load()
+
+        # Rebuild if the collection changed since the index was saved
+        if not loaded or len(index) != collection.count_documents(HAS_EMBEDDING):
+            index.build_from_collection(collection)
+            index.save()
+        elif needs_refresh(index):
+            refresh(index)
+            index.save()
+
+        _indexes[key] = index
+        _versions[key] = version
+        return index
+
+def get_cached_index(db_name, collection_name, kind="local"):
+    """Return the already loaded index for a collection, if any"""
+    return _indexes.get(index_key(db_name, collection_name, kind))
+
+def open_local_indexes(collection):
+    """Every local index of a collection, whether loaded in this process or only saved on disk"""
+    indexes = []
+    for kind, index_type in INDEX_TYPES.items():
+        key = index_key(collection.database.name, collection.name, kind)
+        index = _indexes.get(key)
+        if index is None:
+            index = index_type(os.path.join(LOCAL_INDEX_DIR, key))
+            if not index.load():
+                continue
+        indexes.append(index)
+    return indexes
+
+class LocalIndexWriter:
+    """
+    Appends inserted vector documents to the local indexes of a collection.
+    Documents are buffered (as float32 vectors) and added every flush_size
+    documents, so streaming ingestion doesn't copy the index matrix per batch;
+    the indexes are saved once on close(). A BM25 index already built in this
+    process is updated immediately.
+    """
+
+    def __init__(self, collection, flush_size=4096):
+        # Imported here to avoid circular imports
+        from rag.bm25_index import get_cached_bm25_index
+
+        self.indexes = open_local_indexes(collection)
+        self.bm25_index = get_cached_bm25_index(collection.database.name, collection.name)
+        self.flush_size = flush_size
+        self._buffer = []
+
+    def add(self, documents):
+        if self.bm25_index is not None:
+            self.bm25_index.add_documents(documents)
+        if not self.indexes:
+            return
+        for doc in documents:
+            embedding = decode_embedding(doc)
+            if embedding is None:
+                continue
+            entry = {field: doc[field] for field in STORED_FIELDS if field in doc}
+            entry["_id"] = doc.get("_id", "")
+            entry["embedding"] = embedding
+            self._buffer.append(entry)
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        for index in self.indexes:
+            index.add_documents(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        for index in self.indexes:
+            if needs_refresh(index):
+                refresh(index)
+            index.save()
+
+def add_to_local_indexes(collection, documents):
+    """
+    Append newly inserted vector documents to every local index of a collection,
+    whether it is loaded in this process or only saved on disk
+
+    Args:
+        collection: pymongo collection the documents were inserted into
+        documents (list): Inserted documents, including "_id" and "embedding"
+    """
+    writer = LocalIndexWriter(collection)
+    writer.add(documents)
+    writer.close()
+
+def remove_from_local_indexes(collection, ids):
+    """
+    Remove deleted vector documents from every local index of a collection,
+    whether it is loaded in this process or only saved on disk
+
+    Args:
+        collection: pymongo collection the documents were deleted from
+        ids (list): _id of every deleted document
+    """
+    from rag.bm25_index import get_cached_bm25_index
+
+    for index in open_local_indexes(collection):
+        if index.remove_documents(ids):
+            index.save()
+    bm25_index = get_cached_bm25_index(collection.database.name, collection.name)
+    if bm25_index is not None:
+        bm25_index.remove_documents(ids)
+
+def reset_local_index(collection):
+    """Forget and delete every local index for a collection"""
+    from rag.bm25_index import reset_bm25_index
+
+    reset_bm25_index(collection)
+    for kind, index_type in INDEX_TYPES.items():
+        key = index_key(collection.database.name, collection.name, kind)
+        index = _indexes.pop(key, None)
+        _versions.pop(key, None)
+        if index is None:
+            index = index_type(os.path.join(LOCAL_INDEX_DIR, key))
+        index.clear()
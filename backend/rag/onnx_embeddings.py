@@ -0,0 +1,209 @@
+# rag/onnx_embeddings.py
+"""
+ONNX Runtime embedding backend.
+The Hugging Face model is exported to ONNX once (optionally with dynamic int8
+quantization of its weights) and cached under ONNX_MODEL_DIR; embeddings are
+then computed by ONNX Runtime with the same mean pooling as sentence-transformers.
+Select it with EMBEDDING_BACKEND=onnx, and check it against the PyTorch backend with
+    python -m rag.onnx_embeddings parity [pdf files...]
+"""
+import os
+import sys
+import glob
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_DIR = os.getenv(
+    "ONNX_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx")
+)
+# Quantize the exported weights to int8 (dynamic quantization)
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "True").lower() == "true"
+# Threads used by one ONNX Runtime session (0 = one per core)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# Texts per ONNX Runtime call
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+# Longest input in tokens; gte-large was trained with 512
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", "512"))
+
+def model_dir(model_name):
+    """Directory holding the exported model and tokenizer files"""
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+def export_onnx_model(model_name, quantize=ONNX_QUANTIZE):
+    """
+    Export a Hugging Face encoder to ONNX, unless it was exported already
+
+    Returns:
+        str: Path of the .onnx file to load
+    """
+    directory = model_dir(model_name)
+    fp32_path = os.path.join(directory, "model.onnx")
+    int8_path = os.path.join(directory, "model.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        logger.info(f"Exporting {model_name} to ONNX in {directory}")
+        os.makedirs(directory, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        tokenizer.save_pretrained(directory)
+
+        sample = tokenizer(["export"], return_tensors="pt")
+        inputs = ("input_ids", "attention_mask", "token_type_ids")
+        inputs = tuple(name for name in inputs if name in sample)
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in inputs}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in inputs),
+                fp32_path + ".tmp",
+                input_names=list(inputs),
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+        os.replace(fp32_path + ".tmp", fp32_path)
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        logger.info(f"Quantizing {fp32_path} to int8")
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+    return int8_path
+
+class OnnxEmbeddings:
+    """
+    Drop-in replacement for HuggingFaceEmbeddings (embed_query / embed_documents)
+    running on ONNX Runtime
+    """
+
+    def __init__(self, model_name, quantize=ONNX_QUANTIZE, threads=ONNX_THREADS,
+                 batch_size=ONNX_BATCH_SIZE, max_length=ONNX_MAX_LENGTH):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.model_path = export_onnx_model(model_name, quantize)
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir(model_name))
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _embed(self, texts):
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True,
+            max_length=self.max_length, return_tensors="np"
+        )
+        feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(["last_hidden_state"], feed)[0]
+
+        # Mean pooling over real tokens, as sentence-transformers does for gte
+        mask = encoded["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.maximum(norms, 1e-12)
+
+    def embed_documents(self, texts):
+        """Embed a list of texts"""
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._embed(texts[start:start + self.batch_size]).tolist())
+        return embeddings
+
+    def embed_query(self, text):
+        """Embed one query"""
+        return self._embed([text])[0].tolist()
+
+def cosine_parity(reference, candidate, texts, batch_size=32):
+    """
+    Compare two embedding backends on the same texts
+
+    Returns:
+        dict: Min / mean / p1 cosine similarity between their embeddings
+    """
+    similarities = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        a = np.asarray(reference.embed_documents(batch), dtype=np.float32)
+        b = np.asarray(candidate.embed_documents(batch), dtype=np.float32)
+        a /= np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+        b /= np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+        similarities.extend((a * b).sum(axis=1).tolist())
+
+    similarities = np.asarray(similarities)
+    return {
+        "texts": len(similarities),
+        "min": float(similarities.min()) if len(similarities) else None,
+        "p1": float(np.percentile(similarities, 1)) if len(similarities) else None,
+        "mean": float(similarities.mean()) if len(similarities) else None,
+    }
+
+def sample_corpus_chunks(pdf_paths, limit=500):
+    """Up to limit chunks from the given PDFs, split like the ingestion path"""
+    from rag.chunking import get_text_splitter
+    from rag.pdf_extraction import iter_pdf_pages
+    from rag.ingestion import iter_text_chunks
+
+    text_splitter = get_text_splitter()
+    chunks = []
+    for pdf_path in pdf_paths:
+        pages = (page_text for _, page_text in iter_pdf_pages([pdf_path], workers=1))
+        for chunk in iter_text_chunks(pages, text_splitter):
+            chunks.append(chunk)
+            if len(chunks) >= limit:
+                return chunks
+    return chunks
+
+if __name__ == "__main__":
+    import json
+    import time
+    from rag.embedding_models import EMBEDDING_MODEL_NAME, load_embedding_model
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "parity"
+
+    if command == "export":
+        print(export_onnx_model(EMBEDDING_MODEL_NAME))
+    elif command == "parity":
+        pdf_paths = sys.argv[2:] or sorted(glob.glob(os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pdf_files", "*.pdf"
+        )))
+        texts = sample_corpus_chunks(pdf_paths)
+
+        reference = load_embedding_model(EMBEDDING_MODEL_NAME, "torch")
+        candidate = load_embedding_model(EMBEDDING_MODEL_NAME, "onnx")
+
+        timings = {}
+        for name, backend in (("torch", reference), ("onnx", candidate)):
+            backend.embed_documents(texts[:8])
+            started = time.perf_counter()
+            backend.embed_documents(texts)
+            timings[name] = time.perf_counter() - started
+
+        report = cosine_parity(reference, candidate, texts)
+        report["seconds"] = timings
+        report["speedup"] = timings["torch"] / timings["onnx"] if timings["onnx"] else None
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Unknown command: {command}")
+        print("Usage: python -m rag.onnx_embeddings [export|parity] [pdf files...]")
+        sys.exit(1)
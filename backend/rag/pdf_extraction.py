@@ -0,0 +1,268 @@
+# rag/pdf_extraction.py
+"""
+Parallel, streaming PDF text extraction.
+PyPDF2 extraction is CPU-bound pure Python, so files (and page ranges of large
+files) are fanned out over worker processes, started once per ingestion run and
+reused for every file. Pages always come back in input order, and a per-file
+deadline keeps one malformed PDF from stalling a batch.
+Files are parsed through a read-only memory map, so the OS pages in the parts
+PyPDF2 seeks to instead of each reader holding its own copy of a large file.
+"""
+import os
+import mmap
+import time
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+from contextlib import contextmanager
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for extraction (1 = extract in the calling process)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to one worker at a time; large files are split into ranges of this size
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+# Seconds of extraction one file may take before the rest of it is abandoned
+PDF_FILE_TIMEOUT = float(os.getenv("PDF_FILE_TIMEOUT", "300"))
+
+@contextmanager
+def open_pdf(pdf_path):
+    """Open a PDF for PdfReader as a read-only memory map (a plain file if it is empty)"""
+    with open(pdf_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield file
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+def extract_page_text(page):
+    """Text of one PdfReader page ("" for pages without text)"""
+    return page.extract_text() or ""
+
+def extract_page_range(pdf_path, start=0, end=None):
+    """
+    Extract the text of pages [start, end) of a PDF
+
+    Returns:
+        list: One string per page ("" for pages without text)
+    """
+    with open_pdf(pdf_path) as file:
+        reader = PdfReader(file)
+        pages = reader.pages[start:end]
+        return [extract_page_text(page) for page in pages]
+
+def count_pages(pdf_path):
+    """Number of pages in a PDF"""
+    with open_pdf(pdf_path) as file:
+        return len(PdfReader(file).pages)
+
+def iter_page_ranges(pdf_paths, pages_per_task, start_page=0):
+    """Yield (pdf_path, start, end) page ranges covering every readable file from start_page on"""
+    for pdf_path in pdf_paths:
+        try:
+            page_count = count_pages(pdf_path)
+        except Exception as e:
+            logger.error(f"Error reading {pdf_path}: {str(e)}")
+            continue
+        for start in range(start_page, page_count, pages_per_task):
+            yield pdf_path, start, min(start + pages_per_task, page_count)
+
+def extraction_worker(conn):
+    """Worker process loop: extract each page range received on conn and send back (ok, pages or error)"""
+    while True:
+        try:
+            page_range = conn.recv()
+        except EOFError:
+            return
+        if page_range is None:
+            return
+        try:
+            reply = (True, extract_page_range(*page_range))
+        except Exception as e:
+            reply = (False, str(e))
+        conn.send(reply)
+
+class PdfPageExtractor:
+    """
+    Streams the page texts of PDFs over a set of worker processes shared by
+    every iter_pages call, so an ingestion run extracting file after file
+    doesn't start a pool per file. Workers are started on first use and
+    stopped by close(), or on leaving a with block.
+
+    Each worker has its own pipe rather than a queue shared with the others,
+    so a worker stuck on a malformed file can be killed and replaced on its
+    own (multiprocessing.Pool can only terminate every worker at once, and
+    Pool.terminate() can deadlock on the lock of its shared queue).
+
+    Each file gets timeout seconds of extraction. Only the time spent waiting
+    for (or running) extraction counts, not the time the consumer takes with
+    the pages already yielded. With workers <= 1 the deadline is checked
+    between pages, as a page is extracted in the calling process.
+    """
+
+    def __init__(self, workers=PDF_WORKERS, pages_per_task=PDF_PAGES_PER_TASK, timeout=PDF_FILE_TIMEOUT):
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.timeout = timeout
+        # (process, conn) of the started workers waiting for a page range
+        self._idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the idle workers"""
+        for process, conn in self._idle:
+            conn.send(None)
+            conn.close()
+        for process, _ in self._idle:
+            process.join()
+        self._idle = []
+
+    @staticmethod
+    def _start_worker():
+        conn, worker_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=extraction_worker, args=(worker_conn,), daemon=True)
+        process.start()
+        worker_conn.close()
+        return process, conn
+
+    @staticmethod
+    def _kill(process, conn):
+        process.kill()
+        process.join()
+        conn.close()
+
+    def iter_pages(self, pdf_paths, start_page=0):
+        """
+        Stream the page texts of several PDFs, extracting in parallel when workers > 1
+
+        Every worker extracts one page range at a time and at most two ranges
+        per worker are extracted ahead of the consumer, so memory stays
+        bounded however slowly the pages are consumed.
+
+        Args:
+            pdf_paths (list): Paths of the PDF files
+            start_page (int): First page extracted from each file (to resume a file part way)
+
+        Yields:
+            tuple: (pdf_path, page_text), in file and page order
+        """
+        if self.workers <= 1:
+            yield from self._iter_serial(pdf_paths, start_page)
+            return
+
+        # Ranges are keyed by file position, so a path listed twice is two files
+        ranges = (
+            (position, page_range)
+            for position, pdf_path in enumerate(pdf_paths)
+            for page_range in iter_page_ranges([pdf_path], self.pages_per_task, start_page)
+        )
+        tasks = {}    # task number -> (file position, page range), until yielded
+        busy = {}     # conn -> (task number, process) of workers extracting a range
+        replies = {}  # task number -> (ok, pages or error) received ahead of its turn
+        waited = {}   # file position -> seconds spent waiting for its ranges
+        failed = set()
+        submitted = head = 0
+
+        def fail(position):
+            """Give up on a file, stopping the workers still extracting its ranges"""
+            failed.add(position)
+            for conn, (number, process) in list(busy.items()):
+                if tasks[number][0] == position:
+                    del busy[conn]
+                    self._kill(process, conn)
+
+        try:
+            while True:
+                # Hand ranges to free workers, up to two per worker ahead of the consumer
+                while submitted - head < 2 * self.workers and (self._idle or len(busy) < self.workers):
+                    task = next(ranges, None)
+                    if task is None:
+                        break
+                    if task[0] in failed:
+                        continue
+                    process, conn = self._idle.pop() if self._idle else self._start_worker()
+                    conn.send(task[1])
+                    busy[conn] = (submitted, process)
+                    tasks[submitted] = task
+                    submitted += 1
+                if head == submitted:
+                    return
+
+                position, (pdf_path, start, end) = tasks[head]
+                if head not in replies and position not in failed:
+                    remaining = self.timeout - waited.get(position, 0.0)
+                    started = time.monotonic()
+                    for conn in wait(list(busy), timeout=max(remaining, 0.0)):
+                        number, process = busy.pop(conn)
+                        try:
+                            replies[number] = conn.recv()
+                        except EOFError:
+                            replies[number] = (False, f"worker exited with code {process.exitcode}")
+                            process.join()
+                            conn.close()
+                            continue
+                        self._idle.append((process, conn))
+                    waited[position] = waited.get(position, 0.0) + time.monotonic() - started
+                    if head not in replies and waited[position] >= self.timeout:
+                        logger.error(f"Timed out extracting text from {pdf_path} after {self.timeout}s")
+                        fail(position)
+                    continue
+
+                del tasks[head]
+                reply = replies.pop(head, None)
+                head += 1
+                if position in failed:
+                    continue
+                ok, pages = reply
+                if not ok:
+                    logger.error(f"Error extracting pages {start}-{end} of {pdf_path}: {pages}")
+                    fail(position)
+                    continue
+                for page_text in pages:
+                    yield pdf_path, page_text
+        finally:
+            # Ranges still being extracted were abandoned by the consumer
+            for conn, (_, process) in busy.items():
+                self._kill(process, conn)
+
+    def _iter_serial(self, pdf_paths, start_page):
+        """Extract in the calling process, checking each file's deadline after every page"""
+        for pdf_path in pdf_paths:
+            elapsed = 0.0
+            started = time.monotonic()
+            try:
+                with open_pdf(pdf_path) as file:
+                    for page in PdfReader(file).pages[start_page:]:
+                        page_text = extract_page_text(page)
+                        elapsed += time.monotonic() - started
+                        if elapsed > self.timeout:
+                            logger.error(f"Timed out extracting text from {pdf_path} after {self.timeout}s")
+                            break
+                        yield pdf_path, page_text
+                        started = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
+
+def iter_pdf_pages(pdf_paths, workers=PDF_WORKERS, pages_per_task=PDF_PAGES_PER_TASK, timeout=PDF_FILE_TIMEOUT,
+                   start_page=0):
+    """
+    Stream the page texts of several PDFs over worker processes of their own
+
+    Args:
+        pdf_paths (list): Paths of the PDF files
+        workers (int): Number of worker processes (1 = extract in the calling process)
+        pages_per_task (int): Maximum pages extracted by one task
+        timeout (float): Seconds of extraction each file may take
+        start_page (int): First page extracted from each file (to resume a file part way)
+
+    Yields:
+        tuple: (pdf_path, page_text), in file and page order
+    """
+    with PdfPageExtractor(workers, pages_per_task, timeout) as extractor:
+        yield from extractor.iter_pages(pdf_paths, start_page)
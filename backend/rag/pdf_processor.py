@@ -1,23 +1,25 @@
 import os
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from itertools import groupby
+from operator import itemgetter
 from rag.settings import PDF_DIR
+from rag.pdf_extraction import iter_pdf_pages, PDF_WORKERS
+from rag.ingestion import iter_text_chunks
+from rag.chunking import get_text_splitter
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=200, chunk_overlap=16
-)
+# Configured by CHUNK_UNIT, CHUNK_SIZE, CHUNK_OVERLAP and CHUNK_BOUNDARY
+text_splitter = get_text_splitter()
 
-def load_and_split_pdfs(specific_files=None):
+def find_pdf_files(specific_files=None):
     """
-    Load and split PDFs into text chunks for vector embedding
+    Find the PDF files to process
     
     Args:
         specific_files (list): Optional list of specific PDF filenames to process
     
     Returns:
-        list: Text chunks from the PDFs
+        list: Paths of the PDF files
     """
-    pdf_texts = []
+    pdf_paths = []
     
     # If specific files are provided, use them
     if specific_files:
@@ -25,52 +27,68 @@ def load_and_split_pdfs(specific_files=None):
             pdf_path = os.path.join(PDF_DIR, filename)
             if os.path.exists(pdf_path):
                 print(f"Processing specific file: {pdf_path}")
-                with open(pdf_path, 'rb') as file:
-                    reader = PdfReader(file)
-                    text = "".join([page.extract_text() or "" for page in reader.pages])
-                pdf_texts.append(text)
+                pdf_paths.append(pdf_path)
             else:
                 print(f"File not found: {pdf_path}")
         
-        if not pdf_texts:
+        if not pdf_paths:
             raise FileNotFoundError("None of the specified PDF files were found.")
     else:
         # Look for PDF files in the directory (case-insensitive)
-        found_files = False
-        for filename in os.listdir(PDF_DIR):
+        for filename in sorted(os.listdir(PDF_DIR)):
             if filename.lower().endswith('.pdf'):
                 pdf_path = os.path.join(PDF_DIR, filename)
                 print(f"Processing file: {pdf_path}")
-                try:
-                    with open(pdf_path, 'rb') as file:
-                        reader = PdfReader(file)
-                        text = "".join([page.extract_text() or "" for page in reader.pages])
-                    pdf_texts.append(text)
-                    found_files = True
-                except Exception as e:
-                    print(f"Error processing {filename}: {str(e)}")
+                pdf_paths.append(pdf_path)
         
-        if not found_files:
+        if not pdf_paths:
             # Try deeper search (including subdirectories)
             for root, dirs, files in os.walk(PDF_DIR):
-                for filename in files:
+                dirs.sort()
+                for filename in sorted(files):
                     if filename.lower().endswith('.pdf'):
                         pdf_path = os.path.join(root, filename)
                         print(f"Processing file from subdirectory: {pdf_path}")
-                        try:
-                            with open(pdf_path, 'rb') as file:
-                                reader = PdfReader(file)
-                                text = "".join([page.extract_text() or "" for page in reader.pages])
-                            pdf_texts.append(text)
-                            found_files = True
-                        except Exception as e:
-                            print(f"Error processing {filename}: {str(e)}")
+                        pdf_paths.append(pdf_path)
+    
+    return pdf_paths
+
+def iter_pdf_chunks(specific_files=None, workers=PDF_WORKERS):
+    """
+    Stream text chunks from the PDFs, page by page
+    
+    Each document is split on its own, so chunks never straddle two books, and
+    no document (let alone the whole corpus) is ever held as one string.
+    
+    Args:
+        specific_files (list): Optional list of specific PDF filenames to process
+        workers (int): Number of processes used to extract text (1 = serial)
+    
+    Yields:
+        dict: {"text", "filename", "chunk_index"} for every chunk
+    """
+    pdf_paths = find_pdf_files(specific_files)
+    pages = iter_pdf_pages(pdf_paths, workers=workers)
+    for pdf_path, document_pages in groupby(pages, key=itemgetter(0)):
+        filename = os.path.basename(pdf_path)
+        page_texts = (page_text for _, page_text in document_pages)
+        for chunk_index, chunk in enumerate(iter_text_chunks(page_texts, text_splitter)):
+            yield {"text": chunk, "filename": filename, "chunk_index": chunk_index}
+
+def load_and_split_pdfs(specific_files=None, workers=PDF_WORKERS):
+    """
+    Load and split PDFs into text chunks for vector embedding
+    
+    Args:
+        specific_files (list): Optional list of specific PDF filenames to process
+        workers (int): Number of processes used to extract text (1 = serial)
+    
+    Returns:
+        list: Text chunks from the PDFs
+    """
+    chunks = [chunk["text"] for chunk in iter_pdf_chunks(specific_files, workers)]
     
     # Check if we found any text
-    if not pdf_texts:
+    if not chunks:
         print(f"No valid PDF content found in {PDF_DIR}")
-        return []
-    
-    # Split the text into chunks
-    combined_text = " ".join(pdf_texts)
-    return text_splitter.split_text(combined_text)
\ No newline at end of file
+    return chunks
\ No newline at end of file
@@ -0,0 +1,210 @@
+# rag/prompt_builder.py
+"""
+Token-budgeted prompt assembly shared by every chat endpoint.
+Messages are counted with tiktoken and added by priority until the input
+budget is spent: the system prompt and the user's question always, then birth
+details, then retrieved context in rank order, then the newest conversation
+history. Overlapping and duplicate chunks are merged first, so the budget
+isn't spent twice on the same text.
+"""
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Maximum input tokens sent to the LLM per request
+PROMPT_INPUT_BUDGET = int(os.getenv("PROMPT_INPUT_BUDGET", "3000"))
+# Upper bound on history messages considered, newest first
+PROMPT_MAX_HISTORY = int(os.getenv("PROMPT_MAX_HISTORY", "5"))
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Shortest suffix/prefix overlap between two chunks that is merged
+MIN_CHUNK_OVERLAP = 8
+
+CONTEXT_PREFIX = "Use the following context from Vedic astrology texts to inform your answer: "
+
+_encoders = {}
+
+def get_encoder(model=None):
+    """tiktoken encoding for a model, or None if tiktoken is unavailable"""
+    model = model or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            logger.warning("tiktoken is not installed, estimating token counts")
+            _encoders[model] = None
+    return _encoders[model]
+
+def count_tokens(text, model=None):
+    """Number of tokens in a text"""
+    if not text:
+        return 0
+    encoder = get_encoder(model)
+    if encoder is None:
+        return max(1, len(text) // 4)
+    return len(encoder.encode(text, disallowed_special=()))
+
+def format_birth_details(birth_details):
+    """System message describing the user's birth details"""
+    return f"""
+            The user has provided these birth details:
+            Date: {birth_details.get('date', 'Not provided')}
+            Time: {birth_details.get('time', 'Not provided')}
+            Place: {birth_details.get('place', 'Not provided')}
+
+            Use these details in your analysis when relevant.
+            """
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+def _overlap(previous, text, max_overlap=256):
+    """Length of the longest suffix of previous that is a prefix of text"""
+    for size in range(min(len(previous), len(text), max_overlap), MIN_CHUNK_OVERLAP - 1, -1):
+        if previous.endswith(text[:size]):
+            return size
+    return 0
+
+def dedupe_chunks(chunks):
+    """
+    Drop chunks contained in a higher-ranked one and strip the text a chunk
+    shares with the end of another (the splitter's chunk overlap)
+
+    Args:
+        chunks (list): Chunk texts, best first
+
+    Returns:
+        tuple: (unique chunk texts in rank order, number of chunks dropped)
+    """
+    unique = []
+    dropped = 0
+    for chunk in chunks:
+        text = _normalize(chunk or "")
+        if not text or any(text in kept for kept in unique):
+            dropped += 1
+            continue
+        # Strip the text this chunk repeats from the end of a kept chunk
+        for kept in unique:
+            size = _overlap(kept, text)
+            if size:
+                text = text[size:].strip()
+        if text:
+            unique.append(text)
+        else:
+            dropped += 1
+    return unique, dropped
+
+def build_messages(system_prompt, user_message, birth_details=None, context_chunks=None,
+                   conversation_history=None, budget=PROMPT_INPUT_BUDGET, model=None,
+                   empty_context=None, missing_birth_details=None, max_history=PROMPT_MAX_HISTORY):
+    """
+    Assemble the chat messages for one request within a token budget
+
+    Args:
+        system_prompt (str): Instructions, always included
+        user_message (str): The question, always included
+        birth_details (dict): Birth date/time/place, if provided
+        context_chunks (list): Retrieved chunk texts, best first
+        conversation_history (list): Earlier {"role", "content"} messages, oldest first
+        budget (int): Maximum input tokens
+        model (str): Model whose tokenizer is used (defaults to OPENAI_MODEL)
+        empty_context (str): Context message used when no chunk is available (None = no message)
+        missing_birth_details (str): System message used when birth details are missing (None = no message)
+        max_history (int): Most history messages considered
+
+    Returns:
+        tuple: (messages list, token report dict)
+    """
+    report = {
+        "budget": budget,
+        "system": 0,
+        "birth_details": 0,
+        "context": 0,
+        "history": 0,
+        "user": 0,
+        "context_chunks_used": 0,
+        "context_chunks_dropped": 0,
+        "duplicate_chunks": 0,
+        "history_used": 0,
+        "history_dropped": 0,
+    }
+
+    def cost(text):
+        return count_tokens(text, model) + MESSAGE_OVERHEAD_TOKENS
+
+    # Required parts, even if they alone exceed the budget
+    system_message = {"role": "system", "content": system_prompt}
+    user = {"role": "user", "content": user_message}
+    report["system"] = cost(system_prompt)
+    report["user"] = cost(user_message)
+    remaining = budget - report["system"] - report["user"]
+
+    # Birth details
+    birth_message = None
+    if birth_details:
+        birth_message = {"role": "system", "content": format_birth_details(birth_details)}
+    elif missing_birth_details:
+        birth_message = {"role": "system", "content": missing_birth_details}
+    if birth_message is not None:
+        tokens = cost(birth_message["content"])
+        if tokens <= remaining:
+            report["birth_details"] = tokens
+            remaining -= tokens
+        else:
+            birth_message = None
+
+    # Retrieved context, best-ranked chunks first
+    context_message = None
+    chunks, report["duplicate_chunks"] = dedupe_chunks(context_chunks or [])
+    if chunks:
+        used = []
+        tokens = cost(CONTEXT_PREFIX)
+        for chunk in chunks:
+            chunk_tokens = count_tokens(chunk, model) + 1
+            if tokens + chunk_tokens <= remaining:
+                used.append(chunk)
+                tokens += chunk_tokens
+        report["context_chunks_used"] = len(used)
+        report["context_chunks_dropped"] = len(chunks) - len(used)
+        if used:
+            context_message = {"role": "system", "content": CONTEXT_PREFIX + "\n\n".join(used)}
+            report["context"] = cost(context_message["content"])
+            remaining -= report["context"]
+    if context_message is None and empty_context:
+        tokens = cost(CONTEXT_PREFIX + empty_context)
+        if tokens <= remaining:
+            context_message = {"role": "system", "content": CONTEXT_PREFIX + empty_context}
+            report["context"] = tokens
+            remaining -= tokens
+
+    # Conversation history, newest first, stopping at the first that doesn't fit
+    history = []
+    candidates = (conversation_history or [])[-max_history:] if max_history > 0 else []
+    for message in reversed(candidates):
+        tokens = cost(message.get("content", ""))
+        if tokens > remaining:
+            break
+        history.append({"role": message["role"], "content": message["content"]})
+        report["history"] += tokens
+        remaining -= tokens
+    history.reverse()
+    report["history_used"] = len(history)
+    report["history_dropped"] = len(conversation_history or []) - len(history)
+
+    messages = [system_message]
+    if birth_message is not None:
+        messages.append(birth_message)
+    if context_message is not None:
+        messages.append(context_message)
+    messages.extend(history)
+    messages.append(user)
+
+    report["total"] = sum(report[part] for part in ("system", "birth_details", "context", "history", "user"))
+    logger.debug(f"Prompt tokens: {report}")
+    return messages, report
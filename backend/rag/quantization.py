@@ -0,0 +1,189 @@
+# rag/quantization.py
+"""
+Vector quantizers for the local indexes.
+Quantized codes replace the float32 matrix during the similarity scan, using
+asymmetric distance computation: the query stays full precision and is
+compared directly against the compressed codes.
+"""
+import os
+import numpy as np
+
+# Number of sub-vectors for product quantization (1024-d gte-large -> 128 bytes per vector)
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "128"))
+PQ_CENTROIDS = 256
+
+class ScalarQuantizer:
+    """int8 codes with one scale per vector (4x smaller than float32)"""
+
+    name = "int8"
+    trained = True
+    code_fields = ("codes", "scales")
+    state_fields = ()
+
+    def train(self, vectors):
+        return True
+
+    def encode(self, vectors):
+        """
+        Quantize unit vectors
+
+        Returns:
+            dict: "codes" (n, dim) int8 and "scales" (n,) float32
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        peaks = np.abs(vectors).max(axis=1)
+        scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+        codes = np.clip(np.round(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return {"codes": codes, "scales": scales}
+
+    def scores(self, codes, query, rows=None, batch_size=16384):
+        """Approximate inner products between the query and encoded vectors"""
+        all_codes, scales = codes["codes"], codes["scales"]
+        if rows is not None:
+            all_codes, scales = all_codes[rows], scales[rows]
+
+        out = np.empty(len(all_codes), dtype=np.float32)
+        for start in range(0, len(all_codes), batch_size):
+            block = all_codes[start:start + batch_size].astype(np.float32)
+            out[start:start + batch_size] = block @ query
+        return out * scales
+
+    def scores_many(self, codes, queries, rows=None, batch_size=16384):
+        """Approximate inner products between several queries and encoded vectors, as (queries, rows)"""
+        all_codes, scales = codes["codes"], codes["scales"]
+        if rows is not None:
+            all_codes, scales = all_codes[rows], scales[rows]
+
+        out = np.empty((len(queries), len(all_codes)), dtype=np.float32)
+        for start in range(0, len(all_codes), batch_size):
+            block = all_codes[start:start + batch_size].astype(np.float32)
+            out[:, start:start + batch_size] = queries @ block.T
+        return out * scales
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        return True
+
+class ProductQuantizer:
+    """
+    Product quantization: each vector is split into PQ_SUBVECTORS sub-vectors and
+    each one is stored as the uint8 id of its nearest of 256 trained centroids
+    (32x smaller than float32 with the defaults)
+    """
+
+    name = "pq"
+    code_fields = ("codes",)
+    state_fields = ("codebooks",)
+
+    def __init__(self, subvectors=PQ_SUBVECTORS):
+        self.subvectors = subvectors
+        self.codebooks = None  # (subvectors, 256, sub_dim) float32
+
+    @property
+    def trained(self):
+        return self.codebooks is not None
+
+    def _split(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, dim = vectors.shape
+        if dim % self.subvectors:
+            raise ValueError(f"Embedding size {dim} is not divisible by {self.subvectors} sub-vectors")
+        return vectors.reshape(n, self.subvectors, dim // self.subvectors)
+
+    def train(self, vectors, iterations=10, sample_size=8192, seed=0):
+        """Train one k-means codebook per sub-vector"""
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample_size:
+            rows = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+            vectors = vectors[rows]
+        if len(vectors) < PQ_CENTROIDS:
+            return False
+
+        parts = self._split(vectors)
+        codebooks = []
+        for j in range(self.subvectors):
+            sample = np.ascontiguousarray(parts[:, j, :])
+            centroids = sample[rng.choice(len(sample), PQ_CENTROIDS, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = self._nearest(sample, centroids)
+                counts = np.bincount(assignments, minlength=PQ_CENTROIDS)
+                sums = np.stack([
+                    np.bincount(assignments, weights=sample[:, d], minlength=PQ_CENTROIDS)
+                    for d in range(sample.shape[1])
+                ], axis=1).astype(np.float32)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            codebooks.append(centroids)
+
+        self.codebooks = np.stack(codebooks).astype(np.float32)
+        return True
+
+    @staticmethod
+    def _nearest(sample, centroids):
+        """Nearest centroid by Euclidean distance"""
+        distances = (centroids ** 2).sum(axis=1) - 2 * sample @ centroids.T
+        return np.argmin(distances, axis=1)
+
+    def encode(self, vectors, batch_size=8192):
+        """
+        Quantize vectors with the trained codebooks
+
+        Returns:
+            dict: "codes" (n, subvectors) uint8
+        """
+        parts = self._split(vectors)
+        codes = np.empty((len(parts), self.subvectors), dtype=np.uint8)
+        for start in range(0, len(parts), batch_size):
+            block = parts[start:start + batch_size]
+            for j in range(self.subvectors):
+                codes[start:start + batch_size, j] = self._nearest(block[:, j, :], self.codebooks[j])
+        return {"codes": codes}
+
+    def scores(self, codes, query, rows=None, batch_size=16384):
+        """Approximate inner products using a per-query lookup table"""
+        all_codes = codes["codes"] if rows is None else codes["codes"][rows]
+        sub_query = query.reshape(self.subvectors, -1)
+
+        # table[j, c] = <query sub-vector j, centroid c of codebook j>
+        table = np.einsum("jcd,jd->jc", self.codebooks, sub_query).ravel()
+        offsets = np.arange(self.subvectors) * PQ_CENTROIDS
+
+        out = np.empty(len(all_codes), dtype=np.float32)
+        for start in range(0, len(all_codes), batch_size):
+            block = all_codes[start:start + batch_size].astype(np.intp) + offsets
+            out[start:start + batch_size] = table[block].sum(axis=1)
+        return out
+
+    def scores_many(self, codes, queries, rows=None, batch_size=16384):
+        """Approximate inner products for several queries, as (queries, rows); one lookup table per query"""
+        selected = codes if rows is None else {"codes": codes["codes"][rows]}
+        count = len(selected["codes"])
+        out = np.empty((len(queries), count), dtype=np.float32)
+        for i, query in enumerate(queries):
+            out[i] = self.scores(selected, query, batch_size=batch_size)
+        return out
+
+    def state(self):
+        return {"codebooks": self.codebooks} if self.trained else {}
+
+    def load_state(self, state):
+        if "codebooks" not in state:
+            return False
+        self.codebooks = state["codebooks"]
+        self.subvectors = len(self.codebooks)
+        return True
+
+QUANTIZERS = {
+    "int8": ScalarQuantizer,
+    "pq": ProductQuantizer,
+}
+
+def get_quantizer(name):
+    """Create the quantizer for a LOCAL_INDEX_QUANTIZATION setting, or None"""
+    if not name or name == "none":
+        return None
+    if name not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization: {name}")
+    return QUANTIZERS[name]()
@@ -0,0 +1,167 @@
+# rag/reranker.py
+"""
+Optional cross-encoder reranking of retrieved chunks.
+Retrieval over-fetches RERANK_CANDIDATES chunks, a small CPU cross-encoder
+scores every (query, chunk) pair in one batch, and the best k are kept.
+Reranking never makes a request slower than RERANK_BUDGET_MS: it is skipped
+when the expected scoring time doesn't fit in what is left of the budget, and
+abandoned (keeping retrieval order) when scoring overruns it.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from rag.search_hits import as_hit
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "False").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Chunks retrieved for reranking per request
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Time budget for retrieval plus reranking, in milliseconds
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+# Concurrent scoring calls (an overrun call keeps its thread until it finishes)
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "2"))
+
+class Reranker:
+    """Cross-encoder with a latency budget and skip counters"""
+
+    def __init__(self, model_name=RERANK_MODEL, budget_ms=RERANK_BUDGET_MS, workers=RERANK_WORKERS):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+        # Moving average of scoring time per candidate, used to predict overruns
+        self._ms_per_candidate = None
+        self.calls = 0
+        self.reranked = 0
+        self.skipped_budget = 0
+        self.timed_out = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    @property
+    def model(self):
+        """The cross-encoder, loaded on first use"""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    started = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+                    logger.info(f"Loaded reranker {self.model_name} in {time.perf_counter() - started:.1f}s")
+        return self._model
+
+    def warmup(self):
+        """Load the model and score one pair so the first request doesn't pay for it"""
+        try:
+            self._score("warmup", [{"text": "warmup"}])
+            return True
+        except Exception as e:
+            logger.error(f"Error warming up reranker {self.model_name}: {str(e)}")
+            return False
+
+    def _score(self, query, documents):
+        started = time.perf_counter()
+        scores = self.model.predict([(query, doc.get("text", "")) for doc in documents])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        per_candidate = elapsed_ms / max(1, len(documents))
+        with self._stats_lock:
+            if self._ms_per_candidate is None:
+                self._ms_per_candidate = per_candidate
+            else:
+                self._ms_per_candidate = 0.8 * self._ms_per_candidate + 0.2 * per_candidate
+        return scores
+
+    def rerank(self, query, documents, top_k=5, started=None, budget_ms=None):
+        """
+        Reorder retrieved documents by cross-encoder score
+
+        Args:
+            query (str): User question
+            documents (list): Retrieved documents with a "text" field, best first
+            top_k (int): Number of documents to keep
+            started (float): time.perf_counter() when the request's retrieval
+                began; the budget covers retrieval and reranking together
+            budget_ms (float): Overrides RERANK_BUDGET_MS
+
+        Returns:
+            list: top_k documents, reranked when it fit in the budget
+        """
+        with self._stats_lock:
+            self.calls += 1
+        if len(documents) <= 1:
+            return documents[:top_k]
+
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        started = time.perf_counter() if started is None else started
+        remaining_ms = budget_ms - (time.perf_counter() - started) * 1000
+
+        # Skip up front if scoring is not expected to finish in time
+        expected_ms = (self._ms_per_candidate or 0.0) * len(documents)
+        if remaining_ms <= 0 or expected_ms > remaining_ms:
+            with self._stats_lock:
+                self.skipped_budget += 1
+            logger.info(f"Skipping rerank: {remaining_ms:.0f}ms left, ~{expected_ms:.0f}ms needed")
+            return documents[:top_k]
+
+        rerank_started = time.perf_counter()
+        future = self._executor.submit(self._score, query, documents)
+        try:
+            scores = future.result(timeout=remaining_ms / 1000)
+        except FutureTimeoutError:
+            with self._stats_lock:
+                self.timed_out += 1
+            logger.warning(f"Rerank exceeded the {budget_ms:.0f}ms budget, keeping retrieval order")
+            return documents[:top_k]
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            logger.error(f"Error reranking documents: {str(e)}")
+            return documents[:top_k]
+
+        ranked = sorted(zip(scores, range(len(documents))), key=lambda pair: pair[0], reverse=True)
+        results = []
+        for score, i in ranked[:top_k]:
+            result = as_hit(documents[i]).copy()
+            result.set_score("rerank", float(score))
+            results.append(result)
+
+        with self._stats_lock:
+            self.reranked += 1
+            self.total_ms += (time.perf_counter() - rerank_started) * 1000
+        return results
+
+    def stats(self):
+        """Counters for monitoring how often reranking ran or was skipped"""
+        with self._stats_lock:
+            skipped = self.skipped_budget + self.timed_out + self.errors
+            return {
+                "enabled": RERANK_ENABLED,
+                "model": self.model_name,
+                "budget_ms": self.budget_ms,
+                "calls": self.calls,
+                "reranked": self.reranked,
+                "skipped_budget": self.skipped_budget,
+                "timed_out": self.timed_out,
+                "errors": self.errors,
+                "skip_rate": skipped / self.calls if self.calls else 0.0,
+                "avg_rerank_ms": self.total_ms / self.reranked if self.reranked else 0.0,
+                "ms_per_candidate": self._ms_per_candidate,
+            }
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker():
+    """The process-wide reranker (the model itself loads on first use)"""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
@@ -0,0 +1,151 @@
+# rag/retrieval_cache.py
+"""
+Cache of ranked retrieval results.
+Maps (normalized query, k, filters, search parameters) to the ranked chunks
+search_similar_pdfs returned, so a repeated question skips query embedding and
+both retrievers. Every entry is tagged with the collection's index version,
+which ingestion bumps in MongoDB; entries from an older version are treated
+as misses, so new or deleted chunks are never hidden by the cache for longer
+than INDEX_VERSION_TTL. The in-process vector and BM25 indexes are checked
+against the same versions (rag/local_index.py, rag/bm25_index.py), so a
+server picks up chunks ingested by another process without a restart.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pymongo import ReturnDocument
+from rag.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))  # 0 = disabled
+# Seconds a process trusts its copy of an index version before re-reading it
+INDEX_VERSION_TTL = float(os.getenv("INDEX_VERSION_TTL", "5"))
+# Collection holding one version counter per vector collection
+INDEX_VERSION_COLLECTION = os.getenv("INDEX_VERSION_COLLECTION", "index_versions")
+
+def retrieval_key(db_name, collection_name, query, top_k, filters=None, **params):
+    """Cache key of a search; params are extra search settings such as nprobe"""
+    return json.dumps(
+        [db_name, collection_name, normalize_text(query), top_k, filters or {}, params],
+        sort_keys=True, default=str
+    )
+
+class IndexVersions:
+    """
+    Per-collection version counters stored in MongoDB, so a bump by an ingestion
+    process reaches every server process within INDEX_VERSION_TTL seconds
+    """
+
+    def __init__(self, ttl=INDEX_VERSION_TTL):
+        self.ttl = ttl
+        self._versions = {}
+        self._bumped = {}
+        self._lock = threading.Lock()
+
+    def get(self, db, collection_name):
+        """Current version of a collection's index (0 if it was never bumped)"""
+        key = f"{db.name}.{collection_name}"
+        with self._lock:
+            cached = self._versions.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.ttl:
+                return cached[0]
+
+        doc = db[INDEX_VERSION_COLLECTION].find_one({"_id": collection_name})
+        version = doc.get("version", 0) if doc else 0
+        with self._lock:
+            self._versions[key] = (version, time.monotonic())
+        return version
+
+    def bump(self, db, collection_name):
+        """Invalidate every cached retrieval for a collection"""
+        doc = db[INDEX_VERSION_COLLECTION].find_one_and_update(
+            {"_id": collection_name},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        version = doc.get("version", 0) if doc else 0
+        key = f"{db.name}.{collection_name}"
+        with self._lock:
+            self._versions[key] = (version, time.monotonic())
+            self._bumped.setdefault(key, set()).add(version)
+        logger.info(f"Bumped index version of {db.name}.{collection_name} to {version}")
+        return version
+
+    def changed_elsewhere(self, db, collection_name, since, version):
+        """
+        Whether a collection's index moved from version since to version through
+        a bump made by another process; the changes behind this process's own
+        bumps are already applied to its in-memory indexes
+        """
+        if version == since:
+            return False
+        if since is None or version < since:
+            return True
+        with self._lock:
+            bumped = self._bumped.get(f"{db.name}.{collection_name}", ())
+            return any(v not in bumped for v in range(since + 1, version + 1))
+
+class RetrievalCache:
+    """Thread-safe LRU of search results, tagged with index versions"""
+
+    def __init__(self, max_size=RETRIEVAL_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """Cached results for a key at the given index version, or None"""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return [result.copy() for result in entry[1]]
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, version, results):
+        """Cache the results of a search made at the given index version"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, [result.copy() for result in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+index_versions = IndexVersions()
+retrieval_cache = RetrievalCache()
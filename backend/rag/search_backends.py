@@ -0,0 +1,276 @@
+# rag/search_backends.py
+"""
+Vector search backends behind one interface.
+A backend makes the chunks of one vector collection searchable: Atlas
+$search, the exact in-process index or the approximate (IVF) one. The
+collection stays the source of truth; add/delete tell a backend about
+documents already written to it. Which backend serves a collection is decided
+once per process, after probing what the server supports, so a self-hosted
+MongoDB never receives a $search (or a $text query without a text index)
+that can only fail.
+"""
+import os
+import logging
+import threading
+from rag.embedding_codec import HAS_EMBEDDING, EMBEDDING_STORAGE
+from rag.search_filters import normalize_filters, atlas_filter
+from rag.search_hits import SearchHit, HIT_FIELDS
+from rag.local_index import (
+    get_local_index, index_key, add_to_local_indexes, remove_from_local_indexes, needs_refresh, refresh
+)
+
+logger = logging.getLogger(__name__)
+
+# "auto" (probe the server), "local" (exact in-process NumPy index), "ivf"
+# (approximate in-process index) or "atlas" ($search knnBeta)
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "auto").lower()
+VECTOR_INDEX_NAME = os.getenv("VECTOR_INDEX_NAME", "vectorSearchIndex")
+# With "auto", collections with at least this many vectors use the approximate index
+AUTO_IVF_MIN_VECTORS = int(os.getenv("AUTO_IVF_MIN_VECTORS", "200000"))
+
+class VectorBackend:
+    """Interface of a vector search backend over one Mongo collection"""
+
+    name = None
+
+    def __init__(self, collection, capabilities=None):
+        self.collection = collection
+        self.capabilities = capabilities or {}
+
+    def add(self, documents):
+        """
+        Make documents already inserted into the collection searchable
+
+        Args:
+            documents (list): Inserted documents, including "_id" and the embedding
+
+        Returns:
+            int: Number of documents added
+        """
+        raise NotImplementedError
+
+    def delete(self, ids):
+        """Stop returning documents deleted from the collection; returns the number removed"""
+        raise NotImplementedError
+
+    def search(self, query_embedding, top_k=5, filters=None, **params):
+        """
+        Find the top_k documents most similar to a query embedding
+
+        Args:
+            query_embedding (list): Query vector
+            top_k (int): Number of results to return
+            filters (dict): Metadata filter ({field: value or values}), applied
+                before the similarity search
+
+        Returns:
+            list: SearchHits with a similarity score, best match first
+        """
+        raise NotImplementedError
+
+    def search_many(self, query_embeddings, top_k=5, filters=None, **params):
+        """
+        search() for several query embeddings; backends that can score them
+        together override this
+
+        Returns:
+            list: One result list per query, in order
+        """
+        return [self.search(query_embedding, top_k, filters=filters, **params) for query_embedding in query_embeddings]
+
+    def count(self):
+        """Number of searchable documents"""
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Persist the searchable state, returning a description of it"""
+        raise NotImplementedError
+
+class AtlasBackend(VectorBackend):
+    """
+    MongoDB Atlas $search; the search index follows the collection by itself,
+    so add/delete only make sure the collection holds what they are told
+    """
+
+    name = "atlas"
+
+    def __init__(self, collection, capabilities=None, index_name=VECTOR_INDEX_NAME):
+        super().__init__(collection, capabilities)
+        self.index_name = index_name
+
+    def add(self, documents):
+        # The search index is built from the collection, so storing a document
+        # is what makes it searchable; insert any the caller hasn't written yet
+        ids = [doc["_id"] for doc in documents if "_id" in doc]
+        stored = {doc["_id"] for doc in self.collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+        missing = [doc for doc in documents if doc.get("_id") not in stored]
+        if missing:
+            self.collection.insert_many(missing, ordered=False)
+        return len(documents)
+
+    def delete(self, ids):
+        # Removing a document from the collection drops it from the search index
+        ids = list(ids)
+        if not ids:
+            return 0
+        self.collection.delete_many({"_id": {"$in": ids}})
+        return len(ids) - self.collection.count_documents({"_id": {"$in": ids}})
+
+    def search(self, query_embedding, top_k=5, filters=None, **params):
+        knn = {
+            "vector": list(query_embedding),
+            "path": "embedding",
+            "k": top_k
+        }
+        filters = normalize_filters(filters)
+        if filters:
+            # The filter fields need "token" mappings in the search index
+            knn["filter"] = atlas_filter(filters)
+        documents = self.collection.aggregate([
+            {
+                "$search": {
+                    "index": self.index_name,
+                    "knnBeta": knn
+                }
+            },
+            {"$limit": top_k},
+            # Only what a hit carries; the embedding stays on the server
+            {"$project": {**{field: 1 for field in HIT_FIELDS}, "score": {"$meta": "searchScore"}}}
+        ])
+        return [SearchHit.from_document(document) for document in documents]
+
+    def count(self):
+        return self.collection.count_documents(HAS_EMBEDDING)
+
+    def snapshot(self):
+        # Atlas keeps the search index itself
+        return {"backend": self.name, "index": self.index_name, "documents": self.count()}
+
+class LocalBackend(VectorBackend):
+    """Exact search over the in-process index, loaded or built on first use"""
+
+    name = "local"
+
+    @property
+    def index(self):
+        return get_local_index(self.collection, self.name)
+
+    def add(self, documents):
+        # Keeps every local index of the collection (and the BM25 index) in sync
+        add_to_local_indexes(self.collection, documents)
+        return len(documents)
+
+    def delete(self, ids):
+        before = len(self.index)
+        remove_from_local_indexes(self.collection, ids)
+        return before - len(self.index)
+
+    def search(self, query_embedding, top_k=5, filters=None, **params):
+        return self.index.search(query_embedding, top_k, filters=filters)
+
+    def search_many(self, query_embeddings, top_k=5, filters=None, **params):
+        return self.index.search_many(query_embeddings, top_k, filters=filters)
+
+    def count(self):
+        return len(self.index)
+
+    def snapshot(self):
+        index = self.index
+        if needs_refresh(index):
+            refresh(index)
+        index.save()
+        return {"backend": self.name, "path": index.index_dir, "documents": len(index)}
+
+class IVFBackend(LocalBackend):
+    """Approximate search over the in-process IVF index"""
+
+    name = "ivf"
+
+    def search(self, query_embedding, top_k=5, nprobe=None, filters=None, **params):
+        return self.index.search(query_embedding, top_k, nprobe=nprobe, filters=filters)
+
+    def search_many(self, query_embeddings, top_k=5, nprobe=None, filters=None, **params):
+        return self.index.search_many(query_embeddings, top_k, nprobe=nprobe, filters=filters)
+
+BACKENDS = {
+    "atlas": AtlasBackend,
+    "local": LocalBackend,
+    "ivf": IVFBackend,
+}
+
+def probe_capabilities(collection, index_name=VECTOR_INDEX_NAME):
+    """
+    What the server offers for a collection
+
+    Returns:
+        dict: {"atlas_search": whether the $search index exists and is queryable,
+            "text_index": whether $text queries can run, "vectors": documents with an embedding}
+    """
+    capabilities = {"atlas_search": False, "text_index": False, "vectors": 0}
+    try:
+        capabilities["vectors"] = collection.count_documents(HAS_EMBEDDING)
+    except Exception as e:
+        logger.error(f"Error counting vectors in {collection.name}: {str(e)}")
+    try:
+        # Fails on servers without Atlas Search
+        capabilities["atlas_search"] = any(
+            index.get("name") == index_name and index.get("queryable", True)
+            for index in collection.list_search_indexes()
+        )
+    except Exception as e:
+        logger.info(f"Atlas Search is not available for {collection.name}: {str(e)}")
+    try:
+        capabilities["text_index"] = any(
+            kind == "text"
+            for index in collection.index_information().values()
+            for _, kind in index.get("key", [])
+        )
+    except Exception as e:
+        logger.error(f"Error listing indexes of {collection.name}: {str(e)}")
+    return capabilities
+
+def select_backend(collection, requested=VECTOR_SEARCH_BACKEND):
+    """
+    Probe the server and construct the backend for a collection
+
+    "auto" picks the exact local index, or the IVF index from AUTO_IVF_MIN_VECTORS
+    vectors on; an "atlas" request falls back to that choice when the server has
+    no queryable search index or embeddings aren't stored as arrays.
+    """
+    capabilities = probe_capabilities(collection)
+    name = requested
+    if name == "atlas" and not capabilities["atlas_search"]:
+        logger.warning(f"Atlas search index {VECTOR_INDEX_NAME} is not available, using a local index")
+        name = "auto"
+    elif name == "atlas" and EMBEDDING_STORAGE != "float":
+        # $search only indexes embeddings stored as arrays
+        logger.warning(f"EMBEDDING_STORAGE={EMBEDDING_STORAGE} can't be searched by Atlas, using a local index")
+        name = "auto"
+    if name == "auto":
+        name = "ivf" if capabilities["vectors"] >= AUTO_IVF_MIN_VECTORS else "local"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown vector search backend: {requested}")
+
+    logger.info(f"Using {name} vector search for {collection.database.name}.{collection.name} ({capabilities})")
+    return BACKENDS[name](collection, capabilities)
+
+# Selected backend per (database, collection) for the lifetime of the process
+_backends = {}
+_lock = threading.Lock()
+
+def get_backend(collection):
+    """Get the backend serving a collection, selecting it on first use"""
+    key = index_key(collection.database.name, collection.name)
+    backend = _backends.get(key)
+    if backend is not None:
+        return backend
+
+    with _lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = _backends[key] = select_backend(collection)
+        return backend
+
+def get_cached_backend(db_name, collection_name):
+    """Return the already selected backend for a collection, if any"""
+    return _backends.get(index_key(db_name, collection_name))
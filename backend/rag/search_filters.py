@@ -0,0 +1,91 @@
+# rag/search_filters.py
+"""
+Metadata filters for search.
+A filter restricts a search to chunks whose metadata fields (the file, the
+GridFS pdf_id, the topic set at upload) take one of the given values, e.g.
+    {"filename": "book1.pdf"} or {"topic": ["dasha", "yoga"]}
+Values of one field are alternatives, different fields must all match. The
+local indexes resolve a filter through per-field posting lists before the
+similarity scan, so a search scoped to a tenth of the library scans a tenth
+of the vectors; on Atlas it becomes a knnBeta filter clause.
+"""
+import os
+import numpy as np
+
+# Chunk fields a search may be filtered on
+FILTER_FIELDS = tuple(
+    field.strip() for field in os.getenv("SEARCH_FILTER_FIELDS", "filename,pdf_id,topic").split(",") if field.strip()
+)
+
+def normalize_filters(filters):
+    """
+    Validate a filter and put it in canonical form
+
+    Args:
+        filters (dict): {field: value or list of values}, or None
+
+    Returns:
+        dict: {field: sorted list of string values}, or None for no filter
+
+    Raises:
+        ValueError: For a field that can't be filtered on
+    """
+    if not filters:
+        return None
+    normalized = {}
+    for field, values in filters.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Cannot filter search on {field!r}, filterable fields: {', '.join(FILTER_FIELDS)}")
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        normalized[field] = sorted({str(value) for value in values if value is not None})
+    return normalized
+
+def matches(document, filters):
+    """Whether a document satisfies a normalized filter"""
+    return all(str(document.get(field)) in values for field, values in filters.items())
+
+def mongo_query(filters):
+    """A normalized filter as a MongoDB query"""
+    return {field: {"$in": values} for field, values in (filters or {}).items()}
+
+def atlas_filter(filters):
+    """A normalized filter as an Atlas Search operator (fields indexed as token)"""
+    clauses = [{"in": {"path": field, "value": values}} for field, values in filters.items()]
+    return clauses[0] if len(clauses) == 1 else {"compound": {"filter": clauses}}
+
+class PostingLists:
+    """Sorted row numbers of an index's documents for every value of each filter field"""
+
+    def __init__(self, documents, fields=FILTER_FIELDS):
+        rows = {field: {} for field in fields}
+        for row, document in enumerate(documents):
+            for field in fields:
+                value = document.get(field)
+                if value is not None:
+                    rows[field].setdefault(str(value), []).append(row)
+        self.lists = {
+            field: {value: np.asarray(field_rows, dtype=np.intp) for value, field_rows in values.items()}
+            for field, values in rows.items()
+        }
+
+    def rows(self, filters):
+        """
+        Rows matching a normalized filter
+
+        Returns:
+            ndarray: Sorted row numbers
+        """
+        selected = None
+        for field, values in filters.items():
+            lists = [self.lists.get(field, {}).get(value) for value in values]
+            lists = [field_rows for field_rows in lists if field_rows is not None]
+            if len(lists) == 1:
+                field_rows = lists[0]
+            else:
+                # A row has one value per field, so the lists are disjoint
+                field_rows = np.sort(np.concatenate(lists)) if lists else np.arange(0)
+            selected = field_rows if selected is None else np.intersect1d(selected, field_rows, assume_unique=True)
+            if len(selected) == 0:
+                break
+        return selected if selected is not None else np.arange(0)
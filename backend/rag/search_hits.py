@@ -0,0 +1,109 @@
+# rag/search_hits.py
+"""
+Compact search results.
+Retrievers return SearchHit objects instead of copies of the stored chunk
+documents: the chunk's text, where it comes from (file, GridFS id, topic,
+position in the file) and how it scored, in __slots__ with no per-hit dict.
+Mongo queries behind a search project HIT_FIELDS only, so embeddings and
+other stored fields never cross the wire for a search. Hits can still be read
+like the dicts they replace (hit["text"], hit.get("score"), "text" in hit,
+dict(hit)).
+"""
+
+# Stored fields a hit carries, for Mongo projections
+HIT_FIELDS = ("text", "filename", "pdf_id", "chunk_index", "topic")
+
+class SearchHit:
+    """One search result; per-retriever scores (e.g. "vector", "bm25", "rerank") are kept in scores"""
+
+    __slots__ = ("id", "text", "score", "filename", "pdf_id", "chunk_index", "topic", "scores")
+
+    def __init__(self, id=None, text="", score=0.0, filename=None, pdf_id=None, chunk_index=None,
+                 topic=None, scores=None):
+        self.id = id
+        self.text = text
+        self.score = score
+        self.filename = filename
+        self.pdf_id = pdf_id
+        self.chunk_index = chunk_index
+        self.topic = topic
+        self.scores = scores
+
+    @classmethod
+    def from_document(cls, document, score=None):
+        """A hit for a chunk document (stored entry or Mongo document), scored by score or its "score" """
+        get = document.get
+        doc_id = get("_id")
+        return cls(
+            str(doc_id) if doc_id is not None else None,
+            get("text", ""),
+            float(get("score", 0.0) if score is None else score),
+            get("filename"),
+            get("pdf_id"),
+            get("chunk_index"),
+            get("topic"),
+        )
+
+    @property
+    def source(self):
+        """File the chunk comes from"""
+        return self.filename
+
+    def copy(self):
+        return SearchHit(
+            self.id, self.text, self.score, self.filename, self.pdf_id, self.chunk_index, self.topic,
+            dict(self.scores) if self.scores else None
+        )
+
+    def set_score(self, name, score):
+        """Record the score one retriever (or the reranker) gave this hit"""
+        if self.scores is None:
+            self.scores = {}
+        self.scores[name] = score
+
+    def metadata(self):
+        """Source metadata of the chunk, as LangChain-style document metadata"""
+        metadata = {"source": self.filename, "pdf_id": self.pdf_id, "chunk_index": self.chunk_index, "topic": self.topic}
+        return {key: value for key, value in metadata.items() if value is not None}
+
+    def to_dict(self):
+        """The hit as a plain (JSON-serializable) dict"""
+        return {key: self[key] for key in self.keys()}
+
+    # Read access under the keys of the result dicts hits replace
+
+    def keys(self):
+        keys = ["_id"] if self.id is not None else []
+        keys += [field for field in HIT_FIELDS if getattr(self, field) is not None]
+        keys.append("score")
+        keys += [f"{name}_score" for name in (self.scores or ())]
+        return keys
+
+    def __getitem__(self, key):
+        if key == "_id":
+            value = self.id
+        elif key in HIT_FIELDS or key == "score":
+            value = getattr(self, key)
+        elif key.endswith("_score") and self.scores and key[:-len("_score")] in self.scores:
+            value = self.scores[key[:-len("_score")]]
+        else:
+            value = None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __repr__(self):
+        return f"SearchHit({self.filename}#{self.chunk_index}, score={self.score:.4f})"
+
+def as_hit(result):
+    """A SearchHit for a result that may still be a plain document dict"""
+    return result if isinstance(result, SearchHit) else SearchHit.from_document(result)
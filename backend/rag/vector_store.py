@@ -1,9 +1,27 @@
-from langchain_huggingface import HuggingFaceEmbeddings
 from pymongo import MongoClient
 from gridfs import GridFS
 from dotenv import load_dotenv
 import os
+import time
 import logging
+from rag.local_index import LocalIndexWriter
+from rag.search_backends import get_backend, get_cached_backend
+from rag.bm25_index import (
+    get_bm25_index, reciprocal_rank_fusion,
+    HYBRID_VECTOR_WEIGHT, HYBRID_BM25_WEIGHT, HYBRID_FETCH_FACTOR
+)
+from rag.reranker import get_reranker, RERANK_ENABLED, RERANK_CANDIDATES
+from rag.retrieval_cache import retrieval_cache, index_versions, retrieval_key
+from rag.answer_cache import SemanticAnswerCache
+from rag.search_filters import normalize_filters, mongo_query
+from rag.search_hits import SearchHit, HIT_FIELDS, as_hit
+from rag.ingestion import (
+    iter_embedded_batches, prefetch, item_text, EMBEDDING_BATCH_SIZE
+)
+from rag.bulk_writer import BulkWriter
+from rag.embedding_codec import encode_embedding
+from rag.embedding_cache import EmbeddingCache
+from rag.embedding_models import get_embedding_model, model_key
 
 # Configure logging
 logging.basicConfig(
@@ -15,25 +33,72 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Initialize embedding model
-embedding_model = HuggingFaceEmbeddings(model_name='thenlper/gte-large')
+# Cache of query embeddings, keyed by normalized query text
+embedding_cache = EmbeddingCache(model_key())
 
 def generate_embedding(text):
     """Generate embedding vector for text"""
-    return embedding_model.embed_query(text)
+    return get_embedding_model().embed_query(text)
+
+def generate_query_embedding(query):
+    """Generate embedding vector for a search query, reusing cached results"""
+    embedding = embedding_cache.get(query)
+    if embedding is None:
+        embedding = generate_embedding(query)
+        embedding_cache.put(query, embedding)
+    return embedding
+
+def generate_query_embeddings(queries):
+    """
+    Generate embedding vectors for several search queries, reusing cached
+    results and embedding the rest in one batch
+    """
+    embeddings = [embedding_cache.get(query) for query in queries]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        # The model encodes queries and documents alike, so one embed_documents
+        # call replaces a forward pass per query
+        batch = get_embedding_model().embed_documents([queries[i] for i in missing])
+        for i, embedding in zip(missing, batch):
+            embeddings[i] = embedding
+            embedding_cache.put(queries[i], embedding)
+    return embeddings
+
+# Answers to impersonal chat questions, matched by question embedding
+answer_cache = SemanticAnswerCache(generate_query_embedding)
+
+def get_answer_cache_stats():
+    """Hit/miss counters and most reused entries of the semantic answer cache"""
+    return answer_cache.stats()
 
-def connect_to_mongodb():
+def get_embedding_cache_stats():
+    """Hit/miss/eviction counters of the query embedding cache"""
+    return embedding_cache.stats()
+
+def get_collection_names(db_name=None, collection_name=None):
+    """Resolve the vector database and collection names, falling back to the environment"""
+    db_name = db_name or os.getenv("MONGODB_DATABASE", "vector_db")
+    collection_name = collection_name or os.getenv("COLLECTION_NAME", "pdf_documents")
+    return db_name, collection_name
+
+# MongoClient per connection URI, shared by every call in this process
+_clients = {}
+
+def connect_to_mongodb(db_name=None, collection_name=None):
     """Connect to MongoDB and return client, db, GridFS, and collections"""
+    db_name, collection_name = get_collection_names(db_name, collection_name)
+
     # Get MongoDB connection details
     mongo_uri = os.getenv("MONGODB_URI")
     if not mongo_uri:
         raise ValueError("MONGODB_URI environment variable is not set")
         
-    # Connect to MongoDB
-    client = MongoClient(mongo_uri)
+    # Reuse one client (and its connection pool) per URI
+    client = _clients.get(mongo_uri)
+    if client is None:
+        client = _clients.setdefault(mongo_uri, MongoClient(mongo_uri))
     
     # Get database
-    db_name = os.getenv("MONGODB_DATABASE", "vector_db")
     db = client[db_name]
     
     # Initialize GridFS for file storage
@@ -41,45 +106,66 @@ def connect_to_mongodb():
     
     # Get collections
     pdf_collection = db["pdfs.files"]
-    vector_collection = db[os.getenv("COLLECTION_NAME", "pdf_documents")]
+    vector_collection = db[collection_name]
     
     return client, db, fs, pdf_collection, vector_collection
 
-def create_vector_store(texts):
-    """Create a vector store from text chunks"""
+def create_vector_store(texts, batch_size=EMBEDDING_BATCH_SIZE, on_failed=None):
+    """
+    Create a vector store from text chunks
+    
+    Chunks stream through extract -> embed -> write stages connected by bounded
+    queues, so texts may be a generator (see rag.pdf_processor.iter_pdf_chunks)
+    and memory stays flat however large the corpus is.
+    
+    Args:
+        texts (iterable): Text chunks, as strings or dicts with a "text" field
+            and extra fields (e.g. "filename", "chunk_index") to store
+        batch_size (int): Number of chunks embedded per forward pass
+        on_failed (callable): Called with every chunk that couldn't be embedded
+    """
     try:
-        logger.info(f"Creating vector store with {len(texts)} text chunks")
+        total = len(texts) if hasattr(texts, "__len__") else None
+        logger.info(f"Creating vector store with {total if total is not None else 'streamed'} text chunks")
         
         # Connect to MongoDB
         client, db, _, _, vector_collection = connect_to_mongodb()
         
-        # Generate embeddings and store in MongoDB
-        documents = []
-        for i, text in enumerate(texts):
-            try:
-                # Generate embedding
-                embedding = generate_embedding(text)
-                
-                # Create document
-                document = {
-                    "text": text,
-                    "embedding": embedding,
+        # Keep local indexes in sync with the collection
+        index_writer = LocalIndexWriter(vector_collection)
+        
+        # Embedded chunks are inserted in unordered batches by background
+        # threads while the next ones are embedded
+        writer = BulkWriter(vector_collection, on_written=index_writer.add)
+        embedded = 0
+        batches = iter_embedded_batches(
+            prefetch(texts), get_embedding_model().embed_documents, batch_size, on_failed=on_failed
+        )
+        for batch in batches:
+            documents = []
+            for i, item, embedding in batch:
+                document = {} if isinstance(item, str) else dict(item)
+                document.update({
+                    "text": item_text(item),
+                    **encode_embedding(embedding),
                     "metadata": {"index": i}
-                }
-                
+                })
                 documents.append(document)
-                
-                # Log progress
-                if (i + 1) % 10 == 0 or i == len(texts) - 1:
-                    logger.info(f"Processed {i + 1}/{len(texts)} documents")
-                    
-            except Exception as e:
-                logger.error(f"Error embedding document {i}: {str(e)}")
+            writer.put(documents)
+            
+            # Log progress
+            embedded += len(documents)
+            logger.info(f"Processed {embedded}/{total if total is not None else '?'} documents")
+        
+        inserted = writer.close()
+        index_writer.close()
+        
+        # Cached retrievals no longer reflect the collection
+        if inserted:
+            index_versions.bump(db, vector_collection.name)
         
-        # Insert into MongoDB
-        if documents:
-            vector_collection.insert_many(documents)
-            logger.info(f"Successfully inserted {len(documents)} documents into vector store")
+        if inserted:
+            logger.info(f"Successfully inserted {inserted} documents into vector store")
             return True
         else:
             logger.warning("No documents to insert")
@@ -109,23 +195,42 @@ def get_vector_store():
         return None
 
 class MongoDBVectorStore:
-    """Wrapper around MongoDB for vector search"""
+    """Vector store over one collection, searched through the backend selected for it"""
     
     def __init__(self, collection):
         self.collection = collection
+        self.backend = get_backend(collection)
     
-    def similarity_search(self, query, k=5):
-        """Find similar documents to the query"""
+    def similarity_search(self, query, k=5, nprobe=None, filters=None):
+        """
+        Find similar documents to the query
+        
+        Args:
+            query (str): Question to search for
+            k (int): Number of documents to return
+            nprobe (int): Inverted lists to scan when the "ivf" backend is used;
+                higher is slower but closer to exact search
+            filters (dict): Only search chunks whose filename, pdf_id or topic
+                is one of the given values, e.g. {"filename": "book1.pdf"}
+        """
         try:
             # Search for similar documents
-            results = search_similar_pdfs(query, k)
+            results = search_similar_pdfs(
+                query,
+                k,
+                db_name=self.collection.database.name,
+                collection_name=self.collection.name,
+                nprobe=nprobe,
+                filters=filters
+            )
             
             # Convert to the expected format
             documents = []
             for result in results:
+                result = as_hit(result)
                 documents.append({
-                    "page_content": result.get("text", ""),
-                    "metadata": result.get("metadata", {})
+                    "page_content": result.text,
+                    "metadata": result.metadata()
                 })
                 
             return documents
@@ -133,51 +238,284 @@ class MongoDBVectorStore:
         except Exception as e:
             logger.error(f"Error in similarity search: {str(e)}")
             return []
+    
+    def add_documents(self, documents):
+        """Insert embedded documents and make them searchable"""
+        if not documents:
+            return 0
+        self.collection.insert_many(documents, ordered=False)
+        added = self.backend.add(documents)
+        index_versions.bump(self.collection.database, self.collection.name)
+        return added
+    
+    def delete_documents(self, ids):
+        """Delete documents by _id from the collection and the backend"""
+        ids = list(ids)
+        if not ids:
+            return 0
+        result = self.collection.delete_many({"_id": {"$in": ids}})
+        self.backend.delete(ids)
+        index_versions.bump(self.collection.database, self.collection.name)
+        return result.deleted_count
+    
+    def count(self):
+        """Number of searchable documents"""
+        return self.backend.count()
+    
+    def snapshot(self):
+        """Persist the backend's searchable state"""
+        return self.backend.snapshot()
+
+def get_search_backend(db_name=None, collection_name=None):
+    """The search backend of a collection, probing the server on first use only"""
+    db_name, collection_name = get_collection_names(db_name, collection_name)
+    backend = get_cached_backend(db_name, collection_name)
+    if backend is None:
+        client, db, _, _, vector_collection = connect_to_mongodb(db_name, collection_name)
+        backend = get_backend(vector_collection)
+    return backend
 
-def search_similar_pdfs(query, top_k=5):
+def init_search_backend(db_name=None, collection_name=None):
+    """
+    Select the collection's backend and load its index at startup, so the
+    first request pays for neither
+    
+    Returns:
+        str: Name of the selected backend, or None on failure
+    """
     try:
-        # Connect to MongoDB
-        client, db, _, _, vector_collection = connect_to_mongodb()
-        
-        # Generate query embedding
-        query_embedding = generate_embedding(query)
-        
-        # Perform vector search using MongoDB Atlas
+        backend = get_search_backend(db_name, collection_name)
+        logger.info(f"Vector search backend ready: {backend.name} ({backend.count()} documents)")
+        return backend.name
+    except Exception as e:
+        logger.error(f"Error initializing vector search backend: {str(e)}")
+        return None
+
+def get_search_backend_stats(db_name=None, collection_name=None):
+    """Selected backend and probed capabilities of a collection"""
+    db_name, collection_name = get_collection_names(db_name, collection_name)
+    backend = get_cached_backend(db_name, collection_name)
+    if backend is None:
+        return {"backend": None}
+    return {"backend": backend.name, "capabilities": dict(backend.capabilities)}
+
+def search_bm25_index(query, top_k=5, db_name=None, collection_name=None, filters=None):
+    """
+    Keyword search over the in-process BM25 index, building it on first use
+    and rebuilding it after another process changed the collection
+    """
+    client, db, _, _, vector_collection = connect_to_mongodb(db_name, collection_name)
+    bm25_index = get_bm25_index(vector_collection)
+    
+    results = bm25_index.search(query, top_k, filters=filters)
+    logger.info(f"BM25 search found {len(results)} results")
+    return results
+
+def get_retrieval_cache_stats():
+    """Hit/miss/stale/eviction counters of the retrieval cache"""
+    return retrieval_cache.stats()
+
+def search_similar_pdfs(query, top_k=5, db_name=None, collection_name=None, nprobe=None, filters=None):
+    """
+    Find the chunks most relevant to a query
+    
+    Vector and BM25 keyword results are fused by reciprocal rank, weighted by
+    HYBRID_VECTOR_WEIGHT and HYBRID_BM25_WEIGHT; with the BM25 weight at 0 this
+    is plain vector search with a $text fallback. Results are cached until the
+    collection's index version changes.
+    
+    filters ({field: value or values} over filename, pdf_id and topic) narrows
+    the search to matching chunks before any scoring.
+    """
+    db_name, collection_name = get_collection_names(db_name, collection_name)
+    filters = normalize_filters(filters)
+    key = retrieval_key(db_name, collection_name, query, top_k, filters, nprobe=nprobe)
+    try:
+        client, db, _, _, _ = connect_to_mongodb(db_name, collection_name)
+        version = index_versions.get(db, collection_name)
+    except Exception as e:
+        logger.error(f"Error reading index version, bypassing retrieval cache: {e}")
+        version = None
+    
+    if version is not None:
+        results = retrieval_cache.get(key, version)
+        if results is not None:
+            logger.info(f"Retrieval cache hit ({len(results)} results)")
+            return results
+    
+    results = hybrid_search(query, top_k, db_name, collection_name, nprobe, filters)
+    if version is not None and results:
+        retrieval_cache.put(key, version, results)
+    return results
+
+def search_many(queries, k=5, db_name=None, collection_name=None, nprobe=None, filters=None):
+    """
+    search_similar_pdfs for several queries at once
+    
+    Queries in the retrieval cache are answered from it; the others are
+    embedded in one batch and scored together by the search backend (one
+    matrix-matrix product on the local indexes), then fused with BM25 one by
+    one as in search_similar_pdfs.
+    
+    Args:
+        queries (list): Query strings
+        k (int): Number of results per query
+        filters (dict): Metadata filter applied to every query
+    
+    Returns:
+        list: One result list per query, in order
+    """
+    queries = list(queries)
+    db_name, collection_name = get_collection_names(db_name, collection_name)
+    filters = normalize_filters(filters)
+    keys = [retrieval_key(db_name, collection_name, query, k, filters, nprobe=nprobe) for query in queries]
+    try:
+        client, db, _, _, _ = connect_to_mongodb(db_name, collection_name)
+        version = index_versions.get(db, collection_name)
+    except Exception as e:
+        logger.error(f"Error reading index version, bypassing retrieval cache: {e}")
+        version = None
+    
+    results = [None] * len(queries)
+    if version is not None:
+        results = [retrieval_cache.get(key, version) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) < len(queries):
+        logger.info(f"Retrieval cache hit for {len(queries) - len(missing)}/{len(queries)} queries")
+    
+    if missing:
+        fresh = hybrid_search_many([queries[i] for i in missing], k, db_name, collection_name, nprobe, filters)
+        for i, result in zip(missing, fresh):
+            results[i] = result
+            if version is not None and result:
+                retrieval_cache.put(keys[i], version, result)
+    return results
+
+def hybrid_search(query, top_k=5, db_name=None, collection_name=None, nprobe=None, filters=None):
+    """Vector search fused with BM25 keyword search, without caching"""
+    if HYBRID_BM25_WEIGHT <= 0:
+        return vector_search(query, top_k, db_name, collection_name, nprobe, filters=filters)
+    
+    candidates = top_k * max(1, HYBRID_FETCH_FACTOR)
+    vector_results = []
+    if HYBRID_VECTOR_WEIGHT > 0:
+        vector_results = vector_search(
+            query, candidates, db_name, collection_name, nprobe, text_fallback=False, filters=filters
+        )
+    
+    try:
+        keyword_results = search_bm25_index(query, candidates, db_name, collection_name, filters)
+    except Exception as e:
+        logger.error(f"Error performing BM25 search: {e}")
+        keyword_results = []
+    
+    return reciprocal_rank_fusion([
+        ("vector", vector_results, HYBRID_VECTOR_WEIGHT),
+        ("bm25", keyword_results, HYBRID_BM25_WEIGHT),
+    ], top_k)
+
+def hybrid_search_many(queries, top_k=5, db_name=None, collection_name=None, nprobe=None, filters=None):
+    """hybrid_search for several queries, with their vector searches batched"""
+    if HYBRID_BM25_WEIGHT <= 0:
+        return vector_search_many(queries, top_k, db_name, collection_name, nprobe, filters=filters)
+    
+    candidates = top_k * max(1, HYBRID_FETCH_FACTOR)
+    vector_results = [[] for _ in queries]
+    if HYBRID_VECTOR_WEIGHT > 0:
+        vector_results = vector_search_many(
+            queries, candidates, db_name, collection_name, nprobe, text_fallback=False, filters=filters
+        )
+    
+    results = []
+    for query, query_vector_results in zip(queries, vector_results):
         try:
-            results = vector_collection.aggregate([
-                {
-                    "$search": {
-                        "index": os.getenv("VECTOR_INDEX_NAME", "vectorSearchIndex"),
-                        "knnBeta": {
-                            "vector": query_embedding,
-                            "path": "embedding",
-                            "k": top_k
-                        }
-                    }
-                }
-            ])
-            
-            result_list = list(results)
-            if result_list:
-                logger.info(f"Vector search found {len(result_list)} results")
-                return result_list
-            else:
-                logger.info("Vector search returned no results, trying text search")
+            keyword_results = search_bm25_index(query, candidates, db_name, collection_name, filters)
         except Exception as e:
-            logger.error(f"Error performing vector search: {e}")
-        
-        # Fall back to text search
-        logger.info("Falling back to text search")
-        results = vector_collection.find(
-            {"$text": {"$search": query}},
-            {"score": {"$meta": "textScore"}}
-        ).sort([("score", {"$meta": "textScore"})]).limit(top_k)
+            logger.error(f"Error performing BM25 search: {e}")
+            keyword_results = []
+        results.append(reciprocal_rank_fusion([
+            ("vector", query_vector_results, HYBRID_VECTOR_WEIGHT),
+            ("bm25", keyword_results, HYBRID_BM25_WEIGHT),
+        ], top_k))
+    return results
+
+def search_reranked(query, top_k=5, db_name=None, collection_name=None, filters=None):
+    """
+    Retrieve context chunks for a prompt
+    
+    With RERANK_ENABLED, RERANK_CANDIDATES chunks are retrieved and the best
+    top_k are picked by the cross-encoder, within RERANK_BUDGET_MS; otherwise
+    this is search_similar_pdfs.
+    """
+    if not RERANK_ENABLED:
+        return search_similar_pdfs(query, top_k, db_name, collection_name, filters=filters)
+    
+    started = time.perf_counter()
+    candidates = search_similar_pdfs(
+        query, max(top_k, RERANK_CANDIDATES), db_name, collection_name, filters=filters
+    )
+    return get_reranker().rerank(query, candidates, top_k, started=started)
+
+def get_reranker_stats():
+    """How often reranking ran, was skipped for the budget, or timed out"""
+    return get_reranker().stats()
+
+def vector_search(query, top_k=5, db_name=None, collection_name=None, nprobe=None, text_fallback=True,
+                  filters=None):
+    """Vector search on the collection's backend, optionally falling back to $text search"""
+    try:
+        backend = get_search_backend(db_name, collection_name)
+        try:
+            results = backend.search(generate_query_embedding(query), top_k, nprobe=nprobe, filters=filters)
+            if results:
+                logger.info(f"{backend.name} vector search found {len(results)} results")
+                return results
+            logger.info(f"{backend.name} vector search returned no results")
+        except Exception as e:
+            logger.error(f"Error performing {backend.name} vector search: {e}")
         
-        return list(results)
+        # Only fall back where a text index exists, so no request runs a failing $text query
+        if not text_fallback or not backend.capabilities.get("text_index"):
+            return []
+        return text_search(backend.collection, query, top_k, filters)
     except Exception as e:
         logger.error(f"Error searching similar PDFs: {str(e)}")
         return []
 
+def vector_search_many(queries, top_k=5, db_name=None, collection_name=None, nprobe=None, text_fallback=True,
+                       filters=None):
+    """vector_search for several queries, embedded and scored in one batch"""
+    try:
+        backend = get_search_backend(db_name, collection_name)
+        try:
+            results = backend.search_many(generate_query_embeddings(queries), top_k, nprobe=nprobe, filters=filters)
+            logger.info(f"{backend.name} vector search ran {len(queries)} queries in one batch")
+        except Exception as e:
+            logger.error(f"Error performing {backend.name} batch vector search: {e}")
+            results = [[] for _ in queries]
+        
+        # Only fall back where a text index exists, so no request runs a failing $text query
+        if text_fallback and backend.capabilities.get("text_index"):
+            results = [
+                query_results or text_search(backend.collection, query, top_k, filters)
+                for query, query_results in zip(queries, results)
+            ]
+        return results
+    except Exception as e:
+        logger.error(f"Error searching similar PDFs: {str(e)}")
+        return [[] for _ in queries]
+
+def text_search(vector_collection, query, top_k=5, filters=None):
+    """Keyword search over the chunk text using the collection's $text index"""
+    logger.info("Falling back to text search")
+    results = vector_collection.find(
+        {"$text": {"$search": query}, **mongo_query(normalize_filters(filters))},
+        # Only what a hit carries, not the stored embedding
+        {**{field: 1 for field in HIT_FIELDS}, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(top_k)
+    
+    return [SearchHit.from_document(result) for result in results]
+
 def count_documents():
     """Count the number of documents in the vector store"""
     try:
@@ -205,57 +543,58 @@ def get_document_samples(limit=5):
         return []
 
 def store_pdfs_in_mongodb():
-    """Store PDF chunks with embeddings in MongoDB, skipping already processed PDFs."""
+    """
+    Store PDF chunks with embeddings in MongoDB, incrementally.
+    
+    Files whose SHA-256 matches the last ingested version are skipped; changed
+    files are diffed chunk by chunk, so only new chunks are embedded and
+    chunks that disappeared from a file are deleted, as are the chunks of
+    PDFs removed from the directory.
+    """
     try:
         # Import here to avoid circular imports
-        from rag.pdf_processor import load_and_split_pdfs
+        from rag.pdf_processor import iter_pdf_chunks
+        from rag.incremental import IncrementalIngestion, file_sha256
         import os
         
         # Connect to MongoDB
-        client, db, fs, pdf_collection, _ = connect_to_mongodb()
-        
-        # Get existing PDF filenames in MongoDB
-        existing_pdfs = set()
-        for pdf_doc in pdf_collection.find({}, {"filename": 1}):
-            if "filename" in pdf_doc:
-                existing_pdfs.add(pdf_doc["filename"])
-        
-        logger.info(f"Found {len(existing_pdfs)} PDFs already in MongoDB")
+        client, db, _, _, vector_collection = connect_to_mongodb()
+        ingestion = IncrementalIngestion(db, vector_collection, source="pdf_dir")
         
         # Get list of PDFs in the directory
         pdf_dir = os.getenv("PDF_DIR", "../pdf_files")
         pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
         
-        # Filter out PDFs that are already processed
-        new_pdfs = [pdf for pdf in pdf_files if pdf not in existing_pdfs]
-        
-        if not new_pdfs:
-            logger.info("No new PDFs to process - all files already in MongoDB")
-            return count_documents()
-        
-        logger.info(f"Found {len(new_pdfs)} new PDFs to process")
+        # Filter out PDFs whose content hasn't changed since they were ingested
+        changed_pdfs = [
+            pdf for pdf in pdf_files
+            if ingestion.file_changed(pdf, file_sha256(os.path.join(pdf_dir, pdf)))
+        ]
         
-        # Process only new PDFs
-        logger.info("Loading and splitting new PDFs...")
-        report_chunks = load_and_split_pdfs(specific_files=new_pdfs)
-        
-        if not report_chunks or len(report_chunks) == 0:
-            logger.warning("No valid content found in new PDFs")
+        if not changed_pdfs:
+            stats = ingestion.commit(current_files=pdf_files)
+            if stats["files_removed"]:
+                index_versions.bump(db, vector_collection.name)
+                logger.info(f"✅ Removed {stats['files_removed']} deleted PDFs from MongoDB: {stats}")
+            else:
+                logger.info("No new or changed PDFs to process - all files already in MongoDB")
             return count_documents()
         
-        logger.info(f"Processing {len(report_chunks)} document chunks...")
+        logger.info(f"Found {len(changed_pdfs)} new or changed PDFs to process")
         
-        # Create vector store
-        success = create_vector_store(report_chunks)
+        # Stream chunks of the changed PDFs, embedding only those not stored yet
+        logger.info("Loading, splitting and embedding new chunks...")
+        new_chunks = ingestion.iter_new_chunks(iter_pdf_chunks(specific_files=changed_pdfs))
+        success = create_vector_store(new_chunks, on_failed=ingestion.chunk_failed)
         
-        if success:
-            logger.info(f"✅ Successfully stored new document chunks in MongoDB!")
-            # Count documents
-            count = count_documents()
-            return count
+        # Only record the new file hashes once the new chunks are written
+        if success or not ingestion.stats["chunks_added"]:
+            stats = ingestion.commit(current_files=pdf_files)
+            index_versions.bump(db, vector_collection.name)
+            logger.info(f"✅ Synced document chunks in MongoDB: {stats}")
         else:
-            logger.error("Failed to create vector store")
-            return count_documents()
+            logger.warning("Storing new chunks failed; changed PDFs will be retried on the next run")
+        return count_documents()
             
     except Exception as e:
         logger.error(f"Error storing PDFs in MongoDB: {str(e)}")
@@ -273,34 +612,20 @@ def test_vector_search():
             logger.error("No documents in the vector store. Please process PDFs first.")
             return False
             
-        # Check if the vector search index exists
+        # Run one query through the backend selected for the collection
+        backend = get_backend(vector_collection)
         try:
-            # Try a simple vector search
-            test_query = "astrology"
-            query_embedding = generate_embedding(test_query)
-            
-            results = vector_collection.aggregate([
-                {
-                    "$search": {
-                        "index": os.getenv("VECTOR_INDEX_NAME", "vectorSearchIndex"),
-                        "knnBeta": {
-                            "vector": query_embedding,
-                            "path": "embedding",
-                            "k": 1
-                        }
-                    }
-                },
-                {"$limit": 1}
-            ])
-            
-            # Try to get the first result
-            list(results)
-            logger.info("Vector search index is working")
+            results = backend.search(generate_embedding("astrology"), 1)
+            if not results:
+                logger.error(f"{backend.name} vector search returned no results")
+                return False
+            logger.info(f"{backend.name} vector search is working ({backend.capabilities})")
             return True
             
         except Exception as e:
             logger.error(f"Vector search test failed: {e}")
-            logger.error("You may need to create a vector search index in MongoDB Atlas")
+            if backend.name == "atlas":
+                logger.error("You may need to create a vector search index in MongoDB Atlas")
             return False
             
     except Exception as e:
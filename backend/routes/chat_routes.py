@@ -8,7 +8,8 @@ import logging
 import traceback
 from openai import OpenAI
 from bson import ObjectId
-from vector_store import search_similar_pdfs
+from vector_store import search_reranked
+from rag.prompt_builder import build_messages
 
 # Initialize logger
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -49,45 +50,24 @@ def generate_response_with_rag(user_message, conversation_history=None, birth_de
     """Generate a response using RAG approach"""
     try:
         # Get relevant documents
-        relevant_documents = search_similar_pdfs(user_message, top_k=5)
-        context = ""
+        relevant_documents = search_reranked(user_message, top_k=5)
+        context_chunks = []
         
         if relevant_documents and len(relevant_documents) > 0:
             logger.info(f"Found {len(relevant_documents)} relevant documents")
-            context_list = []
-            for doc in relevant_documents:
-                if 'text' in doc:
-                    context_list.append(doc['text'])
-            context = " ".join(context_list)
+            context_chunks = [hit.text for hit in relevant_documents if hit.text]
         else:
             logger.warning("No relevant documents found for the query")
-            context = "No specific information found in the knowledge base for this query."
         
-        # Build messages array for OpenAI
-        messages = [{"role": "system", "content": ASTROLOGY_SYSTEM_PROMPT}]
-        
-        # Add birth details if available
-        if birth_details:
-            birth_context = f"""
-            The user has provided these birth details:
-            Date: {birth_details.get('date', 'Not provided')}
-            Time: {birth_details.get('time', 'Not provided')}
-            Place: {birth_details.get('place', 'Not provided')}
-            
-            Use these details in your analysis when relevant.
-            """
-            messages.append({"role": "system", "content": birth_context})
-        
-        # Add context from RAG
-        messages.append({"role": "system", "content": f"Use the following context from Vedic astrology texts to inform your answer: {context}"})
-        
-        # Add conversation history
-        if conversation_history:
-            for msg in conversation_history[-5:]:  # Last 5 messages
-                messages.append({"role": msg["role"], "content": msg["content"]})
-        
-        # Add the user message
-        messages.append({"role": "user", "content": user_message})
+        # Build messages array for OpenAI within the input token budget
+        messages, token_report = build_messages(
+            ASTROLOGY_SYSTEM_PROMPT,
+            user_message,
+            birth_details=birth_details,
+            context_chunks=context_chunks,
+            conversation_history=conversation_history,
+            empty_context="No specific information found in the knowledge base for this query."
+        )
         
         # Get response from OpenAI
         response = openai_client.chat.completions.create(
@@ -0,0 +1,100 @@
+# test_answer_cache.py
+"""
+Tests for the semantic answer cache (rag/answer_cache.py): which questions
+may be cached, the similarity threshold, topic and prompt version matching,
+TTL expiry and LRU eviction.
+Run with: python -m pytest -q test_answer_cache.py
+"""
+import pytest
+from rag.answer_cache import SemanticAnswerCache, is_cacheable_query
+
+# Stand-in question embeddings; "nine grahas" and "9 grahas" have cosine 0.97
+VECTORS = {
+    "what are the nine grahas": [1.0, 0.0, 0.0],
+    "what are the 9 grahas": [0.97, 0.2431, 0.0],
+    "what is a dasha": [0.0, 1.0, 0.0],
+    "what is a nakshatra": [0.0, 0.0, 1.0],
+    "what is a yoga": [0.0, 0.7071, 0.7071],
+}
+
+def embed(query):
+    return VECTORS[query]
+
+class Clock:
+    """Stands in for the time module so TTLs can expire without sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("rag.answer_cache.time", clock)
+    return clock
+
+@pytest.mark.parametrize("query, birth_details, history, cacheable", [
+    ("What are the nine grahas?", None, None, True),
+    ("What are the nine grahas?", {"date": "", "time": None}, [], True),
+    ("What are the nine grahas?", {"date": "1990-04-12"}, None, False),
+    ("And what about Saturn?", None, [{"role": "user", "content": "Tell me about Rahu"}], False),
+    ("I was born on 12/04/1990, what is my lagna?", None, None, False),
+    ("What does my chart say about marriage?", None, None, False),
+    ("When does my dasha change?", None, None, False),
+    ("Is 10:30 a good time to start?", None, None, False),
+])
+def test_only_impersonal_standalone_questions_are_cacheable(query, birth_details, history, cacheable):
+    assert is_cacheable_query(query, birth_details, history) is cacheable
+
+def test_similar_questions_share_an_answer():
+    cache = SemanticAnswerCache(embed, max_size=4, ttl=0, threshold=0.95)
+    cache.put("what are the nine grahas", "Sun, Moon, Mars, ...")
+    hit = cache.get("what are the 9 grahas")
+    assert hit["answer"] == "Sun, Moon, Mars, ..." and hit["query"] == "what are the nine grahas"
+    assert hit["similarity"] == pytest.approx(0.97, abs=1e-3) and hit["hits"] == 1
+    assert cache.get("what is a dasha") is None
+
+def test_threshold_is_respected():
+    cache = SemanticAnswerCache(embed, max_size=4, ttl=0, threshold=0.98)
+    cache.put("what are the nine grahas", "Sun, Moon, Mars, ...")
+    assert cache.get("what are the 9 grahas") is None
+    assert cache.get("what are the nine grahas")["similarity"] == pytest.approx(1.0)
+
+def test_topic_and_prompt_version_must_match():
+    cache = SemanticAnswerCache(embed, max_size=4, ttl=0, threshold=0.95)
+    cache.put("what is a dasha", "A planetary period", topic="dasha", prompt_version="v1")
+    assert cache.get("what is a dasha", topic="yoga", prompt_version="v1") is None
+    assert cache.get("what is a dasha", topic="dasha", prompt_version="v2") is None
+    assert cache.get("what is a dasha", topic="dasha", prompt_version="v1")["answer"] == "A planetary period"
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = SemanticAnswerCache(embed, max_size=4, ttl=60, threshold=0.95)
+    cache.put("what is a dasha", "A planetary period")
+    clock.now += 59
+    assert cache.get("what is a dasha") is not None
+    clock.now += 2
+    assert cache.get("what is a dasha") is None
+    stats = cache.stats()
+    assert (stats["expired"], stats["size"]) == (1, 0)
+
+def test_least_recently_used_answer_is_evicted():
+    cache = SemanticAnswerCache(embed, max_size=2, ttl=0, threshold=0.95)
+    cache.put("what is a dasha", "dasha answer")
+    cache.put("what is a nakshatra", "nakshatra answer")
+    cache.get("what is a dasha")
+    cache.put("what is a yoga", "yoga answer")
+    assert cache.get("what is a nakshatra") is None
+    assert cache.get("what is a dasha")["answer"] == "dasha answer"
+    assert cache.get("what is a yoga")["answer"] == "yoga answer"
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["top_entries"][0]["query"] == "what is a dasha"
+
+def test_empty_answers_and_disabled_cache_store_nothing():
+    cache = SemanticAnswerCache(embed, max_size=4, ttl=0, threshold=0.95)
+    cache.put("what is a dasha", "")
+    assert cache.get("what is a dasha") is None
+    disabled = SemanticAnswerCache(embed, max_size=0, ttl=0, threshold=0.95)
+    disabled.put("what is a dasha", "A planetary period")
+    assert disabled.get("what is a dasha") is None
@@ -0,0 +1,61 @@
+# test_bm25_index.py
+"""
+Tests for the BM25 keyword index and reciprocal-rank fusion (rag/bm25_index.py).
+Run with: python -m pytest -q test_bm25_index.py
+"""
+import pytest
+from rag.bm25_index import BM25Index, tokenize, reciprocal_rank_fusion
+from rag.search_hits import SearchHit
+
+DOCUMENTS = [
+    {"_id": "a", "text": "Gajakesarī yoga forms when Jupiter is in a kendra from the Moon", "filename": "yogas.pdf", "chunk_index": 0, "topic": "yoga"},
+    {"_id": "b", "text": "Vimshottari dasha periods follow the Moon's nakshatra", "filename": "dashas.pdf", "chunk_index": 0, "topic": "dasha"},
+    {"_id": "c", "text": "The Moon rules the mind; a strong Moon gives a calm mind", "filename": "planets.pdf", "chunk_index": 0, "topic": "planets"},
+    {"_id": "d", "text": "Raja yoga combines lords of kendra and trikona houses", "filename": "yogas.pdf", "chunk_index": 1, "topic": "yoga"},
+]
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.add_documents(DOCUMENTS)
+    return index
+
+def test_tokenize_strips_diacritics_case_and_stopwords():
+    assert tokenize("Gajakesarī Yoga is in the KENDRA") == ["gajakesari", "yoga", "kendra"]
+
+def test_rare_term_ranks_its_chunk_first(index):
+    hits = index.search("gajakesari", 3)
+    assert [hit.id for hit in hits] == ["a"]
+    assert isinstance(hits[0], SearchHit) and hits[0].score > 0
+    assert hits[0].text == DOCUMENTS[0]["text"] and hits[0].filename == "yogas.pdf"
+
+def test_scores_are_ordered_and_unmatched_chunks_left_out(index):
+    hits = index.search("kendra yoga", 5)
+    assert {hit.id for hit in hits} == {"a", "d"}
+    assert hits[0].score >= hits[1].score
+    assert index.search("saturn", 5) == []
+
+def test_filters_and_removal(index):
+    assert [hit.id for hit in index.search("moon", 5, filters={"topic": "dasha"})] == ["b"]
+    assert index.remove_documents(["b"]) == 1
+    assert "b" not in [hit.id for hit in index.search("moon", 5)]
+    assert len(index) == 3
+
+def test_fusion_rewards_agreement_and_keeps_retriever_scores():
+    vector = [SearchHit("x", "x", 0.9), SearchHit("y", "y", 0.8), SearchHit("z", "z", 0.7)]
+    keyword = [SearchHit("z", "z", 12.0), SearchHit("w", "w", 9.0), SearchHit("y", "y", 3.0)]
+    fused = reciprocal_rank_fusion([("vector", vector, 1.0), ("bm25", keyword, 1.0)], top_k=3, k=60)
+
+    assert [hit.id for hit in fused] == ["z", "y", "x"]
+    assert fused[0].score == pytest.approx(1 / 63 + 1 / 61)
+    assert fused[0]["vector_score"] == 0.7 and fused[0]["bm25_score"] == 12.0
+    assert fused[2].get("bm25_score") is None
+    # Inputs are left untouched
+    assert vector[2].score == 0.7 and vector[2].scores is None
+
+def test_fusion_weights_and_plain_document_results():
+    vector = [{"_id": "x", "text": "x", "score": 0.9}]
+    keyword = [{"_id": "y", "text": "y", "score": 5.0}]
+    fused = reciprocal_rank_fusion([("vector", vector, 0.5), ("bm25", keyword, 2.0)], top_k=5)
+    assert [hit.id for hit in fused] == ["y", "x"]
+    assert reciprocal_rank_fusion([("vector", vector, 1.0), ("bm25", keyword, 0.0)])[0].id == "x"
@@ -0,0 +1,108 @@
+# test_bulk_writer.py
+"""
+Tests for batched background inserts (rag/bulk_writer.py) against a fake
+collection: batching, retries of transient failures, and duplicate-key
+errors from a retried batch counting as written.
+Run with: python -m pytest -q test_bulk_writer.py
+"""
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError, OperationFailure
+from rag.bulk_writer import BulkWriter, DUPLICATE_KEY, is_transient
+
+class FakeCollection:
+    """
+    Unordered insert_many into a dict. failures is a list consumed one call at
+    a time: None (succeed), an exception to raise before writing, or a
+    ("after", exception) pair raised after the documents were written.
+    """
+
+    def __init__(self, failures=()):
+        self.documents = {}
+        self.failures = list(failures)
+        self.calls = []
+
+    def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        self.calls.append([doc["_id"] for doc in documents])
+        failure = self.failures.pop(0) if self.failures else None
+        if isinstance(failure, Exception):
+            raise failure
+
+        errors = []
+        for index, doc in enumerate(documents):
+            if doc["_id"] in self.documents:
+                errors.append({"index": index, "code": DUPLICATE_KEY, "errmsg": "E11000 duplicate key"})
+            else:
+                self.documents[doc["_id"]] = doc
+        if isinstance(failure, tuple):
+            raise failure[1]
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(documents) - len(errors)})
+
+def documents(count):
+    return [{"_id": f"doc{i}", "text": f"chunk {i}"} for i in range(count)]
+
+def write(collection, docs, **kwargs):
+    written_batches = []
+    writer = BulkWriter(collection, on_written=written_batches.append, backoff=0, **kwargs)
+    for start in range(0, len(docs), 3):
+        writer.put(docs[start:start + 3])
+    return writer, writer.close(), written_batches
+
+def test_documents_are_written_in_batches():
+    collection = FakeCollection()
+    writer, written, batches = write(collection, documents(23), batch_size=5, workers=2)
+    assert written == 23 and len(collection.documents) == 23
+    assert sorted(len(batch) for batch in batches) == [3, 5, 5, 5, 5]
+    stats = writer.stats()
+    assert (stats["written"], stats["batches"], stats["retried"]) == (23, 5, 0)
+
+def test_batch_is_retried_after_a_transient_error():
+    collection = FakeCollection([AutoReconnect("connection reset")])
+    writer, written, _ = write(collection, documents(4), batch_size=10, workers=1)
+    assert written == 4 and len(collection.documents) == 4
+    assert len(collection.calls) == 2 and writer.stats()["retried"] == 1
+
+def test_duplicates_from_a_retried_batch_count_as_written_once():
+    # The first attempt was stored, but the acknowledgement was lost
+    collection = FakeCollection([("after", AutoReconnect("connection reset"))])
+    writer, written, batches = write(collection, documents(4), batch_size=10, workers=1)
+    assert written == 4 and len(collection.documents) == 4
+    assert len(collection.calls) == 2 and len(batches) == 1
+    assert writer.stats()["batches"] == 1
+
+def test_only_documents_that_failed_transiently_are_retried():
+    docs = documents(4)
+    # Documents 1 and 3 hit a primary step-down, the others were stored
+    collection = FakeCollection([
+        ("after", BulkWriteError({"writeErrors": [
+            {"index": 1, "code": 189, "errmsg": "primary stepped down"},
+            {"index": 3, "code": 189, "errmsg": "primary stepped down"},
+        ], "writeConcernErrors": []})),
+    ])
+    writer, written, _ = write(collection, docs, batch_size=10, workers=1)
+    assert written == 4
+    assert collection.calls == [["doc0", "doc1", "doc2", "doc3"], ["doc1", "doc3"]]
+    assert writer.stats()["retried"] == 1
+
+def test_permanent_errors_stop_the_writer():
+    collection = FakeCollection([OperationFailure("document failed validation", code=121)])
+    writer = BulkWriter(collection, batch_size=2, workers=1, backoff=0)
+    writer.put(documents(2))
+    with pytest.raises(OperationFailure):
+        writer.close()
+    with pytest.raises(OperationFailure):
+        writer.put(documents(1))
+
+def test_transient_errors_give_up_after_the_retries():
+    collection = FakeCollection([AutoReconnect("down")] * 3)
+    writer = BulkWriter(collection, batch_size=10, workers=1, retries=2, backoff=0)
+    writer.put(documents(3))
+    with pytest.raises(AutoReconnect):
+        writer.close()
+    assert len(collection.calls) == 3 and writer.written == 0
+
+def test_is_transient():
+    assert is_transient(AutoReconnect("reset"))
+    assert not is_transient(OperationFailure("bad document", code=121))
+    assert not is_transient(ValueError("bug"))
@@ -0,0 +1,81 @@
+# test_chunking.py
+"""
+Tests for the boundary-aware splitter (rag/chunking.py): chunks end on
+sentence or paragraph boundaries, respect the size limit in characters or
+tokens, and share trailing sentences up to the overlap.
+Run with: python -m pytest -q test_chunking.py
+"""
+import pytest
+from rag.chunking import BoundaryTextSplitter, get_text_splitter, describe_splitter
+
+TEXT = (
+    "Saturn is the slowest of the grahas. It spends about two and a half years in each sign! "
+    "Does its transit over the Moon start Sade Sati? Yes, when it enters the twelfth from the Moon. "
+    "The period lasts seven and a half years.\n\n"
+    "Jupiter is the great benefic. It expands whatever it touches."
+)
+
+SENTENCES = [
+    "Saturn is the slowest of the grahas.",
+    "It spends about two and a half years in each sign!",
+    "Does its transit over the Moon start Sade Sati?",
+    "Yes, when it enters the twelfth from the Moon.",
+    "The period lasts seven and a half years.",
+    "Jupiter is the great benefic.",
+    "It expands whatever it touches.",
+]
+
+def words(text):
+    return len(text.split())
+
+def test_chunks_end_on_sentence_boundaries_within_the_size():
+    chunks = BoundaryTextSplitter(chunk_size=100, chunk_overlap=0, boundary="sentence").split_text(TEXT)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks) == " ".join(SENTENCES)
+    for chunk in chunks:
+        assert chunk.startswith(tuple(SENTENCES)) and chunk.endswith(tuple(SENTENCES))
+
+def test_consecutive_chunks_share_trailing_sentences_up_to_the_overlap():
+    chunks = BoundaryTextSplitter(chunk_size=110, chunk_overlap=50, boundary="sentence").split_text(TEXT)
+    assert len(chunks) > 2
+    for previous, chunk in zip(chunks, chunks[1:]):
+        shared = [sentence for sentence in SENTENCES if sentence in previous and sentence in chunk]
+        assert shared and len(" ".join(shared)) <= 50
+        assert previous.endswith(shared[-1]) and chunk.startswith(shared[0])
+
+def test_paragraph_boundaries():
+    paragraphs = [" ".join(SENTENCES[:5]), " ".join(SENTENCES[5:])]
+    splitter = BoundaryTextSplitter(chunk_size=len(paragraphs[0]), chunk_overlap=0, boundary="paragraph")
+    assert splitter.split_text(TEXT) == paragraphs
+    splitter = BoundaryTextSplitter(chunk_size=500, chunk_overlap=0, boundary="paragraph")
+    assert splitter.split_text(TEXT) == ["\n\n".join(paragraphs)]
+
+def test_long_sentences_are_cut_between_words():
+    sentence = " ".join(f"word{i}" for i in range(60)) + "."
+    chunks = BoundaryTextSplitter(chunk_size=50, chunk_overlap=10, boundary="sentence").split_text(sentence)
+    assert len(chunks) > 1 and all(len(chunk) <= 50 for chunk in chunks)
+    assert " ".join(chunks).split() == sentence.split()
+
+def test_token_limits_use_the_length_function():
+    splitter = BoundaryTextSplitter(chunk_size=20, chunk_overlap=5, boundary="sentence", length_function=words)
+    chunks = splitter.split_text(TEXT)
+    assert all(words(chunk) <= 20 for chunk in chunks)
+    # Measured in characters, the same limit would allow only a few words per chunk
+    assert max(words(chunk) for chunk in chunks) > 12
+
+def test_devanagari_danda_ends_a_sentence():
+    chunks = BoundaryTextSplitter(chunk_size=20, chunk_overlap=0, boundary="sentence").split_text("शनि मंद ग्रह है। गुरु शुभ है।")
+    assert chunks == ["शनि मंद ग्रह है।", "गुरु शुभ है।"]
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        BoundaryTextSplitter(chunk_size=100, chunk_overlap=100)
+    with pytest.raises(ValueError):
+        BoundaryTextSplitter(boundary="word")
+    with pytest.raises(ValueError):
+        get_text_splitter(unit="bytes")
+
+def test_settings_select_the_splitter():
+    splitter = get_text_splitter(unit="chars", chunk_size=120, chunk_overlap=20, boundary="paragraph")
+    assert isinstance(splitter, BoundaryTextSplitter) and splitter.separator == "\n\n"
+    assert describe_splitter("tokens", 256, 32, "sentence") == "tokens:256/32:sentence"
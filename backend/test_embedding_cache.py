@@ -0,0 +1,88 @@
+# test_embedding_cache.py
+"""
+Tests for the query embedding cache (rag/embedding_cache.py): LRU eviction,
+TTL expiry and the on-disk tier.
+Run with: python -m pytest -q test_embedding_cache.py
+"""
+import pytest
+from rag.embedding_cache import EmbeddingCache, normalize_text
+
+class Clock:
+    """Stands in for the time module so TTLs can expire without sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("rag.embedding_cache.time", clock)
+    return clock
+
+def test_normalized_queries_share_an_entry():
+    assert normalize_text("  What is   Rahu? ") == normalize_text("what is rahu")
+    cache = EmbeddingCache("model", max_size=4, ttl=0)
+    cache.put("What is Rahu?", [0.5, 0.25])
+    assert cache.get("what is  rahu") == [0.5, 0.25]
+    assert cache.get("what is ketu") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+def test_entries_are_per_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    EmbeddingCache("model-a", max_size=4, ttl=0, disk_path=path).put("rahu", [1.0])
+    assert EmbeddingCache("model-b", max_size=4, ttl=0, disk_path=path).get("rahu") is None
+    assert EmbeddingCache("model-a", max_size=4, ttl=0, disk_path=path).get("rahu") == [1.0]
+
+def test_cached_embeddings_are_copies():
+    cache = EmbeddingCache("model", max_size=4, ttl=0)
+    embedding = [1.0, 2.0]
+    cache.put("q", embedding)
+    embedding[0] = 9.0
+    cache.get("q")[1] = 9.0
+    assert cache.get("q") == [1.0, 2.0]
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EmbeddingCache("model", max_size=2, ttl=0)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0] and cache.get("c") == [3.0]
+    assert cache.stats()["evictions"] == 1 and cache.stats()["size"] == 2
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = EmbeddingCache("model", max_size=4, ttl=60)
+    cache.put("q", [1.0])
+    clock.now += 59
+    assert cache.get("q") == [1.0]
+    clock.now += 2
+    assert cache.get("q") is None
+    assert cache.stats()["size"] == 0
+
+def test_disk_tier_survives_a_restart(tmp_path, clock):
+    path = str(tmp_path / "cache" / "embeddings.sqlite")
+    cache = EmbeddingCache("model", max_size=4, ttl=60, disk_path=path)
+    cache.put("q", [0.5, -0.25])
+
+    restarted = EmbeddingCache("model", max_size=4, ttl=60, disk_path=path)
+    assert restarted.stats()["disk_enabled"]
+    assert restarted.get("q") == [0.5, -0.25]
+    assert restarted.get("q") == [0.5, -0.25]
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["size"]) == (1, 1, 1)
+
+    clock.now += 61
+    assert EmbeddingCache("model", max_size=4, ttl=60, disk_path=path).get("q") is None
+
+def test_clear_empties_both_tiers(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache("model", max_size=4, ttl=0, disk_path=path)
+    cache.put("q", [1.0])
+    cache.clear()
+    assert cache.get("q") is None
+    assert EmbeddingCache("model", max_size=4, ttl=0, disk_path=path).get("q") is None
@@ -0,0 +1,74 @@
+# test_embedding_codec.py
+"""
+Tests for the stored embedding formats (rag/embedding_codec.py): round trips
+of every format and migrating a collection between them.
+Run with: python -m pytest -q test_embedding_codec.py
+"""
+import numpy as np
+import pytest
+from rag.embedding_codec import encode_embedding, decode_embedding, quantize_int8, storage_of, migrate_embeddings
+
+def vector(dim=64, seed=0):
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+def test_float_storage_round_trip():
+    embedding = vector()
+    fields = encode_embedding(embedding.tolist(), "float")
+    assert list(fields) == ["embedding"]
+    np.testing.assert_array_equal(decode_embedding(fields), embedding)
+
+def test_float32_storage_round_trip_is_exact_and_zero_copy():
+    embedding = vector()
+    fields = encode_embedding(embedding.tolist(), "float32")
+    assert list(fields) == ["embedding_f32"] and len(fields["embedding_f32"]) == 4 * len(embedding)
+    decoded = decode_embedding(fields)
+    np.testing.assert_array_equal(decoded, embedding)
+    assert not decoded.flags.writeable
+
+def test_float16_storage_round_trip():
+    embedding = vector()
+    fields = encode_embedding(embedding.tolist(), "float16")
+    assert list(fields) == ["embedding_f16"] and len(fields["embedding_f16"]) == 2 * len(embedding)
+    decoded = decode_embedding(fields)
+    assert decoded.dtype == np.float32
+    np.testing.assert_allclose(decoded, embedding, rtol=1e-3, atol=1e-3)
+
+def test_int8_storage_round_trip():
+    embedding = vector()
+    fields = encode_embedding(embedding.tolist(), "int8")
+    assert set(fields) == {"embedding_int8", "embedding_scale"}
+    assert len(fields["embedding_int8"]) == len(embedding)
+    decoded = decode_embedding(fields)
+    assert decoded.dtype == np.float32
+    assert np.abs(decoded - embedding).max() <= fields["embedding_scale"] / 2 + 1e-6
+
+def test_int8_zero_vector_and_missing_embedding():
+    codes, scale = quantize_int8(np.zeros(8))
+    assert scale == 1.0 and not codes.any()
+    assert decode_embedding({"text": "no vector"}) is None
+
+def test_storage_of_and_unknown_storage():
+    embedding = vector(8)
+    for storage in ("float", "float32", "float16", "int8"):
+        assert storage_of(encode_embedding(embedding, storage)) == storage
+    assert storage_of({"text": "no vector"}) is None
+    with pytest.raises(ValueError):
+        encode_embedding(embedding, "bfloat16")
+
+def test_migrate_embeddings(db):
+    collection = db["vectors"]
+    embeddings = [vector(16, seed) for seed in range(5)]
+    collection.insert_many([
+        {"_id": f"doc{i}", **encode_embedding(embedding, "float")} for i, embedding in enumerate(embeddings)
+    ] + [{"_id": "no-vector", "text": "not embedded"}])
+
+    assert migrate_embeddings(collection, "float16", batch_size=2) == {"migrated": 5, "skipped": 0}
+    assert migrate_embeddings(collection, "float16") == {"migrated": 0, "skipped": 5}
+    for i, embedding in enumerate(embeddings):
+        document = collection.find_one({"_id": f"doc{i}"})
+        assert "embedding" not in document and storage_of(document) == "float16"
+        np.testing.assert_allclose(decode_embedding(document), embedding, rtol=1e-3, atol=1e-3)
+    assert collection.find_one({"_id": "no-vector"}) == {"_id": "no-vector", "text": "not embedded"}
+
+    with pytest.raises(ValueError):
+        migrate_embeddings(collection, "bfloat16")
@@ -0,0 +1,137 @@
+# test_incremental_ingestion.py
+"""
+Tests for incremental ingestion by content hash (rag/incremental.py), against
+mongomock.
+Run with: python -m pytest -q test_incremental_ingestion.py
+"""
+import io
+from rag.ingestion import iter_embedded_batches
+from rag.incremental import IncrementalIngestion, INGESTION_STATE_COLLECTION, file_sha256, chunk_id, content_hash
+
+def test_file_sha256_of_paths_and_file_objects(tmp_path):
+    path = tmp_path / "book.pdf"
+    path.write_bytes(b"%PDF" * 1000)
+    assert file_sha256(str(path), block_size=7) == file_sha256(io.BytesIO(b"%PDF" * 1000))
+    assert file_sha256(io.BytesIO(b"a")) != file_sha256(io.BytesIO(b"b"))
+
+def test_chunk_ids_are_deterministic():
+    assert chunk_id("job", "a.pdf", 3, "abc") == chunk_id("job", "a.pdf", 3, "abc")
+    assert chunk_id("job", "a.pdf", 3, "abc") != chunk_id("job", "a.pdf", 4, "abc")
+    assert chunk_id("job", "a.pdf", 3, "abc") != chunk_id("other", "a.pdf", 3, "abc")
+
+def chunk_docs(texts, filename="book1.pdf"):
+    return [{"text": text, "filename": filename, "chunk_index": i} for i, text in enumerate(texts)]
+
+def ingest(db, filename, sha256, texts, fail_on=(), source="gridfs"):
+    """One incremental run over a file; returns the stats and the texts that were embedded"""
+    ingestion = IncrementalIngestion(db, db.vectors, source=source)
+    if not ingestion.file_changed(filename, sha256):
+        return None, []
+
+    def embed(batch):
+        if any(text in fail_on for text in batch):
+            raise RuntimeError("embedding failed")
+        return [[1.0, 0.0] for _ in batch]
+
+    embedded = []
+    new_chunks = ingestion.iter_new_chunks(iter(chunk_docs(texts, filename)))
+    for batch in iter_embedded_batches(new_chunks, embed, 4, on_failed=ingestion.chunk_failed):
+        db.vectors.insert_many([{**item, "embedding": embedding} for _, item, embedding in batch])
+        embedded += [item["text"] for _, item, _ in batch]
+    return ingestion.commit(), embedded
+
+def test_unchanged_file_is_skipped(db):
+    texts = [f"chunk {i}" for i in range(6)]
+    stats, embedded = ingest(db, "book1.pdf", "v1", texts)
+    assert len(embedded) == 6 and stats["chunks_added"] == 6
+    assert db[INGESTION_STATE_COLLECTION].find_one({"filename": "book1.pdf"})["chunk_count"] == 6
+
+    assert ingest(db, "book1.pdf", "v1", texts) == (None, [])
+
+def test_changed_file_only_embeds_new_chunks(db):
+    ingest(db, "book1.pdf", "v1", ["alpha", "beta", "gamma", "delta"])
+    stats, embedded = ingest(db, "book1.pdf", "v2", ["alpha", "new", "gamma", "delta"])
+
+    assert embedded == ["new"]
+    assert (stats["chunks_unchanged"], stats["chunks_added"], stats["chunks_removed"]) == (3, 1, 1)
+    stored = {doc["text"]: doc["chunk_index"] for doc in db.vectors.find()}
+    assert stored == {"alpha": 0, "new": 1, "gamma": 2, "delta": 3}
+    assert db[INGESTION_STATE_COLLECTION].find_one({"filename": "book1.pdf"})["sha256"] == "v2"
+
+def test_moved_chunks_keep_their_embedding_and_get_their_new_position(db):
+    ingest(db, "book1.pdf", "v1", ["alpha", "beta", "gamma"])
+    ids = {doc["text"]: doc["_id"] for doc in db.vectors.find()}
+    stats, embedded = ingest(db, "book1.pdf", "v2", ["intro", "alpha", "beta", "gamma"])
+
+    assert embedded == ["intro"]
+    assert stats["chunks_removed"] == 0
+    for doc in db.vectors.find({"text": {"$in": ["alpha", "beta", "gamma"]}}):
+        assert doc["_id"] == ids[doc["text"]]
+        assert doc["chunk_index"] == ["alpha", "beta", "gamma"].index(doc["text"]) + 1
+
+def test_file_without_chunks_loses_its_old_chunks(db):
+    ingest(db, "book1.pdf", "v1", ["alpha", "beta", "gamma"])
+    # e.g. the new version is a scan without a text layer
+    stats, embedded = ingest(db, "book1.pdf", "v2", [])
+
+    assert embedded == [] and stats["chunks_removed"] == 3
+    assert db.vectors.count_documents({}) == 0
+    state = db[INGESTION_STATE_COLLECTION].find_one({"filename": "book1.pdf"})
+    assert (state["sha256"], state["chunk_count"]) == ("v2", 0)
+    assert ingest(db, "book1.pdf", "v2", []) == (None, [])
+
+def test_files_gone_from_their_source_are_forgotten(db):
+    ingest(db, "book1.pdf", "v1", ["alpha", "beta"])
+    ingest(db, "book2.pdf", "v1", ["gamma"])
+    ingest(db, "notes.pdf", "v1", ["delta"], source="pdf_dir")
+
+    # book1.pdf was deleted from GridFS and book2.pdf is unchanged
+    ingestion = IncrementalIngestion(db, db.vectors, source="gridfs")
+    assert not ingestion.file_changed("book2.pdf", "v1")
+    stats = ingestion.commit(current_files=["book2.pdf"])
+
+    assert (stats["files_removed"], stats["chunks_removed"]) == (1, 2)
+    assert sorted(doc["text"] for doc in db.vectors.find()) == ["delta", "gamma"]
+    assert sorted(db[INGESTION_STATE_COLLECTION].distinct("filename")) == ["book2.pdf", "notes.pdf"]
+
+def test_file_with_failed_chunks_is_retried(db):
+    texts = [f"chunk {i}" for i in range(10)]
+    stats, embedded = ingest(db, "book1.pdf", "v1", texts, fail_on={"chunk 7"})
+    assert stats["chunks_failed"] == 1 and len(embedded) == 9
+    # The file's hash isn't recorded, so the next run diffs it again
+    assert db[INGESTION_STATE_COLLECTION].find_one({"filename": "book1.pdf"}) is None
+
+    stats, embedded = ingest(db, "book1.pdf", "v1", texts)
+    assert embedded == ["chunk 7"] and stats["chunks_unchanged"] == 9
+    assert db[INGESTION_STATE_COLLECTION].find_one({"filename": "book1.pdf"})["chunk_count"] == 10
+    assert db.vectors.count_documents({}) == 10
+
+def store(db, chunks):
+    db.vectors.insert_many([{**chunk, "embedding": [1.0, 0.0]} for chunk in chunks])
+
+def test_resumed_job_keeps_what_it_stored_and_removes_leftovers(db):
+    ingest(db, "book1.pdf", "v1", ["alpha", "beta", "gamma"])
+
+    # The job stores and tags the first two chunks, then stops before its commit
+    ingestion = IncrementalIngestion(db, db.vectors, job_id="job1")
+    assert ingestion.file_changed("book1.pdf", "v2")
+    new = list(ingestion.iter_new_chunks(iter(chunk_docs(["alpha", "new"]))))
+    assert [chunk["_id"] for chunk in new] == [chunk_id("job1", "book1.pdf", 1, content_hash("new"))]
+    store(db, new)
+    ingestion.flush_updates()
+
+    # Resumed at chunk 2: the job's own chunks before it are not diffed again
+    resumed = IncrementalIngestion(db, db.vectors, job_id="job1", resume_from={"book1.pdf": 2})
+    resumed.track_file("book1.pdf", "v2")
+    chunks = chunk_docs(["alpha", "new", "more"])[2:]
+    new = list(resumed.iter_new_chunks(iter(chunks)))
+    assert [chunk["text"] for chunk in new] == ["more"]
+    store(db, new)
+    stats = resumed.commit()
+
+    docs = {doc["text"]: doc for doc in db.vectors.find()}
+    assert set(docs) == {"alpha", "new", "more"}
+    assert all(doc["ingest_job"] == "job1" for doc in docs.values())
+    assert stats["chunks_removed"] == 2
+    state = db[INGESTION_STATE_COLLECTION].find_one({"filename": "book1.pdf"})
+    assert (state["sha256"], state["chunk_count"]) == ("v2", 3)
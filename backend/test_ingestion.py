@@ -0,0 +1,117 @@
+# test_ingestion.py
+"""
+Tests for the streaming ingestion stages (rag/ingestion.py): chunking pages
+without holding the document, resuming chunking from a checkpoint,
+prefetching, and length-sorted embedding batches with per-chunk retries.
+Run with: python -m pytest -q test_ingestion.py
+"""
+import pytest
+from rag.chunking import BoundaryTextSplitter
+from rag.ingestion import iter_text_chunks, iter_resumable_chunks, prefetch, iter_embedded_batches
+
+class FixedSizeSplitter:
+    """Splits text into pieces of at most size characters"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def split_text(self, text):
+        return [text[start:start + self.size] for start in range(0, len(text), self.size)]
+
+PAGES = [
+    " ".join(f"Sentence {page}.{i} about the houses of the chart." for i in range(12)) + " "
+    for page in range(10)
+]
+
+def embed(texts):
+    return [[float(len(text))] for text in texts]
+
+def test_chunks_cover_pages_without_holding_the_document():
+    pages = [f"page {i} " * (i + 3) for i in range(8)]
+    chunks = list(iter_text_chunks(iter(pages), FixedSizeSplitter(16), buffer_chars=40))
+    assert "".join(chunks) == "".join(pages)
+    assert all(len(chunk) <= 16 for chunk in chunks)
+
+def test_resuming_from_any_point_replays_the_rest():
+    splitter = BoundaryTextSplitter(chunk_size=120, chunk_overlap=30, boundary="sentence")
+    full = list(iter_resumable_chunks(PAGES, splitter, buffer_chars=500))
+    chunks = [chunk for chunk, _ in full]
+    assert chunks == list(iter_text_chunks(PAGES, splitter, buffer_chars=500))
+    assert full[-1][1]["done"]
+
+    resume_points = [(i, resume) for i, (_, resume) in enumerate(full) if resume and not resume["done"]]
+    assert len(resume_points) > 3
+    for i, resume in resume_points:
+        rest = iter_resumable_chunks(
+            PAGES[resume["page"]:], splitter, start_page=resume["page"], carry=resume["carry"], buffer_chars=500
+        )
+        assert [chunk for chunk, _ in rest] == chunks[i + 1:]
+
+def test_prefetch_keeps_order_and_raises_producer_errors():
+    assert list(prefetch(iter(range(100)), maxsize=3)) == list(range(100))
+
+    def failing():
+        yield 1
+        raise ValueError("extraction failed")
+
+    items = prefetch(failing(), maxsize=3)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+def test_prefetch_consumer_can_stop_early():
+    closed = []
+
+    def produce():
+        try:
+            yield from range(1000)
+        finally:
+            closed.append(True)
+
+    items = prefetch(produce(), maxsize=2)
+    assert [next(items) for _ in range(3)] == [0, 1, 2]
+    items.close()
+    assert closed == [True]
+
+def test_every_text_is_embedded_once_with_its_position(monkeypatch):
+    monkeypatch.setattr("rag.ingestion.SORT_WINDOW_BATCHES", 2)
+    texts = [f"chunk {'x' * (i * 7 % 13)}" for i in range(25)]
+    embedded = [entry for batch in iter_embedded_batches(texts, embed, 4) for entry in batch]
+    assert sorted(i for i, _, _ in embedded) == list(range(25))
+    assert all(texts[i] == text and embedding == [float(len(text))] for i, text, embedding in embedded)
+
+def test_batches_hold_similar_lengths_within_a_window(monkeypatch):
+    monkeypatch.setattr("rag.ingestion.SORT_WINDOW_BATCHES", 2)
+    texts = ["a" * length for length in [9, 1, 5, 3, 8, 2, 7, 4, 30, 10, 20]]
+    batches = [[text for _, text, _ in batch] for batch in iter_embedded_batches(texts, embed, 4)]
+    assert [[len(text) for text in batch] for batch in batches] == [[1, 2, 3, 4], [5, 7, 8, 9], [10, 20, 30]]
+
+def test_failed_batch_is_retried_one_text_at_a_time():
+    calls = []
+
+    def flaky(texts):
+        calls.append(list(texts))
+        if "bad" in texts:
+            raise RuntimeError("tokenizer error")
+        return embed(texts)
+
+    embedded = [entry for batch in iter_embedded_batches(["one", "bad", "three", "four"], flaky, 4) for entry in batch]
+    assert sorted(text for _, text, _ in embedded) == ["four", "one", "three"]
+    assert len(calls) == 5
+
+def test_embedding_failures_are_reported_not_yielded():
+    def flaky(texts):
+        if "bad" in texts:
+            raise RuntimeError("tokenizer error")
+        return embed(texts)
+
+    failed = []
+    items = ["one", "bad", "three", "four"]
+    embedded = [entry for batch in iter_embedded_batches(items, flaky, 2, on_failed=failed.append) for entry in batch]
+    assert sorted(item for _, item, _ in embedded) == ["four", "one", "three"]
+    assert failed == ["bad"]
+
+def test_dict_items_are_embedded_by_their_text():
+    items = [{"text": "longer text", "chunk_index": 0}, {"text": "short", "chunk_index": 1}]
+    embedded = [entry for batch in iter_embedded_batches(items, embed, 4) for entry in batch]
+    assert [(i, item["chunk_index"], embedding) for i, item, embedding in embedded] == [(1, 1, [5.0]), (0, 0, [11.0])]
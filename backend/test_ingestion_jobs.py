@@ -0,0 +1,85 @@
+# test_ingestion_jobs.py
+"""
+Tests for resumable ingestion jobs (rag/ingestion_jobs.py) against mongomock:
+the checkpoint only passes finished chunks, survives a restart, and a new
+job supersedes unfinished ones.
+Run with: python -m pytest -q test_ingestion_jobs.py
+"""
+import pytest
+from rag.ingestion_jobs import IngestionJob, INGESTION_JOBS_COLLECTION, format_duration
+
+FILES = [
+    {"pdf_id": "1", "filename": "book1.pdf", "sha256": "a", "length": 3000},
+    {"pdf_id": "2", "filename": "book2.pdf", "sha256": "b", "length": 1000},
+]
+
+def chunk(filename, chunk_index):
+    return {"filename": filename, "chunk_index": chunk_index}
+
+def resume(page, carry=""):
+    return {"page": page, "carry": carry, "done": False}
+
+@pytest.fixture
+def job(db):
+    job = IngestionJob.create(db, FILES)
+    job.checkpoint_interval = 0
+    job.start_file(0, 10)
+    for i in range(4):
+        job.register(0, i, resume(i + 1, f"carry {i}"))
+    return job
+
+def saved_checkpoint(db, job):
+    return db[INGESTION_JOBS_COLLECTION].find_one({"_id": job._doc_id})["checkpoint"]
+
+def test_checkpoint_only_passes_the_finished_prefix(db, job):
+    # Chunk 0 was kept from an earlier ingestion, chunk 1 is new
+    job.passed(chunk("book1.pdf", 1))
+    assert job.checkpoint["chunk_index"] == 1
+    job.passed(chunk("book1.pdf", 2))
+    job.passed(chunk("book1.pdf", 3))
+
+    # Chunk 3 is stored before chunks 1 and 2
+    job.written([chunk("book1.pdf", 3)])
+    assert job.checkpoint["chunk_index"] == 1
+    job.written([chunk("book1.pdf", 1)])
+    assert (job.checkpoint["page"], job.checkpoint["carry"], job.checkpoint["chunk_index"]) == (2, "carry 1", 2)
+    job.written([chunk("book1.pdf", 2)])
+    assert job.checkpoint["chunk_index"] == 4
+    assert saved_checkpoint(db, job) == job.checkpoint
+
+def test_end_of_file_moves_the_checkpoint_to_the_next_file(db, job):
+    job.skipped_rest()
+    job.finish_file(0)
+    assert job.checkpoint == {"file": 1, "page": 0, "carry": "", "chunk_index": 0}
+    assert job.progress() == pytest.approx(0.75)
+    assert job.describe_checkpoint() == "book2.pdf page 0, chunk 0 (file 2/2)"
+
+def test_failed_job_resumes_from_its_checkpoint(db, job):
+    job.passed(chunk("book1.pdf", 0))
+    job.written([chunk("book1.pdf", 0)])
+    job.fail(RuntimeError("embedding server went away"))
+    assert db[INGESTION_JOBS_COLLECTION].find_one({"_id": job._doc_id})["status"] == "failed"
+
+    resumed = IngestionJob.latest_unfinished(db)
+    assert resumed.job_id == job.job_id
+    assert resumed.checkpoint == {"file": 0, "page": 1, "carry": "carry 0", "chunk_index": 1, "pages": 10}
+    assert resumed.resume_from() == {"book1.pdf": 1}
+    # Progress of the current file comes from the pages done
+    assert resumed.progress() == pytest.approx(0.75 * 0.1)
+    assert db[INGESTION_JOBS_COLLECTION].find_one({"_id": job._doc_id})["status"] == "running"
+
+def test_new_job_supersedes_unfinished_ones(db, job):
+    newer = IngestionJob.create(db, FILES[1:])
+    jobs = db[INGESTION_JOBS_COLLECTION]
+    assert jobs.find_one({"_id": job._doc_id})["status"] == "superseded"
+    assert IngestionJob.latest_unfinished(db).job_id == newer.job_id
+
+def test_completed_jobs_are_not_resumed(db, job):
+    job.complete({"chunks_added": 4})
+    doc = db[INGESTION_JOBS_COLLECTION].find_one({"_id": job._doc_id})
+    assert doc["status"] == "completed" and doc["progress"] == 1.0
+    assert doc["checkpoint"]["file"] == len(FILES) and doc["stats"] == {"chunks_added": 4}
+    assert IngestionJob.latest_unfinished(db) is None
+
+def test_format_duration():
+    assert [format_duration(seconds) for seconds in (12, 250, 3720)] == ["12s", "4m10s", "1h02m"]
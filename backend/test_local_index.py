@@ -0,0 +1,230 @@
+# test_local_index.py
+"""
+Tests for the in-process vector indexes (rag/local_index.py): exact top-k
+against brute force, quantized and IVF search against exact search, batched
+and filtered search, removal, persistence and the compact results they return.
+Run with: python -m pytest -q test_local_index.py
+"""
+import numpy as np
+import pytest
+from rag.local_index import LocalVectorIndex, IVFVectorIndex, normalize_rows
+from rag.search_hits import SearchHit
+
+# Divisible by the default PQ_SUBVECTORS
+DIM = 128
+
+def make_documents(count, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    documents = [
+        {
+            "_id": f"doc{i}",
+            "text": f"chunk {i}",
+            "filename": f"book{i % 3}.pdf",
+            "pdf_id": str(i % 3),
+            "chunk_index": i,
+            "topic": "dasha" if i % 2 else "yoga",
+            "embedding": vectors[i].tolist(),
+        }
+        for i in range(count)
+    ]
+    return documents, vectors
+
+def brute_force(vectors, query, top_k, rows=None):
+    """Row numbers of the top_k cosine matches, best first"""
+    matrix = normalize_rows(vectors)
+    scores = matrix @ (query / np.linalg.norm(query))
+    candidates = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+    return list(candidates[np.argsort(-scores[candidates], kind="stable")][:top_k])
+
+def ids(results):
+    return [result.id for result in results]
+
+@pytest.fixture
+def corpus():
+    return make_documents(600)
+
+@pytest.fixture
+def ivf_trains(monkeypatch):
+    """Let the IVF index train on the small test corpus"""
+    monkeypatch.setattr("rag.local_index.IVF_MIN_TRAIN_SIZE", 100)
+
+def test_exact_search_matches_brute_force(tmp_path, corpus):
+    documents, vectors = corpus
+    index = LocalVectorIndex(str(tmp_path), quantization="none")
+    index.add_documents(documents)
+    queries = np.random.default_rng(1).standard_normal((20, DIM))
+    for query in queries:
+        assert ids(index.search(query, 10)) == [f"doc{row}" for row in brute_force(vectors, query, 10)]
+
+def test_batched_adds_build_the_same_matrix(tmp_path, corpus):
+    documents, vectors = corpus
+    index = LocalVectorIndex(str(tmp_path), quantization="none")
+    for start in range(0, len(documents), 7):
+        index.add_documents(documents[start:start + 7])
+    assert index.matrix.shape == (len(documents), DIM)
+    np.testing.assert_allclose(index.matrix, normalize_rows(vectors), rtol=1e-6)
+    assert ids(index.search(vectors[9], 3))[0] == "doc9"
+
+    # Removing rows leaves an index that can keep growing
+    index.remove_documents(["doc0"])
+    index.add_documents(make_documents(1, seed=3)[0])
+    assert len(index) == len(index.matrix) == len(documents)
+
+def test_build_from_collection_replaces_vectors_and_codes(tmp_path, corpus, db):
+    documents, vectors = corpus
+    index = LocalVectorIndex(str(tmp_path), quantization="int8")
+    index.add_documents(make_documents(50, seed=2)[0])
+    index.quantize()
+
+    db.vectors.insert_many([dict(doc) for doc in documents[:250]])
+    assert index.build_from_collection(db.vectors, batch_size=40) == 250
+    assert index.matrix.shape == (250, DIM) and len(index.codes["codes"]) == 250
+    np.testing.assert_allclose(index.matrix, normalize_rows(vectors[:250]), rtol=1e-6)
+    assert ids(index.search(vectors[123], 1)) == ["doc123"]
+
+def test_results_are_compact_hits(tmp_path, corpus):
+    documents, vectors = corpus
+    index = LocalVectorIndex(str(tmp_path), quantization="none")
+    index.add_documents(documents)
+    hits = index.search(vectors[7], 3)
+
+    assert all(isinstance(hit, SearchHit) for hit in hits)
+    best = hits[0]
+    assert (best.id, best.text, best.filename, best.chunk_index, best.topic) == (
+        "doc7", "chunk 7", "book1.pdf", 7, "dasha"
+    )
+    assert best.score == pytest.approx(1.0, abs=1e-5)
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+    # Read access of the dicts hits replace, without the embedding
+    assert best["text"] == "chunk 7" and best.get("embedding") is None and "embedding" not in best
+    assert set(dict(best)) == {"_id", "text", "filename", "pdf_id", "chunk_index", "topic", "score"}
+    assert best.metadata() == {"source": "book1.pdf", "pdf_id": "1", "chunk_index": 7, "topic": "dasha"}
+
+def test_top_k_larger_than_the_index(tmp_path, corpus):
+    documents, _ = corpus
+    index = LocalVectorIndex(str(tmp_path), quantization="none")
+    assert index.search(np.ones(DIM), 5) == []
+    index.add_documents(documents[:3])
+    assert len(index.search(np.ones(DIM), 5)) == 3
+
+@pytest.mark.parametrize("quantization, min_overlap", [("int8", 0.95), ("pq", 0.9)])
+def test_quantized_search_finds_exact_top_k(tmp_path, corpus, quantization, min_overlap):
+    documents, vectors = corpus
+    exact = LocalVectorIndex(str(tmp_path / "exact"), quantization="none")
+    exact.add_documents(documents)
+    index = LocalVectorIndex(str(tmp_path / quantization), quantization=quantization)
+    index.add_documents(documents)
+    index.quantize()
+
+    queries = np.random.default_rng(2).standard_normal((20, DIM))
+    overlap = np.mean([
+        len(set(ids(index.search(query, 10))) & set(ids(exact.search(query, 10)))) / 10
+        for query in queries
+    ])
+    assert overlap >= min_overlap
+    # Quantized candidates are rescored at full precision
+    for query in queries:
+        for hit in index.search(query, 5):
+            row = int(hit.id[3:])
+            assert hit.score == pytest.approx(float(normalize_rows(vectors)[row] @ (query / np.linalg.norm(query))), abs=1e-5)
+
+def test_ivf_probing_every_list_is_exact(tmp_path, corpus, ivf_trains):
+    documents, vectors = corpus
+    index = IVFVectorIndex(str(tmp_path), nlist=8, quantization="none")
+    index.add_documents(documents)
+    assert index.train()
+    for query in np.random.default_rng(3).standard_normal((10, DIM)):
+        assert ids(index.search(query, 10, nprobe=8)) == [f"doc{row}" for row in brute_force(vectors, query, 10)]
+
+def test_ivf_probing_some_lists_keeps_most_of_the_exact_top_k(tmp_path, corpus, ivf_trains):
+    documents, vectors = corpus
+    index = IVFVectorIndex(str(tmp_path), nlist=8, nprobe=4, quantization="none")
+    index.add_documents(documents)
+    index.train()
+    recall = np.mean([
+        len(set(ids(index.search(vectors[row], 10))) & {f"doc{i}" for i in brute_force(vectors, vectors[row], 10)}) / 10
+        for row in range(0, 600, 30)
+    ])
+    assert recall >= 0.7
+
+def test_ivf_save_and_load(tmp_path, corpus, ivf_trains):
+    documents, vectors = corpus
+    index = IVFVectorIndex(str(tmp_path), nlist=8, nprobe=2, quantization="none")
+    index.add_documents(documents)
+    index.train()
+    index.save()
+
+    loaded = IVFVectorIndex(str(tmp_path), nlist=8, nprobe=2, quantization="none")
+    assert loaded.load()
+    assert not loaded.needs_training()
+    np.testing.assert_array_equal(loaded.assignments, index.assignments)
+    assert ids(loaded.search(vectors[5], 5)) == ids(index.search(vectors[5], 5))
+
+@pytest.mark.parametrize("kind", ["none", "int8", "pq", "ivf"])
+def test_search_many_matches_search(tmp_path, corpus, kind, ivf_trains):
+    documents, _ = corpus
+    if kind == "ivf":
+        index = IVFVectorIndex(str(tmp_path), nlist=8, nprobe=3, quantization="none")
+        index.add_documents(documents)
+        index.train()
+    else:
+        index = LocalVectorIndex(str(tmp_path), quantization=kind)
+        index.add_documents(documents)
+        index.quantize()
+    queries = np.random.default_rng(4).standard_normal((12, DIM))
+    batched = index.search_many(queries, 7)
+    assert [ids(results) for results in batched] == [ids(index.search(query, 7)) for query in queries]
+    filters = {"topic": "dasha"}
+    batched = index.search_many(queries[:3], 4, filters=filters)
+    assert [ids(results) for results in batched] == [ids(index.search(query, 4, filters=filters)) for query in queries[:3]]
+
+def test_filtered_search_only_scores_matching_rows(tmp_path, corpus):
+    documents, vectors = corpus
+    index = LocalVectorIndex(str(tmp_path), quantization="none")
+    index.add_documents(documents)
+    query = np.random.default_rng(5).standard_normal(DIM)
+
+    filters = {"filename": "book2.pdf", "topic": ["yoga", "dasha"]}
+    rows = [i for i in range(len(documents)) if i % 3 == 2]
+    assert ids(index.search(query, 5, filters=filters)) == [f"doc{row}" for row in brute_force(vectors, query, 5, rows)]
+    assert index.search(query, 5, filters={"filename": "missing.pdf"}) == []
+    with pytest.raises(ValueError):
+        index.search(query, 5, filters={"text": "chunk 1"})
+
+def test_filtered_ivf_search_only_returns_matching_rows(tmp_path, corpus, ivf_trains):
+    documents, vectors = corpus
+    index = IVFVectorIndex(str(tmp_path), nlist=8, quantization="none")
+    index.add_documents(documents)
+    index.train()
+    query = np.random.default_rng(6).standard_normal(DIM)
+    rows = [i for i in range(len(documents)) if i % 2 == 0 and i % 3 == 0]
+    results = index.search(query, 5, nprobe=8, filters={"topic": "yoga", "pdf_id": "0"})
+    assert ids(results) == [f"doc{row}" for row in brute_force(vectors, query, 5, rows)]
+
+def test_remove_save_and_load(tmp_path, corpus):
+    documents, vectors = corpus
+    index = LocalVectorIndex(str(tmp_path), quantization="int8")
+    index.add_documents(documents)
+    index.quantize()
+    assert index.remove_documents(["doc0", "doc1", "missing"]) == 2
+    index.save()
+
+    loaded = LocalVectorIndex(str(tmp_path), quantization="int8")
+    assert loaded.load()
+    assert len(loaded) == len(documents) - 2
+    query = vectors[5]
+    assert ids(loaded.search(query, 5)) == ids(index.search(query, 5))
+    assert "doc0" not in ids(loaded.search(vectors[0], 10))
+
+def test_ivf_removal_keeps_lists_consistent(tmp_path, corpus, ivf_trains):
+    documents, vectors = corpus
+    index = IVFVectorIndex(str(tmp_path), nlist=8, quantization="none")
+    index.add_documents(documents)
+    index.train()
+    index.remove_documents([f"doc{i}" for i in range(0, 600, 2)])
+    assert len(index) == len(index.assignments) == 300
+    remaining = [i for i in range(600) if i % 2]
+    query = vectors[3]
+    expected = [f"doc{remaining[row]}" for row in brute_force(vectors[remaining], query, 10)]
+    assert ids(index.search(query, 10, nprobe=8)) == expected
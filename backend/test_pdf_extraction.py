@@ -0,0 +1,149 @@
+# test_pdf_extraction.py
+"""
+Tests for streaming PDF text extraction (rag/pdf_extraction.py): pages come
+back in input order whatever the worker count or page-range size, the same workers
+serve a whole run, and a file that overruns its deadline is abandoned.
+Run with: python -m pytest -q test_pdf_extraction.py
+"""
+import mmap
+import time
+import multiprocessing
+import pytest
+from rag.pdf_extraction import iter_pdf_pages, count_pages, open_pdf, extract_page_text, PdfPageExtractor
+
+def write_pdf(path, page_texts):
+    """Write a minimal PDF with one line of Helvetica text per page"""
+    page_count = len(page_texts)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(page_count)), page_count
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(output)
+    return str(path)
+
+def page_texts(name, count):
+    return [f"{name} page {page}" for page in range(count)]
+
+@pytest.fixture
+def pdfs(tmp_path):
+    sizes = {"small": 1, "medium": 5, "large": 12}
+    return {name: write_pdf(tmp_path / f"{name}.pdf", page_texts(name, count)) for name, count in sizes.items()}
+
+def test_count_pages(pdfs):
+    assert count_pages(pdfs["large"]) == 12
+
+def test_files_are_memory_mapped_unless_empty(pdfs, tmp_path):
+    with open_pdf(pdfs["small"]) as file:
+        assert isinstance(file, mmap.mmap) and file[:5] == b"%PDF-"
+    empty = tmp_path / "empty.pdf"
+    empty.write_bytes(b"")
+    with open_pdf(str(empty)) as file:
+        assert file.read() == b""
+
+def extracted(pdf_paths, **kwargs):
+    return [(pdf_path, text.strip()) for pdf_path, text in iter_pdf_pages(pdf_paths, **kwargs)]
+
+def expected_pages(pdfs, names):
+    sizes = {"small": 1, "medium": 5, "large": 12}
+    return [(pdfs[name], text) for name in names for text in page_texts(name, sizes[name])]
+
+@pytest.mark.parametrize("workers, pages_per_task", [(1, 50), (2, 50), (3, 2), (4, 1)])
+def test_pages_come_back_in_input_order(pdfs, workers, pages_per_task):
+    names = ["large", "small", "medium", "large"]
+    pages = extracted([pdfs[name] for name in names], workers=workers, pages_per_task=pages_per_task)
+    assert pages == expected_pages(pdfs, names)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_unreadable_file_is_skipped_without_failing_the_batch(pdfs, tmp_path, workers):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    pages = extracted([pdfs["small"], str(broken), pdfs["medium"]], workers=workers, pages_per_task=2)
+    assert pages == expected_pages(pdfs, ["small", "medium"])
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extraction_resumes_from_a_start_page(pdfs, workers):
+    pages = extracted([pdfs["large"]], workers=workers, pages_per_task=5, start_page=7)
+    assert pages == [(pdfs["large"], text) for text in page_texts("large", 12)[7:]]
+
+def test_consumer_can_stop_early(pdfs):
+    pages = iter_pdf_pages([pdfs["large"]] * 4, workers=2, pages_per_task=1)
+    assert [next(pages)[1].strip() for _ in range(3)] == page_texts("large", 3)
+    pages.close()
+
+@pytest.fixture
+def started_workers(monkeypatch):
+    """Worker processes started during the test"""
+    started = []
+
+    class CountedProcess(multiprocessing.Process):
+        def start(self):
+            started.append(self)
+            super().start()
+
+    monkeypatch.setattr("multiprocessing.Process", CountedProcess)
+    return started
+
+def test_the_same_workers_serve_every_call(pdfs, started_workers):
+
+    names = ["medium", "large", "small"]
+    with PdfPageExtractor(workers=2, pages_per_task=3) as extractor:
+        pages = [
+            (pdf_path, text.strip())
+            for name in names for pdf_path, text in extractor.iter_pages([pdfs[name]])
+        ]
+    assert pages == expected_pages(pdfs, names)
+    assert len(started_workers) == 2
+    assert not any(worker.is_alive() for worker in started_workers)
+
+@pytest.fixture
+def slow_pages(monkeypatch):
+    """Pages of files named slow*.pdf take 0.5s each to extract"""
+    def slow_extract(page):
+        text = extract_page_text(page)
+        if text.startswith("slow"):
+            time.sleep(0.5)
+        return text
+    # Worker processes are forked after this, so they see the patch too
+    monkeypatch.setattr("rag.pdf_extraction.extract_page_text", slow_extract)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_file_over_its_deadline_is_abandoned(pdfs, tmp_path, slow_pages, workers):
+    slow = write_pdf(tmp_path / "slow.pdf", page_texts("slow", 8))
+    started = time.monotonic()
+    pages = extracted([slow, pdfs["small"]], workers=workers, pages_per_task=1, timeout=1.25)
+
+    # Every page stays within the deadline on its own, but not the whole file
+    assert pages[:2] == [(slow, "slow page 0"), (slow, "slow page 1")]
+    assert len(pages) < 9 and pages[-1] == (pdfs["small"], "small page 0")
+    assert [text for _, text in pages[:-1]] == page_texts("slow", len(pages) - 1)
+    assert time.monotonic() - started < 3
+
+def test_stuck_worker_is_replaced(pdfs, tmp_path, slow_pages, started_workers):
+    slow = write_pdf(tmp_path / "slow.pdf", page_texts("slow", 4))
+    started = time.monotonic()
+    with PdfPageExtractor(workers=2, pages_per_task=4, timeout=0.25) as extractor:
+        assert list(extractor.iter_pages([slow])) == []
+        # The stuck worker was killed, the next file gets a new one
+        assert [text.strip() for _, text in extractor.iter_pages([pdfs["medium"]])] == page_texts("medium", 5)
+    assert time.monotonic() - started < 1.5
+    assert not started_workers[0].is_alive() and started_workers[0].exitcode < 0
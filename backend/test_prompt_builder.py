@@ -0,0 +1,91 @@
+# test_prompt_builder.py
+"""
+Tests for token-budgeted prompt assembly (rag/prompt_builder.py): what is
+kept in which order as the budget shrinks, and de-duplication of repeated
+and overlapping chunks. Tokens are counted as words so the tests don't
+depend on tiktoken.
+Run with: python -m pytest -q test_prompt_builder.py
+"""
+import pytest
+from rag.prompt_builder import build_messages, dedupe_chunks, MESSAGE_OVERHEAD_TOKENS, CONTEXT_PREFIX
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr("rag.prompt_builder.count_tokens", lambda text, model=None: len((text or "").split()))
+
+def words(count, word="word"):
+    return " ".join(f"{word}{i}" for i in range(count))
+
+def cost(text):
+    return len(text.split()) + MESSAGE_OVERHEAD_TOKENS
+
+SYSTEM = words(10, "rule")
+QUESTION = words(6, "ask")
+BIRTH = {"date": "1990-04-12", "time": "06:30", "place": "Pune"}
+CHUNKS = [words(40, "first"), words(40, "second"), words(40, "third")]
+HISTORY = [
+    {"role": "user", "content": words(20, "old")},
+    {"role": "assistant", "content": words(20, "older")},
+    {"role": "user", "content": words(20, "new")},
+]
+
+def roles_and_heads(messages):
+    return [(message["role"], message["content"].split()[0]) for message in messages]
+
+def test_everything_fits_in_a_large_budget():
+    messages, report = build_messages(SYSTEM, QUESTION, BIRTH, CHUNKS, HISTORY, budget=10000)
+    assert roles_and_heads(messages) == [
+        ("system", "rule0"), ("system", "The"), ("system", "Use"),
+        ("user", "old0"), ("assistant", "older0"), ("user", "new0"), ("user", "ask0"),
+    ]
+    assert report["context_chunks_used"] == 3 and report["history_used"] == 3
+    assert report["total"] == sum(cost(message["content"]) for message in messages) <= 10000
+
+def test_context_is_kept_in_rank_order_before_history():
+    required = cost(SYSTEM) + cost(QUESTION)
+    # Room for the context prefix, two chunks and nothing else
+    budget = required + cost(CONTEXT_PREFIX) + 2 * 41 + 10
+    messages, report = build_messages(SYSTEM, QUESTION, None, CHUNKS, HISTORY, budget=budget)
+
+    context = messages[1]["content"]
+    assert "first0" in context and "second0" in context and "third0" not in context
+    assert (report["context_chunks_used"], report["context_chunks_dropped"]) == (2, 1)
+    assert report["history_used"] == 0 and report["history_dropped"] == 3
+    assert report["total"] <= budget
+
+def test_newest_history_is_kept_first():
+    required = cost(SYSTEM) + cost(QUESTION)
+    messages, report = build_messages(SYSTEM, QUESTION, None, None, HISTORY, budget=required + 2 * cost(HISTORY[0]["content"]))
+    assert roles_and_heads(messages) == [("system", "rule0"), ("assistant", "older0"), ("user", "new0"), ("user", "ask0")]
+    assert (report["history_used"], report["history_dropped"]) == (2, 1)
+
+def test_birth_details_come_before_context():
+    required = cost(SYSTEM) + cost(QUESTION)
+    birth_tokens = build_messages(SYSTEM, QUESTION, BIRTH, budget=10000)[1]["birth_details"]
+    messages, report = build_messages(SYSTEM, QUESTION, BIRTH, CHUNKS, budget=required + birth_tokens + 5)
+    assert roles_and_heads(messages) == [("system", "rule0"), ("system", "The"), ("user", "ask0")]
+    assert report["context_chunks_used"] == 0
+
+def test_system_prompt_and_question_are_always_sent():
+    messages, report = build_messages(SYSTEM, QUESTION, BIRTH, CHUNKS, HISTORY, budget=5)
+    assert roles_and_heads(messages) == [("system", "rule0"), ("user", "ask0")]
+    assert report["total"] == cost(SYSTEM) + cost(QUESTION)
+
+def test_fallback_messages_when_context_and_birth_details_are_missing():
+    messages, _ = build_messages(SYSTEM, QUESTION, None, [], budget=10000,
+                                 empty_context="no relevant passages", missing_birth_details="ask for birth details")
+    assert [message["content"] for message in messages[1:3]] == ["ask for birth details", CONTEXT_PREFIX + "no relevant passages"]
+
+def test_duplicate_and_contained_chunks_are_dropped():
+    chunk = "Saturn rules Capricorn and Aquarius."
+    unique, dropped = dedupe_chunks([chunk, "Saturn rules  Capricorn\nand Aquarius.", "Capricorn and Aquarius", ""])
+    assert unique == [chunk] and dropped == 3
+
+def test_overlap_between_chunks_is_sent_once():
+    first = "The Moon in the fourth house gives emotional attachment to the home."
+    second = "attachment to the home. It also favours property and vehicles."
+    unique, dropped = dedupe_chunks([first, second])
+    assert unique == [first, "It also favours property and vehicles."] and dropped == 0
+
+    _, report = build_messages(SYSTEM, QUESTION, None, [first, second, first], budget=10000)
+    assert report["duplicate_chunks"] == 1 and report["context_chunks_used"] == 2
@@ -0,0 +1,74 @@
+# test_quantization.py
+"""
+Tests for the vector quantizers (rag/quantization.py): approximate scores
+against float inner products, row selection, batched scoring and state.
+Run with: python -m pytest -q test_quantization.py
+"""
+import numpy as np
+import pytest
+from rag.local_index import normalize_rows
+from rag.quantization import ScalarQuantizer, ProductQuantizer, get_quantizer
+
+@pytest.fixture
+def vectors():
+    return normalize_rows(np.random.default_rng(0).standard_normal((1000, 64)).astype(np.float32))
+
+@pytest.fixture
+def queries():
+    return normalize_rows(np.random.default_rng(1).standard_normal((8, 64)).astype(np.float32))
+
+def trained(name, vectors):
+    quantizer = ScalarQuantizer() if name == "int8" else ProductQuantizer(subvectors=16)
+    assert quantizer.train(vectors)
+    return quantizer
+
+def test_int8_codes_and_scores(vectors, queries):
+    quantizer = trained("int8", vectors)
+    codes = quantizer.encode(vectors)
+    assert codes["codes"].dtype == np.int8 and codes["codes"].shape == vectors.shape
+    assert codes["scales"].shape == (len(vectors),)
+    for query in queries:
+        assert np.abs(quantizer.scores(codes, query) - vectors @ query).max() < 0.01
+
+@pytest.mark.parametrize("name", ["int8", "pq"])
+def test_scores_rank_like_exact_inner_products(vectors, queries, name):
+    quantizer = trained(name, vectors)
+    codes = quantizer.encode(vectors)
+    for query in queries:
+        approximate = np.argsort(-quantizer.scores(codes, query))[:50]
+        exact = np.argsort(-(vectors @ query))[:10]
+        # The exact top 10 is within the rescored candidates (RESCORE_FACTOR)
+        assert len(set(exact) & set(approximate)) >= 9
+
+@pytest.mark.parametrize("name", ["int8", "pq"])
+def test_rows_and_scores_many_agree_with_scores(vectors, queries, name):
+    quantizer = trained(name, vectors)
+    codes = quantizer.encode(vectors)
+    rows = np.arange(3, len(vectors), 7)
+    many = quantizer.scores_many(codes, queries, rows=rows, batch_size=64)
+    assert many.shape == (len(queries), len(rows))
+    for i, query in enumerate(queries):
+        single = quantizer.scores(codes, query)
+        np.testing.assert_allclose(quantizer.scores(codes, query, rows=rows), single[rows], rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(many[i], single[rows], rtol=1e-4, atol=1e-5)
+
+def test_pq_needs_enough_vectors_and_divisible_size(vectors):
+    assert not ProductQuantizer(subvectors=16).train(vectors[:100])
+    with pytest.raises(ValueError):
+        ProductQuantizer(subvectors=10).train(vectors)
+
+def test_pq_state_round_trip(vectors, queries):
+    quantizer = trained("pq", vectors)
+    codes = quantizer.encode(vectors)
+    restored = ProductQuantizer()
+    assert restored.load_state(quantizer.state())
+    assert restored.subvectors == 16
+    np.testing.assert_array_equal(restored.encode(vectors)["codes"], codes["codes"])
+    np.testing.assert_allclose(restored.scores(codes, queries[0]), quantizer.scores(codes, queries[0]))
+
+def test_get_quantizer():
+    assert get_quantizer("none") is None and get_quantizer("") is None
+    assert isinstance(get_quantizer("int8"), ScalarQuantizer)
+    assert isinstance(get_quantizer("pq"), ProductQuantizer)
+    with pytest.raises(ValueError):
+        get_quantizer("fp8")
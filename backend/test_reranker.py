@@ -0,0 +1,87 @@
+# test_reranker.py
+"""
+Tests for the budgeted cross-encoder rerank stage (rag/reranker.py), with a
+stand-in model: reordering, skipping when the budget can't fit the expected
+scoring time, and falling back to retrieval order on timeouts and errors.
+Run with: python -m pytest -q test_reranker.py
+"""
+import time
+from rag.reranker import Reranker
+
+class FakeCrossEncoder:
+    """Scores a pair by how often the query's words appear in the chunk"""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def predict(self, pairs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [sum(text.split().count(word) for word in query.split()) for query, text in pairs]
+
+DOCUMENTS = [
+    {"_id": "a", "text": "saturn transit", "score": 0.9},
+    {"_id": "b", "text": "moon moon moon", "score": 0.8},
+    {"_id": "c", "text": "moon in the fourth house", "score": 0.7},
+    {"_id": "d", "text": "jupiter aspects", "score": 0.6},
+]
+
+def reranker_with(model, budget_ms=1000):
+    reranker = Reranker(model_name="fake", budget_ms=budget_ms, workers=1)
+    reranker._model = model
+    return reranker
+
+def ids(results):
+    return [result["_id"] for result in results]
+
+def test_rerank_orders_by_cross_encoder_score():
+    reranker = reranker_with(FakeCrossEncoder())
+    results = reranker.rerank("moon", DOCUMENTS, top_k=2)
+    assert ids(results) == ["b", "c"]
+    assert results[0]["rerank_score"] == 3.0
+    assert results[0]["score"] == 0.8
+    assert "rerank_score" not in DOCUMENTS[1]
+    assert reranker.stats()["reranked"] == 1
+
+def test_single_document_is_returned_without_scoring():
+    model = FakeCrossEncoder()
+    reranker = reranker_with(model)
+    assert reranker.rerank("moon", DOCUMENTS[:1]) == DOCUMENTS[:1]
+    assert model.calls == 0
+
+def test_skipped_when_expected_time_exceeds_the_remaining_budget():
+    model = FakeCrossEncoder()
+    reranker = reranker_with(model, budget_ms=100)
+    # Learned from earlier calls: 50ms per candidate, so 4 candidates need ~200ms
+    reranker._ms_per_candidate = 50.0
+    assert ids(reranker.rerank("moon", DOCUMENTS, top_k=3)) == ["a", "b", "c"]
+    assert model.calls == 0
+
+    # Retrieval already used up the budget
+    reranker._ms_per_candidate = 0.0
+    started = time.perf_counter() - 0.2
+    assert ids(reranker.rerank("moon", DOCUMENTS, top_k=3, started=started)) == ["a", "b", "c"]
+    assert model.calls == 0
+    stats = reranker.stats()
+    assert (stats["skipped_budget"], stats["calls"], stats["skip_rate"]) == (2, 2, 1.0)
+
+def test_overrun_falls_back_to_retrieval_order():
+    reranker = reranker_with(FakeCrossEncoder(delay=0.5), budget_ms=50)
+    started = time.perf_counter()
+    assert ids(reranker.rerank("moon", DOCUMENTS, top_k=2)) == ["a", "b"]
+    assert time.perf_counter() - started < 0.4
+    assert reranker.stats()["timed_out"] == 1
+
+def test_model_errors_fall_back_to_retrieval_order():
+    reranker = reranker_with(FakeCrossEncoder(error=RuntimeError("model failed")))
+    assert ids(reranker.rerank("moon", DOCUMENTS, top_k=2)) == ["a", "b"]
+    assert reranker.stats()["errors"] == 1
+
+def test_scoring_time_is_learned_per_candidate():
+    reranker = reranker_with(FakeCrossEncoder(delay=0.04))
+    reranker.rerank("moon", DOCUMENTS)
+    assert reranker.stats()["ms_per_candidate"] >= 10
@@ -0,0 +1,133 @@
+# test_retrieval_cache.py
+"""
+Tests for the retrieval cache and index versions (rag/retrieval_cache.py),
+and for the in-process indexes following index versions bumped by another
+process (rag/local_index.py, rag/bm25_index.py). MongoDB runs on mongomock.
+Run with: python -m pytest -q test_retrieval_cache.py
+"""
+import numpy as np
+import pytest
+from rag.retrieval_cache import RetrievalCache, IndexVersions, retrieval_key, index_versions, INDEX_VERSION_COLLECTION
+from rag.search_hits import SearchHit
+
+def hits(*ids):
+    return [SearchHit(id, f"text {id}", 1.0 / (i + 1)) for i, id in enumerate(ids)]
+
+def test_keys_normalize_queries_and_separate_settings():
+    assert retrieval_key("db", "c", "What is a Yoga? ", 5) == retrieval_key("db", "c", "what is a  yoga", 5)
+    assert retrieval_key("db", "c", "yoga", 5) != retrieval_key("db", "c", "yoga", 10)
+    assert retrieval_key("db", "c", "yoga", 5) != retrieval_key("db", "c", "yoga", 5, {"topic": ["yoga"]})
+    assert retrieval_key("db", "c", "yoga", 5, nprobe=4) != retrieval_key("db", "c", "yoga", 5, nprobe=8)
+
+def test_hits_misses_and_stale_versions():
+    cache = RetrievalCache(max_size=4)
+    assert cache.get("q", 1) is None
+    cache.put("q", 1, hits("a", "b"))
+    assert [hit.id for hit in cache.get("q", 1)] == ["a", "b"]
+    # An entry from an older index version is dropped
+    assert cache.get("q", 2) is None
+    assert cache.get("q", 1) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stale"]) == (1, 3, 1)
+
+def test_cached_results_are_copies():
+    cache = RetrievalCache(max_size=4)
+    results = hits("a")
+    cache.put("q", 1, results)
+    results[0].score = 0.0
+    cached = cache.get("q", 1)
+    cached[0].set_score("rerank", 3.0)
+    again = cache.get("q", 1)[0]
+    assert again.score == 1.0 and again.scores is None
+
+def test_least_recently_used_entries_are_evicted():
+    cache = RetrievalCache(max_size=2)
+    cache.put("a", 1, hits("a"))
+    cache.put("b", 1, hits("b"))
+    cache.get("a", 1)
+    cache.put("c", 1, hits("c"))
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) is not None and cache.get("c", 1) is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_disabled_cache_stores_nothing():
+    cache = RetrievalCache(max_size=0)
+    cache.put("q", 1, hits("a"))
+    assert cache.get("q", 1) is None
+
+def bump_elsewhere(db, collection_name):
+    """Bump an index version the way another process would"""
+    db[INDEX_VERSION_COLLECTION].update_one({"_id": collection_name}, {"$inc": {"version": 1}}, upsert=True)
+
+def test_versions_are_shared_through_mongo(db):
+    versions = IndexVersions(ttl=0)
+    assert versions.get(db, "vectors") == 0
+    assert versions.bump(db, "vectors") == 1
+    bump_elsewhere(db, "vectors")
+    assert versions.get(db, "vectors") == 2
+
+def test_versions_are_cached_for_the_ttl(db):
+    versions = IndexVersions(ttl=60)
+    assert versions.get(db, "vectors") == 0
+    bump_elsewhere(db, "vectors")
+    assert versions.get(db, "vectors") == 0
+    assert IndexVersions(ttl=60).get(db, "vectors") == 1
+
+def test_only_bumps_by_other_processes_count_as_changes_elsewhere(db):
+    versions = IndexVersions(ttl=0)
+    assert not versions.changed_elsewhere(db, "vectors", 0, 0)
+    versions.bump(db, "vectors")
+    assert not versions.changed_elsewhere(db, "vectors", 0, 1)
+    bump_elsewhere(db, "vectors")
+    versions.bump(db, "vectors")
+    assert versions.changed_elsewhere(db, "vectors", 1, 3)
+    assert not versions.changed_elsewhere(db, "vectors", 2, 3)
+    assert versions.changed_elsewhere(db, "vectors", None, 3)
+
+@pytest.fixture
+def collection(db, monkeypatch, request):
+    monkeypatch.setattr(index_versions, "ttl", 0)
+    collection = db[f"vectors_{request.node.name}"]
+    collection.insert_many(chunk_documents(0, 10))
+    return collection
+
+def chunk_documents(start, stop):
+    rng = np.random.default_rng(start)
+    return [
+        {"_id": f"doc{i}", "text": f"term{i} chart", "filename": "book1.pdf", "chunk_index": i,
+         "embedding": rng.standard_normal(8).tolist()}
+        for i in range(start, stop)
+    ]
+
+def test_indexes_follow_changes_made_in_this_process(collection):
+    from rag.local_index import get_local_index, add_to_local_indexes
+    from rag.bm25_index import get_bm25_index
+
+    index, bm25_index = get_local_index(collection), get_bm25_index(collection)
+    assert len(index) == len(bm25_index) == 10
+
+    documents = chunk_documents(10, 15)
+    collection.insert_many(documents)
+    add_to_local_indexes(collection, documents)
+    index_versions.bump(collection.database, collection.name)
+
+    # Already up to date in memory, so nothing is reloaded
+    assert get_local_index(collection) is index and len(index) == 15
+    assert get_bm25_index(collection) is bm25_index and len(bm25_index) == 15
+
+def test_indexes_reload_after_changes_by_another_process(collection):
+    from rag.local_index import get_local_index
+    from rag.bm25_index import get_bm25_index
+
+    index, bm25_index = get_local_index(collection), get_bm25_index(collection)
+    collection.insert_many(chunk_documents(10, 15))
+    collection.delete_one({"_id": "doc0"})
+    bump_elsewhere(collection.database, collection.name)
+
+    reloaded = get_local_index(collection)
+    assert reloaded is not index and len(reloaded) == 14
+    assert "doc12" in [hit.id for hit in reloaded.search(chunk_documents(10, 15)[2]["embedding"], 1)]
+    rebuilt = get_bm25_index(collection)
+    assert rebuilt is not bm25_index and [hit.id for hit in rebuilt.search("term12", 1)] == ["doc12"]
+    assert rebuilt.search("term0", 1) == []
+    assert get_local_index(collection) is reloaded and get_bm25_index(collection) is rebuilt
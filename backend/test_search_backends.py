@@ -0,0 +1,29 @@
+# test_search_backends.py
+"""
+Tests for the vector search backends (rag/search_backends.py) against
+mongomock: the Atlas backend's add/delete keep the collection its search
+index is built from in step with what they are told.
+Run with: python -m pytest -q test_search_backends.py
+"""
+from rag.search_backends import AtlasBackend
+
+def chunk(i):
+    return {"_id": f"chunk{i}", "text": f"chunk {i}", "embedding": [float(i), 1.0]}
+
+def test_atlas_add_stores_documents_not_yet_written(db):
+    collection = db["vectors"]
+    collection.insert_many([chunk(0), chunk(1)])
+    backend = AtlasBackend(collection)
+    assert backend.add([chunk(0), chunk(1), chunk(2)]) == 3
+    assert sorted(doc["_id"] for doc in collection.find()) == ["chunk0", "chunk1", "chunk2"]
+    assert backend.count() == 3
+
+def test_atlas_delete_removes_documents_from_the_collection(db):
+    collection = db["vectors"]
+    collection.insert_many([chunk(i) for i in range(3)])
+    backend = AtlasBackend(collection)
+    assert backend.delete(["chunk0", "chunk2"]) == 2
+    assert [doc["_id"] for doc in collection.find()] == ["chunk1"]
+    # Already deleted by the caller
+    collection.delete_many({"_id": "chunk1"})
+    assert backend.delete(["chunk1"]) == 1 and backend.delete([]) == 0
@@ -5,6 +5,7 @@ Handles specialized advice for career, relationships, and finances.
 import os
 import logging
 from dotenv import load_dotenv
+from rag.prompt_builder import build_messages
 
 # Configure logging
 logging.basicConfig(
@@ -116,32 +117,16 @@ def generate_topic_response(openai_client, user_message, topic, conversation_his
             logger.warning(f"No specific prompt for topic: {topic}")
             return f"I'd be happy to provide insights about your {topic}. To give you the most accurate guidance, I'll need to analyze your birth chart."
         
-        # Build messages array for OpenAI
-        messages = [{"role": "system", "content": topic_prompt}]
-        
-        # Add birth details if available
-        if birth_details:
-            birth_context = f"""
-            The user has provided these birth details:
-            Date: {birth_details.get('date', 'Not provided')}
-            Time: {birth_details.get('time', 'Not provided')}
-            Place: {birth_details.get('place', 'Not provided')}
-            
-            Use these details in your analysis when relevant.
-            """
-            messages.append({"role": "system", "content": birth_context})
-        else:
-            messages.append({"role": "system", "content": "The user has not provided complete birth details. Acknowledge this limitation in your response and suggest that they provide their birth date, time, and place for a more accurate reading."})
-        
-        # Add conversation history
-        if conversation_history:
-            for msg in conversation_history[-5:]:  # Last 5 messages
-                messages.append({"role": msg["role"], "content": msg["content"]})
-        
-        # Add the user message
-        messages.append({"role": "user", "content": user_message})
+        # Build messages array for OpenAI within the input token budget
+        messages, token_report = build_messages(
+            topic_prompt,
+            user_message,
+            birth_details=birth_details,
+            conversation_history=conversation_history,
+            missing_birth_details="The user has not provided complete birth details. Acknowledge this limitation in your response and suggest that they provide their birth date, time, and place for a more accurate reading."
+        )
         
-        logger.info(f"Sending topic-specific request to OpenAI with {len(messages)} messages")
+        logger.info(f"Sending topic-specific request to OpenAI with {len(messages)} messages ({token_report['total']} tokens)")
         
         # Get response from OpenAI with max_tokens set to 600
         response = openai_client.chat.completions.create(
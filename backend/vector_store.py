@@ -0,0 +1,26 @@
+# vector_store.py
+"""
+Vector store entry point used by main.py and routes/chat_routes.py.
+The implementation lives in rag/vector_store.py.
+"""
+from rag.vector_store import (
+    connect_to_mongodb,
+    create_vector_store,
+    get_vector_store,
+    search_similar_pdfs,
+    search_many,
+    count_documents,
+    get_document_samples,
+    get_embedding_cache_stats,
+    search_reranked,
+    get_reranker_stats,
+    get_retrieval_cache_stats,
+    answer_cache,
+    get_answer_cache_stats,
+    init_search_backend,
+    get_search_backend_stats,
+)
+from rag.embedding_models import warmup_embedding_model, get_embedding_model_stats
+from rag.reranker import get_reranker, RERANK_ENABLED
+from rag.answer_cache import is_cacheable_query, ANSWER_CACHE_ENABLED
+from rag.search_filters import normalize_filters